@@ -2,6 +2,11 @@ import { useEffect, useState, useRef, useCallback } from "react";
 import "@/styles/chatbot.css";
 import axios from "axios";
 
+const API_BASE_URL = "http://localhost:8085";
+const WS_BASE_URL = API_BASE_URL.replace(/^http/, "ws");
+// Supabase access token of the signed-in user, chats are anonymous without one
+const ACCESS_TOKEN_KEY = "access_token";
+
 interface Message {
   id: number;
   text: string;
@@ -26,6 +31,9 @@ export default function Chatbot({ initialMessage, open }: ChatbotProps) {
   const [isLoading, setIsLoading] = useState(false);
   const initialMessageSentRef = useRef(false);
   const welcomeMessageRef = useRef<Message | null>(null);
+  const socketRef = useRef<WebSocket | null>(null);
+  const audioChunksRef = useRef<ArrayBuffer[]>([]);
+  const lastBotMessageIdRef = useRef<number | null>(null);
 
   // Generate or retrieve a session ID when the component mounts
   useEffect(() => {
@@ -82,21 +90,125 @@ export default function Chatbot({ initialMessage, open }: ChatbotProps) {
     }
   }, [open, openChatbox]);
 
+  // Keep one chat socket open for the session while the chatbox is visible
+  useEffect(() => {
+    if (!showChatbox || !sessionId) {
+      return;
+    }
+
+    const accessToken = localStorage.getItem(ACCESS_TOKEN_KEY);
+    const socket = new WebSocket(
+      `${WS_BASE_URL}/ws/chat?session_id=${encodeURIComponent(sessionId)}` +
+        (accessToken ? `&token=${encodeURIComponent(accessToken)}` : "")
+    );
+    socket.binaryType = "arraybuffer";
+
+    socket.onmessage = (event) => {
+      // Binary frames carry the audio of the last bot message
+      if (event.data instanceof ArrayBuffer) {
+        audioChunksRef.current.push(event.data);
+        return;
+      }
+
+      const frame = JSON.parse(event.data);
+      switch (frame.type) {
+        case "ping":
+          socket.send(JSON.stringify({ type: "pong" }));
+          break;
+        case "text": {
+          const botMessage: Message = {
+            id: Date.now() + 1,
+            text:
+              frame.status === "ok"
+                ? frame.text
+                : "Sorry, I couldn't understand your message. Can you try again?",
+            time: new Date().toLocaleTimeString([], {
+              hour: "2-digit",
+              minute: "2-digit",
+            }),
+            date: new Date().toLocaleDateString(),
+            sender: "bot",
+          };
+          lastBotMessageIdRef.current = botMessage.id;
+          setMessages((prevMessages) => [...prevMessages, botMessage]);
+          setIsLoading(false);
+          break;
+        }
+        case "audio_start":
+          audioChunksRef.current = [];
+          break;
+        case "audio_end": {
+          const messageId = lastBotMessageIdRef.current;
+          if (frame.status === "ok" && messageId !== null) {
+            const audioBlob = new Blob(audioChunksRef.current, {
+              type: "audio/mpeg",
+            });
+            const audioUrl = URL.createObjectURL(audioBlob);
+            setMessages((prevMessages) =>
+              prevMessages.map((m) =>
+                m.id === messageId ? { ...m, audioUrl: audioUrl } : m
+              )
+            );
+          } else if (frame.status === "pending" && frame.audio_url && messageId !== null) {
+            // Speech missed its latency budget, the API serves it once it is ready
+            const audioUrl = `${API_BASE_URL}${frame.audio_url}`;
+            setMessages((prevMessages) =>
+              prevMessages.map((m) =>
+                m.id === messageId ? { ...m, audioUrl: audioUrl } : m
+              )
+            );
+          }
+          audioChunksRef.current = [];
+          break;
+        }
+        case "error":
+          console.error("Chat socket error: ", frame.error);
+          setIsLoading(false);
+          break;
+      }
+    };
+
+    socket.onclose = () => {
+      // Fall back to HTTP until the socket is reopened
+      if (socketRef.current === socket) {
+        socketRef.current = null;
+      }
+    };
+
+    socketRef.current = socket;
+    return () => {
+      socket.close();
+    };
+  }, [showChatbox, sessionId]);
+
   // Send message to bot and get response
   const botResponse = useCallback(
     async (message: string) => {
+      // Prefer the open chat socket, its listener adds the bot response
+      const socket = socketRef.current;
+      if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(
+          JSON.stringify({ type: "message", id: Date.now(), message: message })
+        );
+        return;
+      }
+
       try {
+        const accessToken = localStorage.getItem(ACCESS_TOKEN_KEY);
         // Update the axios request with proper CORS configuration
         const response = await axios.post(
-          "http://localhost:8085/chat",
+          `${API_BASE_URL}/chat`,
           {
             message: message,
             session_id: sessionId,
+            // Get the text right away and stream the audio while it is synthesized
+            audio: "stream",
           },
           {
             headers: {
               "Content-Type": "application/json",
               Accept: "application/json",
+              ...(accessToken ? { Authorization: `Bearer ${accessToken}` } : {}),
             },
             withCredentials: false, // Set to false for development
           }
@@ -111,13 +223,9 @@ export default function Chatbot({ initialMessage, open }: ChatbotProps) {
         }
 
         if (response.data.status === "ok") {
-          if (response.data.audio_base64) {
-            // Handle audio data
-            const audioBlob = base64ToBlob(
-              response.data.audio_base64,
-              "audio/mpeg"
-            );
-            const audioUrl = URL.createObjectURL(audioBlob);
+          if (response.data.audio_url) {
+            // The audio is served by the API, let the browser fetch (and stream) it
+            const audioUrl = `${API_BASE_URL}${response.data.audio_url}`;
 
             botMessage = {
               id: Date.now() + 1,
@@ -180,22 +288,6 @@ export default function Chatbot({ initialMessage, open }: ChatbotProps) {
     [sessionId]
   );
 
-  const base64ToBlob = (base64Data: string, contentType: string): Blob => {
-    const byteCharacters = atob(base64Data);
-    const byteArrays: Uint8Array[] = [];
-
-    for (let offset = 0; offset < byteCharacters.length; offset += 512) {
-      const slice = byteCharacters.slice(offset, offset + 512);
-      const byteNumbers = new Array(slice.length);
-      for (let i = 0; i < slice.length; i++) {
-        byteNumbers[i] = slice.charCodeAt(i);
-      }
-      const byteArray = new Uint8Array(byteNumbers);
-      byteArrays.push(byteArray);
-    }
-    return new Blob(byteArrays, { type: contentType });
-  };
-
   // Handle initial message if provided (e.g., from Book Appointment button)
   useEffect(() => {
     if (initialMessage && showChatbox && !initialMessageSentRef.current) {
@@ -1,3 +1,4 @@
+import hmac
 import os
 from dotenv import load_dotenv
 
@@ -5,18 +6,37 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import uvicorn
-from fastapi import FastAPI, Depends, Request, HTTPException
+from fastapi import FastAPI, Depends, Header, Request, HTTPException
 from contextlib import asynccontextmanager
-import sys
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from database.postgres import init_postgres, close_postgres, get_postgres_connection
 from database.redis import init_redis, close_redis, get_redis_client
-from utils.aws_utils import get_secret, validate_aws_credentials
-from utils.lex_utils import init_lex_client
+from utils.aws_utils import get_secrets, validate_aws_credentials, start_secret_refresher, stop_secret_refresher
+from utils.lex_utils import init_async_lex_client, close_async_lex_client
+from utils import metrics
+from utils.concurrency import DependencyOverloaded
+from utils.speech_service import speech_services, get_speech_service
+from utils.startup import StartupStep, run_startup
+
+# Importing these modules does no I/O, their clients are created in lifespan
+from auth.auth import init_auth, validate_token, router as auth_router
+from auth.auth_client import close_auth_client
+from models.Models import User
+from chat.chat_handler import router as chat_router
+from chat.ws_handler import router as chat_ws_router
+from chat.chat_handler import run_in_background
+from chat.fast_path import init_fast_path, warm_faq_audio
+from chat.transcripts import init_transcripts, close_transcripts
+from chat.chat_events import init_chat_events, close_chat_events
+from appointments.appointments_handler import router as appointments_router
+from appointments.lex_hook import router as lex_hook_router
+from appointments.store import init_appointments, close_appointments
 
 from datetime import datetime
+from typing import Optional
 import logging
 
 # Configure logging
@@ -26,55 +46,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Validate AWS credentials first
-aws_valid, aws_message = validate_aws_credentials()
-logger.info(f"AWS Credentials check: {aws_message}")
-
 # Verify environment variable is set
 supabase_secret_name = os.getenv("supabase_secret_name")
 if not supabase_secret_name:
     logger.error("Missing environment variable: supabase_secret_name")
     raise RuntimeError("Missing environment variable: supabase_secret_name")
 
-# Only try to get secrets if AWS credentials are valid
-if aws_valid:
-    try:
-        # Get and validate Supabase credentials
-        jwt_secret = get_secret(supabase_secret_name)
-        SUPABASE_JWT_SECRET = jwt_secret["JWT_SECRET"]
-        
-        # Import auth module only after confirming secrets are accessible
-        try:
-            from auth.auth import validate_token, router as auth_router
-            from models.Models import User
-            from chat.chat_handler import router as chat_router
-            logger.info("Successfully imported auth and chat modules")
-        except (ImportError, ValueError, RuntimeError) as module_error:
-            logger.critical(f"Failed to initialize modules: {str(module_error)}")
-            sys.exit(f"Application startup failed: {str(module_error)}")
-            
-    except Exception as e:
-        logger.critical(f"Failed to get secrets: {str(e)}")
-        sys.exit(f"Could not access required secrets: {str(e)}")
-else:
-    logger.critical("AWS credentials are invalid - cannot proceed")
-    sys.exit("AWS credentials are invalid - application cannot start")
+
+# Bearer token for GET /metrics (internal numbers: pool sizes, shed counts, user activity);
+# the endpoint is disabled while unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+def check_aws_credentials():
+    """Validate AWS credentials, failing startup if Secrets Manager is unreachable"""
+    aws_valid, aws_message = validate_aws_credentials()
+    logger.info(f"AWS Credentials check: {aws_message}")
+    if not aws_valid:
+        raise RuntimeError(aws_message)
+
+
+def prefetch_secrets():
+    """Fetch every secret used at startup in one batch call"""
+    get_secrets([supabase_secret_name, "postgres", "redis", "lex"])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
     try:
-        logger.info("Initializing database connections")
-        await init_postgres()
-        await init_redis()
-        
-        # Initialize Lex client
-        logger.info("Initializing Amazon Lex client")
-        if init_lex_client():
-            logger.info("Amazon Lex client initialized successfully")
-        else:
-            logger.warning("Failed to initialize Amazon Lex client")
+        # Phase 1 warms the secret cache so phase 2 initializes every client concurrently
+        # from cached credentials. Each step has its own timeout (see utils.startup).
+        app.state.startup_report = await run_startup(
+            [
+                StartupStep("aws", check_aws_credentials),
+                StartupStep("secrets", prefetch_secrets, critical=False),
+                StartupStep("faq", init_fast_path, critical=False),
+            ],
+            [
+                StartupStep("supabase", init_auth),
+                StartupStep("postgres", init_postgres),
+                StartupStep("redis", init_redis),
+                StartupStep("lex", init_async_lex_client, critical=False),
+                # Create the shared Polly client up front so the first chat turn doesn't pay for it
+                StartupStep("polly", get_speech_service, critical=False),
+            ],
+            [
+                # Needs Postgres; loads the availability index before requests are served
+                StartupStep("appointments", init_appointments, critical=False),
+                StartupStep("transcripts", init_transcripts, critical=False),
+                StartupStep("chat_events", init_chat_events, critical=False),
+            ],
+        )
+        start_secret_refresher()
+        run_in_background(warm_faq_audio())
             
         logger.info("All connections initialized successfully")
         yield  # Application runs here
@@ -84,8 +109,16 @@ async def lifespan(app: FastAPI):
     finally:
         # Shutdown logic
         logger.info("Shutting down connections")
+        await close_appointments()
+        await close_chat_events()
+        # Flushes queued chat history, so it must run before the pool closes
+        await close_transcripts()
         await close_postgres()
         await close_redis()
+        await close_auth_client()
+        await close_async_lex_client()
+        speech_services.close()
+        stop_secret_refresher()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -99,9 +132,24 @@ app.add_middleware(
     expose_headers=["*"]  # Add this to expose all response headers
 )
 
+
+@app.exception_handler(DependencyOverloaded)
+async def dependency_overloaded_handler(request: Request, exc: DependencyOverloaded):
+    # Shed load fast instead of letting requests time out behind a saturated dependency
+    metrics.increment(f"http.shed.{exc.dependency}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is busy, please retry shortly", "dependency": exc.dependency},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(chat_router)  # Add the chat router
+app.include_router(chat_ws_router)
+app.include_router(appointments_router)
+app.include_router(lex_hook_router)
 
 
 @app.get("/protected-route")
@@ -125,6 +173,20 @@ async def health_check(connection=Depends(get_postgres_connection)):
     }
 
 
+@app.get("/health/startup", include_in_schema=False)
+async def startup_report():
+    return app.state.startup_report
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return metrics.snapshot()
+
+
 @app.get("/")
 async def read_root(connection=Depends(get_postgres_connection)):
     # Assuming you have Redis and PostgreSQL connection methods set up in your app
@@ -0,0 +1 @@
+# Appointments module initialization
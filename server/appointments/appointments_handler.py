@@ -0,0 +1,212 @@
+import logging
+from datetime import date as dt_date, datetime, timedelta
+from typing import Literal, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from appointments import store
+from appointments.availability import availability
+from appointments.store import SlotUnavailableError, serialize_appointment
+from auth.auth import is_staff, validate_token
+from models.Models import AppointmentRequest, AppointmentUpdate, User
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Usual length of each service, used when a booking doesn't give a duration
+SERVICE_DURATIONS = {
+    "checkup": 30,
+    "cleaning": 45,
+    "filling": 60,
+    "extraction": 60,
+    "root canal": 90,
+    "whitening": 60,
+    "consultation": 30,
+}
+DEFAULT_DURATION_MINUTES = 30
+
+
+def service_duration(service: str, duration_minutes: Optional[int] = None) -> int:
+    return duration_minutes or SERVICE_DURATIONS.get(service.strip().lower(), DEFAULT_DURATION_MINUTES)
+
+
+def check_slot_start(starts_at: datetime):
+    if not availability.is_aligned(starts_at):
+        raise HTTPException(status_code=422,
+                            detail=f"Appointments start on {availability.slot_minutes}-minute boundaries")
+
+
+def clinic_time(value: datetime) -> datetime:
+    """Times without an offset are taken as clinic local time"""
+    return value.replace(tzinfo=availability.tz) if value.tzinfo is None else value
+
+
+async def get_owned_appointment(appointment_id: UUID, user: User):
+    record = await store.get_appointment(appointment_id)
+    # Other patients' appointments are reported as missing rather than forbidden
+    if not record or (record["patient_id"] != user.id and not is_staff(user)):
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    return record
+
+
+def check_patient_changes(current, changes: dict):
+    """
+    Patients may reschedule or cancel their own scheduled appointments; recording an
+    outcome (completed, no_show), reopening a cancelled visit or assigning another
+    provider is left to staff
+
+    Raises:
+        HTTPException: 403 for a change reserved to staff, 409 once the appointment is no longer scheduled
+    """
+    if "provider_id" in changes and str(changes["provider_id"]) != str(current["provider_id"]):
+        raise HTTPException(status_code=403, detail="Only clinic staff can change the provider")
+    status = changes.get("status", current["status"])
+    if status != current["status"] and status != "cancelled":
+        raise HTTPException(status_code=403, detail=f"Only clinic staff can mark an appointment {status}")
+    if current["status"] != "scheduled":
+        raise HTTPException(status_code=409, detail=f"The appointment is {current['status']}")
+
+
+@router.get("/appointments/providers")
+async def get_providers(user: User = Depends(validate_token)):
+    providers = await store.list_providers()
+    return [{**dict(provider), "id": str(provider["id"])} for provider in providers]
+
+
+@router.get("/appointments/availability")
+async def get_availability(
+    date: dt_date,
+    duration_minutes: int = Query(DEFAULT_DURATION_MINUTES, ge=5, le=480),
+    provider_id: Optional[UUID] = None,
+    user: User = Depends(validate_token),
+):
+    """Every start time on a day where an appointment of duration_minutes fits"""
+    slots = availability.free_slots(date, duration_minutes, [provider_id] if provider_id else None)
+    now = datetime.now(availability.tz)
+    return {
+        "date": date.isoformat(),
+        "duration_minutes": duration_minutes,
+        "slots": [
+            {"provider_id": slot_provider, "starts_at": starts_at.isoformat()}
+            for slot_provider, starts_at in slots if starts_at >= now
+        ],
+    }
+
+
+@router.get("/appointments/next-available")
+async def get_next_available(
+    after: Optional[datetime] = None,
+    duration_minutes: int = Query(DEFAULT_DURATION_MINUTES, ge=5, le=480),
+    provider_id: Optional[UUID] = None,
+    user: User = Depends(validate_token),
+):
+    now = datetime.now(availability.tz)
+    after = max(clinic_time(after), now) if after else now
+    found = availability.next_free(after, duration_minutes, [provider_id] if provider_id else None)
+    if not found:
+        raise HTTPException(status_code=404, detail="No availability in the booking horizon")
+    slot_provider, starts_at = found
+    return {
+        "provider_id": slot_provider,
+        "starts_at": starts_at.isoformat(),
+        "ends_at": (starts_at + timedelta(minutes=duration_minutes)).isoformat(),
+    }
+
+
+@router.get("/appointments")
+async def list_appointments(
+    scope: Literal["upcoming", "past", "all"] = "upcoming",
+    user: User = Depends(validate_token),
+):
+    records = await store.list_patient_appointments(user.id, scope)
+    return [serialize_appointment(record) for record in records]
+
+
+@router.post("/appointments", status_code=201)
+async def create_appointment(request: AppointmentRequest, user: User = Depends(validate_token)):
+    starts_at = clinic_time(request.starts_at)
+    if starts_at < datetime.now(availability.tz):
+        raise HTTPException(status_code=400, detail="Appointments can't be booked in the past")
+    check_slot_start(starts_at)
+    ends_at = availability.align_end(starts_at + timedelta(minutes=service_duration(request.service,
+                                                                                    request.duration_minutes)))
+
+    # The index answers in microseconds; only candidates it considers free go to Postgres,
+    # which still has the final say if another worker booked the slot in the meantime
+    if request.provider_id:
+        candidates = [str(request.provider_id)] if availability.is_free(request.provider_id, starts_at, ends_at) else []
+    else:
+        candidates = availability.free_providers(starts_at, ends_at)
+    if not candidates:
+        metrics.increment("appointments.index_conflicts")
+        raise HTTPException(status_code=409, detail="The requested time is not available")
+
+    for provider_id in candidates:
+        try:
+            record = await store.create_appointment(
+                user.id, UUID(provider_id), request.service, starts_at, ends_at, request.notes
+            )
+            logger.info(f"Appointment {record['id']} booked for user {user.id}")
+            return serialize_appointment(record)
+        except SlotUnavailableError:
+            continue
+    raise HTTPException(status_code=409, detail="The requested time is not available")
+
+
+@router.get("/appointments/{appointment_id}")
+async def get_appointment(appointment_id: UUID, user: User = Depends(validate_token)):
+    return serialize_appointment(await get_owned_appointment(appointment_id, user))
+
+
+@router.patch("/appointments/{appointment_id}")
+async def update_appointment(appointment_id: UUID, request: AppointmentUpdate, user: User = Depends(validate_token)):
+    current = await get_owned_appointment(appointment_id, user)
+    changes = request.model_dump(exclude_none=True, exclude={"duration_minutes"})
+    if not is_staff(user):
+        check_patient_changes(current, changes)
+
+    if request.starts_at or request.duration_minutes or request.service:
+        starts_at = clinic_time(request.starts_at) if request.starts_at else current["starts_at"]
+        if request.starts_at and starts_at < datetime.now(availability.tz):
+            raise HTTPException(status_code=400, detail="Appointments can't be moved to the past")
+        if request.starts_at:
+            check_slot_start(starts_at)
+        if request.duration_minutes or request.service:
+            duration = service_duration(request.service or current["service"], request.duration_minutes)
+        else:
+            duration = (current["ends_at"] - current["starts_at"]) // timedelta(minutes=1)
+        changes["starts_at"] = starts_at
+        changes["ends_at"] = availability.align_end(starts_at + timedelta(minutes=duration))
+
+    status = changes.get("status", current["status"])
+    provider_id = changes.get("provider_id", current["provider_id"])
+    starts_at = changes.get("starts_at", current["starts_at"])
+    ends_at = changes.get("ends_at", current["ends_at"])
+    if status != "cancelled" and not availability.is_free(provider_id, starts_at, ends_at, appointment_id):
+        metrics.increment("appointments.index_conflicts")
+        raise HTTPException(status_code=409, detail="The requested time is not available")
+
+    try:
+        record = await store.update_appointment(appointment_id, changes)
+    except SlotUnavailableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not record:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    return serialize_appointment(record)
+
+
+@router.delete("/appointments/{appointment_id}")
+async def cancel_appointment(appointment_id: UUID, user: User = Depends(validate_token)):
+    """Cancel an appointment; the row is kept for the patient's history"""
+    current = await get_owned_appointment(appointment_id, user)
+    if not is_staff(user):
+        check_patient_changes(current, {"status": "cancelled"})
+    record = await store.update_appointment(appointment_id, {"status": "cancelled"})
+    if not record:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    logger.info(f"Appointment {appointment_id} cancelled by user {user.id}")
+    return serialize_appointment(record)
@@ -0,0 +1,227 @@
+import logging
+import os
+from datetime import datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Booking grid: appointments start on slot boundaries and occupy whole slots
+SLOT_MINUTES = int(os.getenv("APPOINTMENT_SLOT_MINUTES", "15"))
+CLINIC_TIMEZONE = os.getenv("CLINIC_TIMEZONE", "America/Toronto")
+CLINIC_OPEN_TIME = os.getenv("CLINIC_OPEN_TIME", "08:00")
+CLINIC_CLOSE_TIME = os.getenv("CLINIC_CLOSE_TIME", "18:00")
+# Opening days, 0 = Monday
+CLINIC_DAYS = os.getenv("CLINIC_DAYS", "0,1,2,3,4")
+# How far ahead next_free() searches
+AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", "90"))
+
+
+def _minutes(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _run_starts(free: int, length: int) -> int:
+    """Bits set where `length` consecutive free slots start, in O(log length) big-int operations"""
+    runs = free
+    covered = 1
+    while covered < length:
+        shift = min(covered, length - covered)
+        runs &= runs >> shift
+        covered += shift
+    return runs
+
+
+class AvailabilityIndex:
+    """
+    In-memory index of booked time per provider (dentist or chair).
+
+    Each (provider, local day) maps to an int used as a bitset with one bit per
+    SLOT_MINUTES slot, so a conflict check is one AND and "next free slot of N
+    minutes" is a few shifts per day and provider. Postgres stays the source of
+    truth; the index is loaded at startup and kept in sync by AvailabilitySync.
+    """
+
+    def __init__(self, timezone=CLINIC_TIMEZONE, slot_minutes=SLOT_MINUTES, open_time=CLINIC_OPEN_TIME,
+                 close_time=CLINIC_CLOSE_TIME, open_days=CLINIC_DAYS):
+        self.tz = ZoneInfo(timezone)
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = 24 * 60 // slot_minutes
+        open_slot = _minutes(open_time) // slot_minutes
+        close_slot = _minutes(close_time) // slot_minutes
+        self._opening_mask = ((1 << (close_slot - open_slot)) - 1) << open_slot
+        self._open_days = {int(day) for day in open_days.split(",") if day.strip()}
+        self.providers = []
+        self._busy = {}
+        self._bookings = {}
+        # Appointment id -> newest row version applied (cancelled and deleted ones included)
+        self._versions = {}
+
+    def set_providers(self, provider_ids):
+        """Providers considered when no specific provider is requested, in preference order"""
+        self.providers = [str(provider_id) for provider_id in provider_ids]
+
+    def clear(self):
+        self._busy.clear()
+        self._bookings.clear()
+        self._versions.clear()
+
+    def opening_mask(self, day):
+        return self._opening_mask if day.weekday() in self._open_days else 0
+
+    def _spans(self, start: datetime, end: datetime):
+        """Split [start, end) into (local day, bit mask) parts, rounding outwards to whole slots"""
+        start = start.astimezone(self.tz)
+        end = end.astimezone(self.tz)
+        day = start.date()
+        while True:
+            # Wall-clock minutes, so slots line up with opening hours on DST change days too
+            first = (start.hour * 60 + start.minute) // self.slot_minutes if day == start.date() else 0
+            if end.date() == day:
+                end_minutes = end.hour * 60 + end.minute + (1 if end.second or end.microsecond else 0)
+                last = min(self.slots_per_day, -(-end_minutes // self.slot_minutes))
+            else:
+                last = self.slots_per_day
+            if last > first:
+                yield day, ((1 << (last - first)) - 1) << first
+            if end.date() == day:
+                return
+            day += timedelta(days=1)
+
+    def is_aligned(self, value: datetime) -> bool:
+        """Whether value is a slot boundary in clinic time"""
+        local = value.astimezone(self.tz)
+        return not (local.second or local.microsecond or (local.hour * 60 + local.minute) % self.slot_minutes)
+
+    def align_end(self, end: datetime) -> datetime:
+        """Round an end time up to the next slot boundary, so an appointment occupies whole slots"""
+        local = end.astimezone(self.tz)
+        if self.is_aligned(local):
+            return local
+        minutes = local.hour * 60 + local.minute + 1
+        return self.slot_start(local.date(), -(-minutes // self.slot_minutes))
+
+    def slot_start(self, day, slot) -> datetime:
+        return datetime.combine(day, dt_time(0), self.tz) + timedelta(minutes=slot * self.slot_minutes)
+
+    def _is_newer(self, appointment_id, version):
+        """Record version as applied unless a newer change of the appointment already was"""
+        if version is None:
+            return True
+        applied = self._versions.get(appointment_id)
+        if applied is not None and version <= applied:
+            return False
+        self._versions[appointment_id] = version
+        return True
+
+    def book(self, appointment_id, provider_id, start: datetime, end: datetime, version=None):
+        """
+        Mark an appointment as busy time, replacing any earlier version of it
+
+        Args:
+            version (int): Row version (appointments.version); the local update after a write
+                and its notification arrive in either order, the older one is ignored
+        """
+        appointment_id = str(appointment_id)
+        if not self._is_newer(appointment_id, version):
+            return
+        self._free(appointment_id)
+        provider_id = str(provider_id)
+        for day, mask in self._spans(start, end):
+            key = (provider_id, day)
+            self._busy[key] = self._busy.get(key, 0) | mask
+        self._bookings[appointment_id] = (provider_id, start, end)
+
+    def release(self, appointment_id, version=None):
+        """Free the time of a cancelled, moved or deleted appointment"""
+        appointment_id = str(appointment_id)
+        if self._is_newer(appointment_id, version):
+            self._free(appointment_id)
+
+    def _free(self, appointment_id):
+        booking = self._bookings.pop(appointment_id, None)
+        if not booking:
+            return
+        provider_id, start, end = booking
+        for day, mask in self._spans(start, end):
+            key = (provider_id, day)
+            busy = self._busy.get(key, 0) & ~mask
+            if busy:
+                self._busy[key] = busy
+            else:
+                self._busy.pop(key, None)
+
+    def is_free(self, provider_id, start: datetime, end: datetime, ignore_appointment_id=None) -> bool:
+        """
+        Check that [start, end) is within opening hours and free for a provider
+        Args:
+            ignore_appointment_id: Appointment being moved, its own time counts as free
+        """
+        provider_id = str(provider_id)
+        ignored = self._bookings.get(str(ignore_appointment_id)) if ignore_appointment_id else None
+        ignored_masks = dict(self._spans(ignored[1], ignored[2])) if ignored and ignored[0] == provider_id else {}
+        for day, mask in self._spans(start, end):
+            if mask & ~self.opening_mask(day):
+                return False
+            busy = self._busy.get((provider_id, day), 0) & ~ignored_masks.get(day, 0)
+            if busy & mask:
+                return False
+        return True
+
+    def free_providers(self, start: datetime, end: datetime):
+        return [provider_id for provider_id in self.providers if self.is_free(provider_id, start, end)]
+
+    def free_slots(self, day, duration_minutes, provider_ids=None):
+        """
+        Every start time on a day where an appointment of duration_minutes fits
+        Returns:
+            list: (provider_id, start datetime) ordered by time, then provider preference
+        """
+        length = -(-duration_minutes // self.slot_minutes)
+        opening = self.opening_mask(day)
+        slots = []
+        for provider_id in provider_ids or self.providers:
+            runs = _run_starts(opening & ~self._busy.get((str(provider_id), day), 0), length)
+            while runs:
+                lowest = runs & -runs
+                slots.append((lowest.bit_length() - 1, str(provider_id)))
+                runs ^= lowest
+        slots.sort(key=lambda slot: slot[0])
+        return [(provider_id, self.slot_start(day, slot)) for slot, provider_id in slots]
+
+    def next_free(self, after: datetime, duration_minutes, provider_ids=None, horizon_days=AVAILABILITY_HORIZON_DAYS):
+        """
+        Earliest start at or after `after` where an appointment of duration_minutes fits
+        Returns:
+            tuple: (provider_id, start datetime), or None if nothing is free within the horizon
+        """
+        length = -(-duration_minutes // self.slot_minutes)
+        after = after.astimezone(self.tz)
+        first_day = after.date()
+        first_slot = -(-(after.hour * 60 + after.minute + (1 if after.second or after.microsecond else 0)) // self.slot_minutes)
+        providers = [str(provider_id) for provider_id in (provider_ids or self.providers)]
+
+        for offset in range(horizon_days + 1):
+            day = first_day + timedelta(days=offset)
+            opening = self.opening_mask(day)
+            if not opening:
+                continue
+            if offset == 0:
+                opening &= ~((1 << first_slot) - 1)
+
+            best = None
+            for provider_id in providers:
+                runs = _run_starts(opening & ~self._busy.get((provider_id, day), 0), length)
+                if runs:
+                    slot = (runs & -runs).bit_length() - 1
+                    if best is None or slot < best[0]:
+                        best = (slot, provider_id)
+            if best:
+                return best[1], self.slot_start(day, best[0])
+        return None
+
+    def __len__(self):
+        return len(self._bookings)
+
+
+availability = AvailabilityIndex()
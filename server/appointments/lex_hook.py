@@ -0,0 +1,227 @@
+import hmac
+import logging
+import os
+import time
+from datetime import date as dt_date, datetime, time as dt_time, timedelta
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Header, HTTPException, Request
+
+from appointments import store
+from appointments.appointments_handler import SERVICE_DURATIONS, service_duration
+from appointments.availability import availability
+from appointments.store import SlotUnavailableError
+from utils import metrics
+from utils.lex_dialog import load_session_owner
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Shared with the Lambda that forwards Lex code hook events here (scripts/lex_hook_lambda.py)
+LEX_HOOK_SECRET = os.getenv("LEX_HOOK_SECRET")
+# Names used in the Lex bot definition
+LEX_BOOKING_INTENT = os.getenv("LEX_BOOKING_INTENT", "BookAppointment")
+LEX_SLOT_SERVICE = os.getenv("LEX_SLOT_SERVICE", "AppointmentType")
+LEX_SLOT_DATE = os.getenv("LEX_SLOT_DATE", "Date")
+LEX_SLOT_TIME = os.getenv("LEX_SLOT_TIME", "Time")
+# Alternatives offered when the requested time is taken
+LEX_SUGGESTED_TIMES = int(os.getenv("LEX_SUGGESTED_TIMES", "3"))
+
+# AMAZON.Time resolves vague answers ("in the morning") to these codes
+TIME_PERIODS = {
+    "MO": (dt_time(0), dt_time(12)),
+    "AF": (dt_time(12), dt_time(17)),
+    "EV": (dt_time(17), dt_time(21)),
+    "NI": (dt_time(21), dt_time(23, 59)),
+}
+
+
+def slot_value(slots, name) -> Optional[str]:
+    value = (slots.get(name) or {}).get("value") or {}
+    return value.get("interpretedValue")
+
+
+def format_time(value: datetime) -> str:
+    return value.strftime("%I:%M %p").lstrip("0")
+
+
+def format_date(value) -> str:
+    return value.strftime("%A, %B %d").replace(" 0", " ")
+
+
+def join_options(options):
+    return options[0] if len(options) == 1 else ", ".join(options[:-1]) + " or " + options[-1]
+
+
+def dialog_response(event, action, message=None, slot_to_elicit=None, intent_state="InProgress", slots=None,
+                    attributes=None):
+    """Build a Lex V2 code hook response"""
+    session_state = event.get("sessionState", {})
+    intent = dict(session_state.get("intent", {}))
+    intent["state"] = intent_state
+    if slots is not None:
+        intent["slots"] = slots
+
+    dialog_action = {"type": action}
+    if slot_to_elicit:
+        dialog_action["slotToElicit"] = slot_to_elicit
+
+    response = {
+        "sessionState": {
+            "sessionAttributes": {**session_state.get("sessionAttributes", {}), **(attributes or {})},
+            "dialogAction": dialog_action,
+            "intent": intent,
+        }
+    }
+    if message:
+        response["messages"] = [{"contentType": "PlainText", "content": message}]
+    return response
+
+
+def elicit(event, slots, slot_name, message):
+    """Clear an invalid slot and ask for it again, in the same turn"""
+    metrics.increment(f"lex.hook.rejected.{slot_name}")
+    return dialog_response(event, "ElicitSlot", message, slot_to_elicit=slot_name, slots={**slots, slot_name: None})
+
+
+def suggest_times(day, duration_minutes, after=None, window=None):
+    """Distinct free start times on a day, earliest first"""
+    now = datetime.now(availability.tz)
+    times = []
+    for _, starts_at in availability.free_slots(day, duration_minutes):
+        if starts_at < now or (after and starts_at < after):
+            continue
+        if window and not window[0] <= starts_at.time() < window[1]:
+            continue
+        if starts_at not in times:
+            times.append(starts_at)
+        if len(times) == LEX_SUGGESTED_TIMES:
+            break
+    return times
+
+
+def validate_booking(event):
+    """
+    Check the slots filled so far against the availability index
+    Returns:
+        tuple: (Lex response rejecting a slot or None, chosen provider id, start datetime, end datetime)
+    """
+    slots = event["sessionState"]["intent"].get("slots") or {}
+    service = slot_value(slots, LEX_SLOT_SERVICE)
+    date_value = slot_value(slots, LEX_SLOT_DATE)
+    time_value = slot_value(slots, LEX_SLOT_TIME)
+
+    if service and service.strip().lower() not in SERVICE_DURATIONS:
+        services = join_options(list(SERVICE_DURATIONS))
+        return elicit(event, slots, LEX_SLOT_SERVICE, f"We offer {services}. Which would you like?"), None, None, None
+    duration = service_duration(service or "")
+
+    today = datetime.now(availability.tz).date()
+    day = None
+    if date_value:
+        try:
+            day = dt_date.fromisoformat(date_value)
+        except ValueError:
+            return elicit(event, slots, LEX_SLOT_DATE, "Sorry, which date would you like?"), None, None, None
+        if day < today:
+            return elicit(event, slots, LEX_SLOT_DATE, "That date has passed. Which date would you like?"), None, None, None
+        if not suggest_times(day, duration):
+            found = availability.next_free(max(datetime.combine(day, dt_time(0), availability.tz),
+                                               datetime.now(availability.tz)), duration)
+            message = f"We have no openings on {format_date(day)}."
+            if found:
+                message += f" The next available day is {format_date(found[1])}. Would that work?"
+            return elicit(event, slots, LEX_SLOT_DATE, message), None, None, None
+
+    if not (day and time_value):
+        return None, None, None, None
+
+    if time_value in TIME_PERIODS:
+        window = TIME_PERIODS[time_value]
+        times = suggest_times(day, duration, window=window) or suggest_times(day, duration)
+        options = join_options([format_time(value) for value in times])
+        return elicit(event, slots, LEX_SLOT_TIME, f"I can offer {options}. Which time works for you?"), None, None, None
+
+    try:
+        starts_at = datetime.combine(day, dt_time.fromisoformat(time_value), availability.tz)
+    except ValueError:
+        return elicit(event, slots, LEX_SLOT_TIME, "Sorry, what time would you like?"), None, None, None
+    ends_at = availability.align_end(starts_at + timedelta(minutes=duration))
+
+    bookable = availability.is_aligned(starts_at) and starts_at >= datetime.now(availability.tz)
+    providers = availability.free_providers(starts_at, ends_at) if bookable else []
+    if not providers:
+        times = suggest_times(day, duration, after=starts_at) or suggest_times(day, duration)
+        options = join_options([format_time(value) for value in times])
+        message = f"{format_time(starts_at)} isn't available. I can offer {options} instead."
+        return elicit(event, slots, LEX_SLOT_TIME, message), None, None, None
+    return None, providers[0], starts_at, ends_at
+
+
+async def fulfill_booking(event, provider_id, starts_at, ends_at):
+    slots = event["sessionState"]["intent"].get("slots") or {}
+    patient_id = (event["sessionState"].get("sessionAttributes") or {}).get("patient_id")
+    if not patient_id:
+        return dialog_response(event, "Close", "Please sign in to the patient portal to confirm your booking.",
+                               intent_state="Failed")
+    # The attribute is only trusted when it names the user who sent this turn to the API
+    owner = await load_session_owner(event.get("sessionId"))
+    if owner != patient_id:
+        metrics.increment("lex.hook.owner_mismatch")
+        logger.warning(f"Refused booking for patient {patient_id} in session {event.get('sessionId')} "
+                       f"owned by {owner!r}")
+        return dialog_response(event, "Close", "Sorry, I couldn't confirm your booking. Please try again.",
+                               intent_state="Failed")
+    try:
+        record = await store.create_appointment(UUID(patient_id), UUID(provider_id), slot_value(slots, LEX_SLOT_SERVICE),
+                                                starts_at, ends_at)
+    except SlotUnavailableError:
+        # Taken by someone else since the time was validated
+        times = suggest_times(starts_at.date(), service_duration(slot_value(slots, LEX_SLOT_SERVICE)), after=starts_at)
+        message = "Sorry, that time was just booked."
+        if times:
+            message += f" I can offer {join_options([format_time(value) for value in times])}."
+        return elicit(event, slots, LEX_SLOT_TIME, message)
+
+    metrics.increment("lex.hook.booked")
+    return dialog_response(
+        event, "Close",
+        f"Your appointment has been booked for {format_date(starts_at)} at {format_time(starts_at)}.",
+        intent_state="Fulfilled", attributes={"appointment_id": str(record["id"])}
+    )
+
+
+@router.post("/lex/hook", include_in_schema=False)
+async def lex_code_hook(request: Request, x_lex_hook_secret: Optional[str] = Header(None)):
+    """
+    Dialog and fulfillment code hook for the Lex bot
+
+    Slots are checked against the availability index as they are filled, so an
+    unavailable date or time is re-asked in the same turn with alternatives,
+    instead of being discovered after the conversation (another Lex and Polly
+    round trip per correction).
+    """
+    if not LEX_HOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Lex code hook is not configured")
+    if not hmac.compare_digest(x_lex_hook_secret or "", LEX_HOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid hook secret")
+
+    started = time.perf_counter()
+    event = await request.json()
+    intent_name = event.get("sessionState", {}).get("intent", {}).get("name")
+    source = event.get("invocationSource")
+    try:
+        if intent_name != LEX_BOOKING_INTENT:
+            return dialog_response(event, "Delegate")
+
+        rejection, provider_id, starts_at, ends_at = validate_booking(event)
+        if rejection:
+            return rejection
+        if source == "FulfillmentCodeHook":
+            return await fulfill_booking(event, provider_id, starts_at, ends_at)
+        attributes = {"provider_id": provider_id} if provider_id else None
+        return dialog_response(event, "Delegate", attributes=attributes)
+    finally:
+        metrics.increment(f"lex.hook.{source or 'unknown'}")
+        metrics.observe("lex.hook.seconds", time.perf_counter() - started)
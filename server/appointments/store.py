@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+from appointments.availability import availability
+from database.postgres import acquire_connection, db_connection, transaction, fetch_query
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "appointments_changed"
+# Appointments that ended longer ago than this are not loaded into the availability index
+AVAILABILITY_LOOKBACK = "1 day"
+AVAILABILITY_SYNC_RETRY_SECONDS = float(os.getenv("AVAILABILITY_SYNC_RETRY_SECONDS", "5"))
+
+APPOINTMENT_STATUSES = ("scheduled", "completed", "no_show", "cancelled")
+
+# Providers are the bookable resources (a dentist, hygienist or chair), managed in SQL:
+#   INSERT INTO providers (name, kind) VALUES ('Dr. Smith', 'dentist');
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS providers (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    name text NOT NULL,
+    kind text NOT NULL DEFAULT 'dentist',
+    active boolean NOT NULL DEFAULT true,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    patient_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    provider_id uuid NOT NULL REFERENCES providers (id),
+    service text NOT NULL,
+    starts_at timestamptz NOT NULL,
+    ends_at timestamptz NOT NULL,
+    status text NOT NULL DEFAULT 'scheduled' CHECK (status IN {APPOINTMENT_STATUSES}),
+    notes text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    CHECK (ends_at > starts_at)
+);
+
+-- Bumped by every update; orders the changes applied to the availability index
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0;
+ALTER TABLE appointments DROP CONSTRAINT IF EXISTS appointments_status_check;
+ALTER TABLE appointments ADD CONSTRAINT appointments_status_check CHECK (status IN {APPOINTMENT_STATUSES});
+
+CREATE INDEX IF NOT EXISTS appointments_provider_time_idx
+    ON appointments (provider_id, starts_at) WHERE status <> 'cancelled';
+CREATE INDEX IF NOT EXISTS appointments_patient_time_idx
+    ON appointments (patient_id, starts_at);
+
+-- Every change is broadcast so each worker's availability index follows the table
+CREATE OR REPLACE FUNCTION notify_appointment_change() RETURNS trigger AS $$
+DECLARE
+    changed appointments;
+BEGIN
+    IF TG_OP = 'DELETE' THEN changed := OLD; ELSE changed := NEW; END IF;
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object(
+        'op', TG_OP, 'id', changed.id, 'provider_id', changed.provider_id,
+        'starts_at', changed.starts_at, 'ends_at', changed.ends_at, 'status', changed.status,
+        -- A deleted row outranks every version it had
+        'version', changed.version + CASE WHEN TG_OP = 'DELETE' THEN 1 ELSE 0 END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_provider_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object('op', 'PROVIDERS')::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS appointments_notify ON appointments;
+CREATE TRIGGER appointments_notify AFTER INSERT OR UPDATE OR DELETE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION notify_appointment_change();
+
+DROP TRIGGER IF EXISTS providers_notify ON providers;
+CREATE TRIGGER providers_notify AFTER INSERT OR UPDATE OR DELETE ON providers
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_provider_change();
+"""
+
+APPOINTMENT_COLUMNS = """
+    a.id, a.patient_id, a.provider_id, p.name AS provider_name, a.service,
+    a.starts_at, a.ends_at, a.status, a.notes, a.version
+"""
+
+
+class SlotUnavailableError(Exception):
+    """The requested time overlaps another appointment or is outside opening hours"""
+
+
+def _check_alignment(starts_at, ends_at):
+    """
+    The index books whole slots, so two appointments sharing a slot (09:00-09:20 and
+    09:20-09:40) would free each other's time when one is cancelled
+
+    Raises:
+        ValueError: starts_at or ends_at is not on the slot grid
+    """
+    if not (availability.is_aligned(starts_at) and availability.is_aligned(ends_at)):
+        raise ValueError(f"Appointments must start and end on a {availability.slot_minutes}-minute boundary")
+
+
+def serialize_appointment(record):
+    appointment = dict(record)
+    appointment.pop("version", None)
+    for key in ("id", "patient_id", "provider_id"):
+        appointment[key] = str(appointment[key])
+    for key in ("starts_at", "ends_at"):
+        appointment[key] = appointment[key].astimezone(availability.tz).isoformat()
+    return appointment
+
+
+async def load_providers(connection):
+    rows = await connection.fetch("SELECT id FROM providers WHERE active ORDER BY created_at, name")
+    availability.set_providers([row["id"] for row in rows])
+
+
+async def load_availability(connection):
+    """Rebuild the availability index from the appointments table"""
+    await load_providers(connection)
+    rows = await connection.fetch(
+        f"""
+        SELECT id, provider_id, starts_at, ends_at, version FROM appointments
+        WHERE status <> 'cancelled' AND ends_at > now() - interval '{AVAILABILITY_LOOKBACK}'
+        """
+    )
+    availability.clear()
+    for row in rows:
+        availability.book(row["id"], row["provider_id"], row["starts_at"], row["ends_at"], row["version"])
+    logger.info(f"Availability index loaded: {len(rows)} appointments, {len(availability.providers)} providers")
+
+
+class AvailabilitySync:
+    """
+    Keeps the availability index in step with Postgres across workers.
+
+    A pooled connection LISTENs on appointments_changed (fed by table triggers).
+    The index is reloaded whenever that connection is (re)established, so changes
+    made while it was down are not missed.
+    """
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self._task = None
+        self._providers_task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with acquire_connection(timeout=30) as connection:
+                    closed = asyncio.Event()
+                    connection.add_termination_listener(lambda _: closed.set())
+                    await connection.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                    try:
+                        # Listen first, then load, so no change falls between the two
+                        await load_availability(connection)
+                        self.ready.set()
+                        await closed.wait()
+                    finally:
+                        if not connection.is_closed():
+                            await connection.remove_listener(NOTIFY_CHANNEL, self._on_notify)
+                logger.warning("Availability sync connection closed, reloading")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Availability sync failed: {str(e)}")
+            metrics.increment("appointments.availability_resyncs")
+            await asyncio.sleep(AVAILABILITY_SYNC_RETRY_SECONDS)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        change = json.loads(payload)
+        if change["op"] == "PROVIDERS":
+            self._providers_task = asyncio.create_task(self._reload_providers())
+            return
+        if change["op"] == "DELETE" or change["status"] == "cancelled":
+            availability.release(change["id"], change["version"])
+        else:
+            availability.book(change["id"], change["provider_id"], datetime.fromisoformat(change["starts_at"]),
+                              datetime.fromisoformat(change["ends_at"]), change["version"])
+
+    async def _reload_providers(self):
+        try:
+            async with db_connection() as connection:
+                await load_providers(connection)
+        except Exception as e:
+            logger.error(f"Failed to reload providers: {str(e)}")
+
+
+availability_sync = AvailabilitySync()
+
+
+async def init_appointments(timeout=30):
+    """Create the schema if needed and load the availability index"""
+    async with db_connection() as connection:
+        await connection.execute(SCHEMA)
+    availability_sync.start()
+    await asyncio.wait_for(availability_sync.ready.wait(), timeout=timeout)
+
+
+async def close_appointments():
+    await availability_sync.stop()
+
+
+async def list_providers():
+    return await fetch_query("SELECT id, name, kind FROM providers WHERE active ORDER BY created_at, name")
+
+
+async def list_patient_appointments(patient_id, scope="upcoming"):
+    condition = {
+        "upcoming": "AND a.ends_at >= now() AND a.status = 'scheduled'",
+        "past": "AND (a.ends_at < now() OR a.status <> 'scheduled')",
+        "all": "",
+    }[scope]
+    order = "ASC" if scope == "upcoming" else "DESC"
+    return await fetch_query(
+        f"""
+        SELECT {APPOINTMENT_COLUMNS}
+        FROM appointments a JOIN providers p ON p.id = a.provider_id
+        WHERE a.patient_id = $1 {condition}
+        ORDER BY a.starts_at {order}
+        """,
+        patient_id
+    )
+
+
+async def get_appointment(appointment_id, connection=None):
+    query = f"""
+        SELECT {APPOINTMENT_COLUMNS}
+        FROM appointments a JOIN providers p ON p.id = a.provider_id
+        WHERE a.id = $1
+    """
+    if connection:
+        return await connection.fetchrow(query, appointment_id)
+    async with db_connection() as connection:
+        return await connection.fetchrow(query, appointment_id)
+
+
+async def _check_overlap(connection, provider_id, starts_at, ends_at, appointment_id=None):
+    # Serialize bookings per provider so two workers can't both pass the overlap check
+    await connection.execute("SELECT pg_advisory_xact_lock(hashtext($1))", str(provider_id))
+    overlapping = await connection.fetchval(
+        """
+        SELECT 1 FROM appointments
+        WHERE provider_id = $1 AND status <> 'cancelled'
+          AND starts_at < $3 AND ends_at > $2
+          AND id IS DISTINCT FROM $4
+        LIMIT 1
+        """,
+        provider_id, starts_at, ends_at, appointment_id
+    )
+    if overlapping:
+        metrics.increment("appointments.db_conflicts")
+        raise SlotUnavailableError("The requested time is no longer available")
+
+
+async def create_appointment(patient_id, provider_id, service, starts_at, ends_at, notes=None):
+    """
+    Book an appointment; Postgres has the final say on conflicts
+    Raises:
+        SlotUnavailableError: The provider is already booked at that time
+        ValueError: The times are not on the slot grid
+    """
+    _check_alignment(starts_at, ends_at)
+    async with transaction() as connection:
+        await _check_overlap(connection, provider_id, starts_at, ends_at)
+        appointment_id = await connection.fetchval(
+            """
+            INSERT INTO appointments (patient_id, provider_id, service, starts_at, ends_at, notes)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            RETURNING id
+            """,
+            patient_id, provider_id, service, starts_at, ends_at, notes
+        )
+        record = await get_appointment(appointment_id, connection)
+    # Apply locally right away; the notification may arrive before or after, versions keep the newest
+    availability.book(record["id"], record["provider_id"], record["starts_at"], record["ends_at"], record["version"])
+    return record
+
+
+async def update_appointment(appointment_id, changes):
+    """
+    Reschedule, reassign, cancel or annotate an appointment
+    Args:
+        changes (dict): Subset of provider_id, starts_at, ends_at, status, service, notes
+    Raises:
+        SlotUnavailableError: The new time overlaps another appointment
+        ValueError: The new times are not on the slot grid
+    """
+    async with transaction() as connection:
+        current = await connection.fetchrow("SELECT * FROM appointments WHERE id = $1 FOR UPDATE", appointment_id)
+        if not current:
+            return None
+        updated = {**dict(current), **changes}
+        if any(updated[key] != current[key] for key in ("starts_at", "ends_at")):
+            _check_alignment(updated["starts_at"], updated["ends_at"])
+        moved = any(updated[key] != current[key] for key in ("provider_id", "starts_at", "ends_at"))
+        reactivated = current["status"] == "cancelled" and updated["status"] != "cancelled"
+        if updated["status"] != "cancelled" and (moved or reactivated):
+            await _check_overlap(connection, updated["provider_id"], updated["starts_at"], updated["ends_at"],
+                                 appointment_id)
+
+        await connection.execute(
+            """
+            UPDATE appointments
+            SET provider_id = $2, service = $3, starts_at = $4, ends_at = $5, status = $6, notes = $7,
+                updated_at = now(), version = version + 1
+            WHERE id = $1
+            """,
+            appointment_id, updated["provider_id"], updated["service"], updated["starts_at"],
+            updated["ends_at"], updated["status"], updated["notes"]
+        )
+        record = await get_appointment(appointment_id, connection)
+
+    if record["status"] == "cancelled":
+        availability.release(record["id"], record["version"])
+    else:
+        availability.book(record["id"], record["provider_id"], record["starts_at"], record["ends_at"], record["version"])
+    return record
@@ -1,6 +1,6 @@
-import json
 import os
 import uuid
+from typing import Optional
 
 import gotrue.errors
 import jwt
@@ -10,10 +10,13 @@ from fastapi import HTTPException, Security, Depends, APIRouter
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from database.postgres import get_postgres_connection, insert_query
-from database.redis import get_redis_client
+from auth.auth_client import init_auth_client, get_auth_client, call_auth
+from auth.principal_cache import principal_cache
+from database.session_store import session_store
 from models.Models import User, RefreshRequest, AuthUser, ResendOTPRequest, ResetPasswordRequest, UpdatePasswordRequest
 import logging
 from utils.aws_utils import get_secret
+from utils.concurrency import DependencyOverloaded
 from utils.supabase_utils import validate_supabase_credentials
 
 # Set up logging
@@ -24,111 +27,133 @@ supabase_secret_name = os.getenv("supabase_secret_name")
 if not supabase_secret_name:
     raise RuntimeError("Missing environment variable: supabase_secret_name")
 
-# Retrieve credentials from AWS Secrets Manager
-try:
-    supabase_values = get_secret(supabase_secret_name)
-    logger.info(f"Retrieved Supabase credentials from AWS Secrets Manager")
-    
-    # Validate the structure and format of the credentials
-    is_valid, validation_message = validate_supabase_credentials(supabase_values)
-    
-    if not is_valid:
-        logger.error(f"Supabase credential validation failed: {validation_message}")
-        raise ValueError(f"Invalid Supabase credentials: {validation_message}")
-    
-    logger.info(f"Supabase credentials validated: {validation_message}")
-    
-    # Initialize Supabase client with validated credentials
-    SUPABASE_URL = supabase_values["SUPABASE_URL"]
-    SUPABASE_KEY = supabase_values["SUPABASE_SERVICE_ROLE_KEY"]
-    JWT_SECRET = supabase_values["JWT_SECRET"]
-    
-    # Log credential details (safely)
-    logger.info(f"Using Supabase URL: {SUPABASE_URL}")
-    logger.info(f"API Key length: {len(SUPABASE_KEY)} characters")
-    logger.info(f"JWT Secret length: {len(JWT_SECRET)} characters")
-    
-except Exception as e:
-    logger.critical(f"Failed to initialize Supabase credentials: {str(e)}", exc_info=True)
-    raise
-
-# Confirm requirements are met
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Supabase URL and API key are required")
-
-SUPABASE_JWT_SECRET = JWT_SECRET
-if SUPABASE_JWT_SECRET is None:
-    raise ValueError("JWT_SECRET is required")
+# Clinic roles that may manage any appointment (record outcomes, reassign providers).
+# Set in the users table by the clinic, never through /signup
+STAFF_ROLES = {role.strip() for role in os.getenv("STAFF_ROLES", "staff,admin").split(",") if role.strip()}
 
 auth_scheme = HTTPBearer()
+# For endpoints that also serve anonymous users (chat)
+optional_auth_scheme = HTTPBearer(auto_error=False)
 router = APIRouter()
 
-# Initialize Supabase client with robust error handling
-try:
-    logger.info(f"Initializing Supabase client with URL: {SUPABASE_URL}")
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    logger.info("Supabase client initialized successfully")
-    
-    # Optional: Make a simple query to verify the connection works
-    try:
-        result = supabase.table("users").select("count").limit(1).execute()
-        logger.info(f"Supabase connection test successful")
-    except Exception as query_error:
-        logger.warning(f"Supabase connection test query failed: {str(query_error)}")
-        # Continue anyway as this is just a verification
-except Exception as e:
-    logger.critical(f"Failed to initialize Supabase client: {str(e)}", exc_info=True)
-    raise RuntimeError(f"Supabase initialization failed: {str(e)}")
+# Set by init_auth() during application startup
+SUPABASE_URL = None
+SUPABASE_KEY = None
+SUPABASE_JWT_SECRET = None
+supabase: Client = None
 
 
-def validate_token(auth: HTTPAuthorizationCredentials = Security(auth_scheme)) -> User:
-    token = auth.credentials
+def init_auth():
+    """
+    Retrieve and validate the Supabase credentials and create the Supabase client.
+    Called from app.lifespan (in a worker thread) so importing this module does no I/O.
+    """
+    global SUPABASE_URL, SUPABASE_KEY, SUPABASE_JWT_SECRET, supabase
+
+    # Retrieve credentials from AWS Secrets Manager
     try:
-        logger.info("Validating JWT token...")
-
-        # Decode the JWT and verify claims
-        payload = jwt.decode(
-            token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            options={"verify_aud": False}
-        )
+        supabase_values = get_secret(supabase_secret_name)
+        logger.info(f"Retrieved Supabase credentials from AWS Secrets Manager")
+        
+        # Validate the structure and format of the credentials
+        is_valid, validation_message = validate_supabase_credentials(supabase_values)
+        
+        if not is_valid:
+            logger.error(f"Supabase credential validation failed: {validation_message}")
+            raise ValueError(f"Invalid Supabase credentials: {validation_message}")
+        
+        logger.info(f"Supabase credentials validated: {validation_message}")
+        
+        # Initialize Supabase client with validated credentials
+        SUPABASE_URL = supabase_values["SUPABASE_URL"]
+        SUPABASE_KEY = supabase_values["SUPABASE_SERVICE_ROLE_KEY"]
+        JWT_SECRET = supabase_values["JWT_SECRET"]
+        
+        # Log credential details (safely)
+        logger.info(f"Using Supabase URL: {SUPABASE_URL}")
+        logger.info(f"API Key length: {len(SUPABASE_KEY)} characters")
+        logger.info(f"JWT Secret length: {len(JWT_SECRET)} characters")
+        
+    except Exception as e:
+        logger.critical(f"Failed to initialize Supabase credentials: {str(e)}", exc_info=True)
+        raise
 
-        # Verify audience manually (Supabase default is 'authenticated')
-        if payload.get("aud") != "authenticated":
-            logger.warning("Invalid token: Incorrect audience")
-            raise HTTPException(status_code=401, detail="Invalid token: Invalid audience")
+    # Confirm requirements are met
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("Supabase URL and API key are required")
 
-        # Extract user details
-        user_id = payload.get("sub")
-        email = payload.get("email")
-        print(f"user id: {user_id} email: {email}")
-        if not user_id:
-            logger.error("Token validation failed: Missing user_id")
-            raise HTTPException(status_code=400, detail="Token payload is missing required fields")
-
-        # Ensure at least one identifier is present (email or phone)
-        if not email:
-            logger.error("Token validation failed: Missing email")
-            raise HTTPException(status_code=400, detail="Token must contain email")
-
-        # Fetch profile data from Supabase
+    SUPABASE_JWT_SECRET = JWT_SECRET
+    if SUPABASE_JWT_SECRET is None:
+        raise ValueError("JWT_SECRET is required")
+
+    # Initialize Supabase client with robust error handling
+    try:
+        logger.info(f"Initializing Supabase client with URL: {SUPABASE_URL}")
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        logger.info("Supabase client initialized successfully")
+
+        # Auth endpoints use the async GoTrue client so they don't block the event loop
+        init_auth_client(SUPABASE_URL, SUPABASE_KEY)
+        
+        # Optional: Make a simple query to verify the connection works
         try:
-            user_id = str(user_id).strip()
-            response = supabase.table("users").select("*").eq("id", user_id).limit(1).execute()
-            profile = response.data
-        except Exception as e:
-            logger.error(f"Failed to fetch user profile for {user_id}: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to fetch user profile")
+            result = supabase.table("users").select("count").limit(1).execute()
+            logger.info(f"Supabase connection test successful")
+        except Exception as query_error:
+            logger.warning(f"Supabase connection test query failed: {str(query_error)}")
+            # Continue anyway as this is just a verification
+    except Exception as e:
+        logger.critical(f"Failed to initialize Supabase client: {str(e)}", exc_info=True)
+        raise RuntimeError(f"Supabase initialization failed: {str(e)}")
 
-        if not profile:
-            logger.warning(f"User {user_id} authenticated but no profile found.")
-            raise HTTPException(status_code=404, detail="User profile not found")
 
-        logger.info(f"User {user_id} successfully validated.")
-        return User(
-            id=user_id,
-        )
+def decode_token(token: str) -> dict:
+    """
+    Verify a Supabase access token locally
+    Args:
+        token (str): The bearer token
+    Returns:
+        dict: The verified claims
+    """
+    # Decode the JWT and verify claims
+    payload = jwt.decode(
+        token,
+        SUPABASE_JWT_SECRET,
+        algorithms=["HS256"],
+        options={"verify_aud": False}
+    )
+
+    # Verify audience manually (Supabase default is 'authenticated')
+    if payload.get("aud") != "authenticated":
+        logger.warning("Invalid token: Incorrect audience")
+        raise HTTPException(status_code=401, detail="Invalid token: Invalid audience")
+
+    # Extract user details
+    if not payload.get("sub"):
+        logger.error("Token validation failed: Missing user_id")
+        raise HTTPException(status_code=400, detail="Token payload is missing required fields")
+
+    # Ensure at least one identifier is present (email or phone)
+    if not payload.get("email"):
+        logger.error("Token validation failed: Missing email")
+        raise HTTPException(status_code=400, detail="Token must contain email")
+
+    return payload
+
+
+async def validate_token(auth: HTTPAuthorizationCredentials = Security(auth_scheme)) -> User:
+    """
+    Authenticate a request from its bearer token. The signature is checked locally and
+    the principal comes from principal_cache, so no Supabase call is made per request.
+    """
+    token = auth.credentials
+    try:
+        payload = decode_token(token)
+        user = await principal_cache.get(payload, token)
+        logger.debug(f"User {user.id} successfully validated.")
+        return user
+    except (HTTPException, DependencyOverloaded):
+        raise
     except jwt.ExpiredSignatureError:
         logger.warning("Token expired")
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -141,17 +166,39 @@ def validate_token(auth: HTTPAuthorizationCredentials = Security(auth_scheme)) -
 
 
 
+async def optional_user(auth: Optional[HTTPAuthorizationCredentials] = Security(optional_auth_scheme)) -> Optional[User]:
+    """
+    The authenticated user if the request carries a bearer token, None for anonymous
+    requests. A token that is present but invalid is still rejected with 401.
+    """
+    if auth is None:
+        return None
+    return await validate_token(auth)
+
+
+def is_staff(user: User) -> bool:
+    return (user.role or "") in STAFF_ROLES
+
+
+async def user_from_token(token: str) -> User:
+    """Authenticate a raw access token (e.g. the token query parameter of a WebSocket)"""
+    return await validate_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+
 @router.post("/signup")
 async def signup(request: AuthUser):
     """Sign up a new user via Supabase and store them in PostgreSQL"""
+    if (request.role or "") in STAFF_ROLES:
+        raise HTTPException(status_code=403, detail="Staff accounts are created by the clinic")
     try:
         logger.info(f"User signup attempt for email: {request.email}")
-        redis = await get_redis_client()
 
         # Signup request to Supabase
         try:
-            response = supabase.auth.sign_up({"email": request.email, "password": request.password})
+            response = await call_auth(get_auth_client().sign_up, {"email": request.email, "password": request.password})
             logger.info(f"Supabase response: {response}")
+        except DependencyOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Supabase signup failed for {request.email}: {str(e)}")
             raise HTTPException(status_code=400, detail="Signup failed due to Supabase error")
@@ -186,8 +233,7 @@ async def signup(request: AuthUser):
         # Store session in Redis if session exists
         if access_token:
             try:
-                await redis.setex(f"session:{user_id}", 3600, access_token)
-                await redis.setex(f"refresh:{user_id}", 86400, refresh_token)
+                await session_store.save(user_id, access_token=access_token, refresh_token=refresh_token)
                 logger.info(f"Session stored in Redis for user {user_id}")
             except Exception as e:
                 logger.error(f"Redis storage failed for user {user_id}: {str(e)}")
@@ -199,6 +245,8 @@ async def signup(request: AuthUser):
             "requires_confirmation": session is None
         }
 
+    except DependencyOverloaded:
+        raise
     except Exception as e:
         logger.critical(f"Unexpected error during signup: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Unexpected server error during signup")
@@ -212,19 +260,23 @@ async def resend_otp(request: ResendOTPRequest):
 
         # Resend OTP request to Supabase
         try:
-            response = supabase.auth.resend({
+            response = await call_auth(get_auth_client().resend, {
                 "type": "signup",
                 "email": request.email,
                 # TODO: Add email redirect option if needed
                 # "options": {"email_redirect_to": EMAIL_REDIRECT_URL},
             })
             logger.info(f"Supabase OTP resend response: {response}")
+        except DependencyOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Failed to resend OTP for {request.email}: {str(e)}")
             raise HTTPException(status_code=500, detail="Supabase OTP resend failed")
 
         return {"message": "Verification email has been resent. Please check your inbox."}
 
+    except DependencyOverloaded:
+        raise
     except gotrue.errors.AuthApiError as e:
         logger.warning(f"Auth API error while resending OTP: {str(e)}")
 
@@ -248,7 +300,8 @@ async def reset_password(request: ResetPasswordRequest):
     try:
         # The redirect_to parameter should be your backend endpoint that will handle the token
         # This endpoint should extract the token from the URL and present a form for the new password
-        response = supabase.auth.reset_password_for_email(
+        response = await call_auth(
+            get_auth_client().reset_password_for_email,
             request.email,
             options={
                 "redirect_to": f"{os.environ.get('BACKEND_URL', 'http://localhost:8000')}/auth/password-reset-form"
@@ -269,6 +322,8 @@ async def reset_password(request: ResetPasswordRequest):
         return {"success": True,
                 "message": "If your email exists in our system, you will receive a password reset link."}
 
+    except DependencyOverloaded:
+        raise
     except Exception as e:
         print(f"Unexpected error during password reset: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -283,28 +338,32 @@ async def confirm_reset(request: UpdatePasswordRequest):
     along with the new password to set for the user account.
     """
     try:
-        # Set the Supabase session with the provided tokens
-        supabase.auth.set_session(request.access_token, request.refresh_token)
+        # The session only lives on this request's client, concurrent resets never see it
+        auth_client = get_auth_client()
+        await call_auth(auth_client.set_session, request.access_token, request.refresh_token)
 
         # Update the user's password
-        response = supabase.auth.update_user(
+        response = await call_auth(
+            auth_client.update_user,
             {"password": request.new_password}
         )
 
         # Check if the response contains a user object to confirm success
         if not response or not getattr(response, 'user', None):
-            logger.warning(f"Password reset failed for {request.email}: No user in response")
+            logger.warning("Password reset failed: No user in response")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Password update failed. Please try again or request a new reset link."
             )
 
-        logger.info(f"Password reset successful for user {request.email}")
+        logger.info(f"Password reset successful for user {response.user.id}")
         return {
             "success": True,
             "message": "Password has been successfully updated. You can now log in with your new password."
         }
 
+    except (HTTPException, DependencyOverloaded):
+        raise
     except gotrue.errors.AuthApiError as auth_error:
         # Handle Supabase auth-specific errors
         error_message = str(auth_error)
@@ -340,11 +399,11 @@ async def login(request: AuthUser, connection=Depends(get_postgres_connection)):
     """Authenticate user via Supabase, fetch user details from PostgreSQL, and store session in Redis."""
     try:
         logger.info(f"Login attempt for email: {request.email}")
-        redis = await get_redis_client()
 
         # Authenticate with Supabase
         try:
-            response = supabase.auth.sign_in_with_password({"email": request.email, "password": request.password})
+            response = await call_auth(get_auth_client().sign_in_with_password,
+                                       {"email": request.email, "password": request.password})
             logger.info(f"Supabase response: {response}")
         except gotrue.errors.AuthApiError as e:
             logger.error(f"Supabase authentication failed for {request.email}: {str(e)}")
@@ -388,9 +447,8 @@ async def login(request: AuthUser, connection=Depends(get_postgres_connection)):
 
         # Store user details in Redis
         try:
-            await redis.setex(f"user:{user_id}", 86400, json.dumps(user_data))
-            await redis.setex(f"session:{user_id}", 3600, access_token)
-            await redis.setex(f"refresh:{user_id}", 86400, refresh_token)
+            await session_store.save(user_id, access_token=access_token, refresh_token=refresh_token,
+                                     user_data=user_data)
             logger.info(f"User {user_id} session stored in Redis")
         except Exception as e:
             logger.error(f"Redis storage failed for user {user_id}: {str(e)}")
@@ -407,6 +465,8 @@ async def login(request: AuthUser, connection=Depends(get_postgres_connection)):
     except HTTPException as e:
         logger.error(f"Login error for {request.email}: {e.detail}")
         raise
+    except DependencyOverloaded:
+        raise
     except Exception as e:
         logger.critical(f"Unexpected error during login: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Unexpected server error occurred")
@@ -415,7 +475,6 @@ async def login(request: AuthUser, connection=Depends(get_postgres_connection)):
 @router.post("/refresh")
 async def refresh_token(request: RefreshRequest):
     """Refresh JWT session and keep user data in Redis"""
-    redis = await get_redis_client()
     refresh_token = request.refresh_token
 
     try:
@@ -423,8 +482,10 @@ async def refresh_token(request: RefreshRequest):
 
         # Attempt to refresh session via Supabase
         try:
-            response = supabase.auth.refresh_session(refresh_token)
+            response = await call_auth(get_auth_client().refresh_session, refresh_token)
             logger.info(f"Supabase response: {response}")
+        except DependencyOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Failed to refresh session with Supabase: {str(e)}")
             raise HTTPException(status_code=401, detail="Invalid refresh token")
@@ -437,51 +498,49 @@ async def refresh_token(request: RefreshRequest):
         new_refresh_token = response.session.refresh_token
         user_id = response.user.id
 
-        # Update Redis with new tokens
+        # Update Redis with new tokens and retrieve user data in one round trip
         try:
-            await redis.setex(f"session:{user_id}", 3600, new_access_token)
-            await redis.setex(f"refresh:{user_id}", 86400, new_refresh_token)
+            user_data = await session_store.rotate(user_id, new_access_token, new_refresh_token)
             logger.info(f"Refreshed tokens stored for user {user_id}")
         except Exception as e:
             logger.error(f"Redis storage failed for user {user_id}: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to update session in Redis")
 
-        # Retrieve user data from Redis
-        try:
-            user_data_raw = await redis.get(f"user:{user_id}")
-            if not user_data_raw:
-                logger.warning(f"User data missing in Redis for user {user_id}")
-                raise HTTPException(status_code=404, detail="User data not found")
-        except Exception as e:
-            logger.error(f"Redis retrieval failed for user {user_id}: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to retrieve user data from Redis")
+        if not user_data:
+            logger.warning(f"User data missing in Redis for user {user_id}")
+            raise HTTPException(status_code=404, detail="User data not found")
 
         logger.info(f"Token refresh successful for user {user_id}")
         return {
             "access_token": new_access_token,
             "token_type": "bearer",
-            "user": json.loads(user_data_raw)
+            "user": user_data
         }
 
     except HTTPException as e:
         logger.error(f"Refresh token error: {e.detail}")
         raise
+    except DependencyOverloaded:
+        raise
     except Exception as e:
         logger.critical(f"Unexpected error during token refresh: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Unexpected server error occurred")
 
 
 @router.get("/logout")
-async def logout(user: User = Depends(validate_token)):
-    """Logs out the user by deleting their session from Redis"""
-    redis = await get_redis_client()
+async def logout(auth: HTTPAuthorizationCredentials = Security(auth_scheme)):
+    """Logs out the user by deleting their session from Redis and revoking the access token"""
+    user = await validate_token(auth)
     user_id = user.id  # Extract user ID from the authenticated user
 
     try:
         logger.info(f"Logging out user {user_id}...")
 
         # Remove user data and tokens from Redis
-        deleted_keys = await redis.delete(f"user:{user_id}", f"session:{user_id}", f"refresh:{user_id}")
+        deleted_keys = await session_store.invalidate(user_id)
+
+        # Drop the cached principal and reject this token until it expires
+        await principal_cache.invalidate(user_id, decode_token(auth.credentials), auth.credentials)
 
         if deleted_keys > 0:
             logger.info(f"User {user_id} successfully logged out.")
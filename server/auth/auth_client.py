@@ -0,0 +1,106 @@
+import logging
+import os
+
+import httpx
+from gotrue import AsyncGoTrueClient
+from gotrue.errors import AuthApiError, AuthError, AuthRetryableError
+
+from utils.resilience import CircuitBreaker, RetryBudget, call_with_retries
+
+logger = logging.getLogger(__name__)
+
+# GoTrue endpoint, defaults to <SUPABASE_URL>/auth/v1. Point it at a local stand-in
+# (e.g. scripts/fake_gotrue.py) to run the auth endpoints without Supabase.
+GOTRUE_URL = os.getenv("GOTRUE_URL")
+AUTH_HTTP_TIMEOUT_SECONDS = float(os.getenv("AUTH_HTTP_TIMEOUT_SECONDS", "10"))
+AUTH_MAX_CONNECTIONS = int(os.getenv("AUTH_MAX_CONNECTIONS", "100"))
+AUTH_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AUTH_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# Shared connection pool used by every GoTrue call
+auth_http_client: httpx.AsyncClient = None
+_auth_url = None
+_auth_headers = None
+
+supabase_breaker = CircuitBreaker("supabase")
+supabase_retry_budget = RetryBudget("supabase")
+
+
+def init_auth_client(supabase_url: str, supabase_key: str, gotrue_url: str = None):
+    """
+    Create the pooled HTTP transport shared by all GoTrue clients
+
+    Args:
+        supabase_url (str): Supabase project URL
+        supabase_key (str): Service role key sent as apikey
+        gotrue_url (str): Override for the GoTrue endpoint
+    """
+    global auth_http_client, _auth_url, _auth_headers
+
+    _auth_url = gotrue_url or GOTRUE_URL or f"{supabase_url.rstrip('/')}/auth/v1"
+    _auth_headers = {"apiKey": supabase_key, "Authorization": f"Bearer {supabase_key}"}
+    auth_http_client = httpx.AsyncClient(
+        timeout=AUTH_HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=AUTH_MAX_CONNECTIONS,
+            max_keepalive_connections=AUTH_MAX_KEEPALIVE_CONNECTIONS
+        ),
+    )
+    logger.info(f"Async GoTrue transport initialized for {_auth_url}")
+
+
+async def close_auth_client():
+    """Close the shared HTTP connection pool"""
+    global auth_http_client
+    if auth_http_client:
+        await auth_http_client.aclose()
+    auth_http_client = None
+
+
+def get_auth_client() -> AsyncGoTrueClient:
+    """
+    Create a GoTrue client scoped to one request.
+
+    GoTrue clients hold the session they signed in with or set with set_session(),
+    so they are never shared between requests. Creating one is cheap (a few
+    microseconds): every client sends its requests through the shared
+    auth_http_client pool. Don't call close() on it, that would close the pool.
+    """
+    if not auth_http_client:
+        raise RuntimeError("GoTrue client is not initialized")
+    return AsyncGoTrueClient(
+        url=_auth_url,
+        headers=dict(_auth_headers),
+        # Sessions belong to the caller, the server never keeps or refreshes them
+        persist_session=False,
+        auto_refresh_token=False,
+        http_client=auth_http_client,
+    )
+
+
+def _is_outage(error):
+    """Network errors and 5xx answers; 4xx answers (bad password, expired token...) mean GoTrue is up"""
+    if isinstance(error, AuthRetryableError):
+        return True
+    if isinstance(error, AuthApiError):
+        return (error.status or 0) >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def _never_sent(error):
+    # GoTrue wraps transport errors, the original one is the exception's context
+    cause = error.__context__ if isinstance(error, AuthError) else error
+    return isinstance(cause, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+async def call_auth(operation, *args, **kwargs):
+    """
+    Await a GoTrue client call through the Supabase circuit breaker
+
+    Requests that never reached Supabase (connection failures) are retried within the
+    retry budget; others are not, since sign-ups and password changes aren't idempotent.
+
+    Raises:
+        CircuitOpenError: If Supabase is known to be down (answered with 503 + Retry-After)
+    """
+    return await call_with_retries(operation, *args, breaker=supabase_breaker, budget=supabase_retry_budget,
+                                   is_failure=_is_outage, should_retry=_never_sent, **kwargs)
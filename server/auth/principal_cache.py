@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from database.postgres import fetch_query
+from database.redis import get_redis_client, cached_mget, client_cache
+from database.session_store import session_store, user_key
+from models.Models import User
+from utils import metrics
+from utils.concurrency import DependencyOverloaded
+
+logger = logging.getLogger(__name__)
+
+# How long a verified principal's profile is trusted by this worker before it is checked against
+# Redis again. Revocations are checked on every request, cached or not.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+# Entries older than this fraction of the TTL are served and refreshed in the background
+PRINCIPAL_REFRESH_AFTER = float(os.getenv("PRINCIPAL_REFRESH_AFTER", "0.5"))
+
+
+def token_id(payload, token):
+    """
+    Revocation key of a token: its Supabase session (logging out ends the session, so
+    the tokens refreshed from it go with it), else its jti, else a hash of the token
+    """
+    if payload.get("session_id"):
+        return f"session:{payload['session_id']}"
+    if payload.get("jti"):
+        return f"jti:{payload['jti']}"
+    return "sha256:" + hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoked_key(user_id, revocation_id):
+    return f"revoked:{user_id}:{revocation_id}"
+
+
+class PrincipalCache:
+    """
+    Cache of principals whose JWT was verified and whose profile exists.
+
+    Lookups go to an in-process LRU keyed by (sub, token id), then to the Redis
+    user:{id} entry written by /login, and only then to the users table in Postgres
+    (which repopulates Redis). Revoked tokens are recorded in Redis as
+    revoked:{id}:{token id} until they expire; that key is read on every lookup,
+    LRU hits included (from the client-side cache when REDIS_CLIENT_CACHE is on), and
+    a failed read rejects the request rather than letting a revoked token through.
+    """
+
+    def __init__(self, ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS, max_entries=PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._tasks = set()
+
+    async def get(self, payload, token) -> User:
+        """
+        Resolve the principal of a verified token payload
+        Args:
+            payload (dict): Decoded and verified JWT claims
+            token (str): The raw token, identifies it when the claims don't
+        Returns:
+            User: The authenticated user
+        Raises:
+            HTTPException: 401 if the token was revoked, 404 if the user has no profile
+            DependencyOverloaded: If Redis can't tell whether the token was revoked
+        """
+        key = (str(payload["sub"]).strip(), token_id(payload, token))
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry:
+            user, cached_at, expires_at = entry
+            if now < expires_at:
+                await self._check_revoked(*key)
+                metrics.increment("auth.principal_cache.hits")
+                self._entries.move_to_end(key)
+                if now - cached_at > self.ttl_seconds * PRINCIPAL_REFRESH_AFTER:
+                    self._refresh_in_background(key, payload)
+                return user
+            self._entries.pop(key, None)
+
+        metrics.increment("auth.principal_cache.misses")
+        user = await self._load(key, payload)
+        self._store(key, payload, user)
+        return user
+
+    async def invalidate(self, user_id, payload=None, token=None):
+        """
+        Forget the cached principals of a user and, given a token, revoke it
+
+        Args:
+            user_id (str): User whose entries are dropped
+            payload (dict): Claims of the token to revoke until it expires
+            token (str): The raw token
+        """
+        user_id = str(user_id)
+        for key in [key for key in self._entries if key[0] == user_id]:
+            self._entries.pop(key, None)
+
+        if payload:
+            remaining = int(payload.get("exp", 0) - time.time())
+            if remaining > 0:
+                redis = await get_redis_client()
+                await redis.setex(revoked_key(user_id, token_id(payload, token)), remaining, "1")
+
+    async def _check_revoked(self, user_id, revocation_id):
+        try:
+            (revoked,) = await cached_mget(revoked_key(user_id, revocation_id))
+        except Exception as e:
+            raise self._revocation_unknown(user_id, e)
+        if revoked:
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    def _revocation_unknown(self, user_id, error):
+        # Fail closed: without Redis a logged-out token can't be told apart from a live one
+        metrics.increment("auth.principal_cache.revocation_errors")
+        logger.warning(f"Revocation lookup in Redis failed for {user_id}: {str(error)}")
+        return DependencyOverloaded("redis", retry_after=1)
+
+    async def _load(self, key, payload) -> User:
+        user_id, revocation_id = key
+        try:
+            user_data_raw, revoked = await cached_mget(user_key(user_id), revoked_key(user_id, revocation_id))
+        except Exception as e:
+            raise self._revocation_unknown(user_id, e)
+
+        if revoked:
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        if user_data_raw:
+            metrics.increment("auth.principal_cache.redis_hits")
+            return User(id=user_id)
+
+        # Not logged in through this deployment (or the entry expired), check the profile itself
+        metrics.increment("auth.principal_cache.profile_lookups")
+        rows = await fetch_query("SELECT id, email, role, firstname, lastname FROM users WHERE id = $1", user_id)
+        if not rows:
+            logger.warning(f"User {user_id} authenticated but no profile found.")
+            raise HTTPException(status_code=404, detail="User profile not found")
+
+        user_record = rows[0]
+        user_data = {
+            "user_id": user_id,
+            "firstname": user_record["firstname"],
+            "lastname": user_record["lastname"],
+            "email": user_record["email"],
+            "role": user_record["role"],
+        }
+        try:
+            await session_store.save(user_id, user_data=user_data)
+        except Exception as e:
+            logger.warning(f"Failed to cache profile of {user_id} in Redis: {str(e)}")
+        return User(id=user_id)
+
+    def _store(self, key, payload, user):
+        now = time.monotonic()
+        # Never trust an entry past the expiry of its token
+        token_remaining = payload.get("exp", time.time() + self.ttl_seconds) - time.time()
+        self._entries[key] = (user, now, now + min(self.ttl_seconds, token_remaining))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _refresh_in_background(self, key, payload):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key, payload):
+        try:
+            user = await self._load(key, payload)
+            if key in self._entries:
+                self._store(key, payload, user)
+            metrics.increment("auth.principal_cache.refreshes")
+        except Exception as e:
+            # Revoked or deleted: drop the entry so the next request fails through _load
+            self._entries.pop(key, None)
+            logger.info(f"Dropped cached principal for {key[0]}: {getattr(e, 'detail', str(e))}")
+        finally:
+            self._refreshing.discard(key)
+
+    def on_redis_invalidate(self, key):
+        """Drop the principals of a user whose user:{id} entry changed in Redis (any worker)"""
+        if key is None:
+            self._entries.clear()
+        elif key.startswith("user:"):
+            user_id = key[len("user:"):]
+            for cached in [cached for cached in self._entries if cached[0] == user_id]:
+                self._entries.pop(cached, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache()
+# With REDIS_CLIENT_CACHE on, a logout on another worker evicts the principal here right away
+client_cache.add_listener(principal_cache.on_redis_invalidate)
+
+metrics.register_gauge("auth.principal_cache.entries", lambda: len(principal_cache))
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a deferred audio result can be fetched after the chat turn
+AUDIO_JOB_TTL_SECONDS = int(os.getenv("AUDIO_JOB_TTL_SECONDS", "300"))
+AUDIO_JOB_MAX_ENTRIES = int(os.getenv("AUDIO_JOB_MAX_ENTRIES", "1000"))
+
+
+class AudioJobStore:
+    """
+    In-process registry of speech synthesis tasks started for deferred audio.
+
+    /chat returns an audio id right after Lex answers and keeps synthesizing in the
+    background; GET /chat/audio/{audio_id} waits for the matching task. Audio ids are
+    content addresses, so concurrent requests for the same text share one task.
+    """
+
+    def __init__(self, ttl_seconds=AUDIO_JOB_TTL_SECONDS, max_entries=AUDIO_JOB_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._jobs = {}
+
+    def submit(self, audio_id, coro):
+        """
+        Start a speech task and register it, unless one is already running for audio_id
+
+        Args:
+            audio_id (str): Content address of the audio
+            coro: Coroutine producing the audio bytes
+        Returns:
+            asyncio.Task: The task producing the audio (shared with earlier submissions)
+        """
+        running = self.running(audio_id)
+        if running:
+            coro.close()
+            return running
+
+        self._evict_expired()
+        task = asyncio.create_task(coro)
+        task.add_done_callback(self._log_failure)
+        self._jobs[audio_id] = (task, time.monotonic())
+        return task
+
+    def running(self, audio_id):
+        """
+        Returns:
+            asyncio.Task: The unfinished task producing audio_id, or None
+        """
+        entry = self._jobs.get(audio_id)
+        return entry[0] if entry and not entry[0].done() else None
+
+    async def get(self, audio_id, timeout=None):
+        """
+        Wait for a deferred audio result
+
+        Args:
+            audio_id (str): Id passed to submit()
+            timeout (float): Maximum time to wait for synthesis to finish
+        Returns:
+            bytes: The audio, or None if the id is unknown or expired
+        """
+        entry = self._jobs.get(audio_id)
+        if not entry:
+            return None
+        task, created_at = entry
+        if time.monotonic() - created_at > self.ttl_seconds:
+            self._jobs.pop(audio_id, None)
+            return None
+        return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [key for key, (_, created_at) in self._jobs.items() if now - created_at > self.ttl_seconds]
+        for key in expired:
+            self._jobs.pop(key, None)
+
+        # Drop the oldest jobs if the store is still full (dicts keep insertion order)
+        while len(self._jobs) >= self.max_entries:
+            oldest = next(iter(self._jobs))
+            task, _ = self._jobs.pop(oldest)
+            task.cancel()
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Deferred speech synthesis failed: {str(task.exception())}")
+
+
+class AudioStreamRegistry:
+    """
+    In-process registry of reply texts waiting to be streamed.
+
+    /chat registers the text under its audio id and returns a stream URL; the
+    stream endpoint synthesizes the text when the client connects.
+    """
+
+    def __init__(self, ttl_seconds=AUDIO_JOB_TTL_SECONDS, max_entries=AUDIO_JOB_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._texts = {}
+
+    def register(self, audio_id, text):
+        """Remember the text to synthesize for audio_id"""
+        self._evict_expired()
+        self._texts.pop(audio_id, None)
+        self._texts[audio_id] = (text, time.monotonic())
+
+    def get(self, audio_id):
+        """
+        Returns:
+            str: The registered text, or None if the id is unknown or expired
+        """
+        entry = self._texts.get(audio_id)
+        if not entry:
+            return None
+        text, created_at = entry
+        if time.monotonic() - created_at > self.ttl_seconds:
+            self._texts.pop(audio_id, None)
+            return None
+        return text
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [key for key, (_, created_at) in self._texts.items() if now - created_at > self.ttl_seconds]
+        for key in expired:
+            self._texts.pop(key, None)
+
+        while len(self._texts) >= self.max_entries:
+            self._texts.pop(next(iter(self._texts)))
+
+
+audio_jobs = AudioJobStore()
+audio_streams = AudioStreamRegistry()
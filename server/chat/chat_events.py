@@ -0,0 +1,453 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from database.postgres import db_connection, transaction
+from database.redis import get_redis_client
+from chat.transcripts import SCHEMA as TRANSCRIPT_SCHEMA, TRANSCRIPT_COLUMNS, transcripts
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# "stream": one XADD per turn, drained into Postgres by consumer-group workers
+# "local": the in-process transcript queue, conversation state written straight to Redis
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "stream")
+CHAT_EVENTS_STREAM = os.getenv("CHAT_EVENTS_STREAM", "chat:events")
+CHAT_EVENTS_GROUP = os.getenv("CHAT_EVENTS_GROUP", "chat-writers")
+# Approximate cap on the stream length; only reached if the consumers stop
+CHAT_EVENTS_MAXLEN = int(os.getenv("CHAT_EVENTS_MAXLEN", "200000"))
+CHAT_EVENTS_BATCH_SIZE = int(os.getenv("CHAT_EVENTS_BATCH_SIZE", "500"))
+CHAT_EVENTS_BLOCK_MS = int(os.getenv("CHAT_EVENTS_BLOCK_MS", "1000"))
+# Events a consumer read but never acknowledged are taken over after this long
+CHAT_EVENTS_CLAIM_IDLE_MS = int(os.getenv("CHAT_EVENTS_CLAIM_IDLE_MS", "60000"))
+# Failed writes after which an event is moved to the dead-letter stream. Only failures
+# while the database is taking other writes count, so an outage never dead-letters events
+CHAT_EVENTS_MAX_DELIVERIES = int(os.getenv("CHAT_EVENTS_MAX_DELIVERIES", "5"))
+# Events are drained by scripts/chat_events_worker.py; set to true to also run a consumer
+# inside each API worker (single-process deployments)
+CHAT_EVENTS_CONSUMER_IN_APP = os.getenv("CHAT_EVENTS_CONSUMER_IN_APP", "false").lower() == "true"
+CONVERSATION_STATE_TTL_SECONDS = 3600
+
+DEAD_LETTER_STREAM = f"{CHAT_EVENTS_STREAM}:dead"
+EVENT_VERSION = "1"
+# Transcript row ids are derived from the turn id, so replayed events upsert the same rows
+TRANSCRIPT_NAMESPACE = uuid.UUID("0f6f1f0e-5d0c-4c55-9a43-7c1d2f1c3b6a")
+
+SCHEMA = TRANSCRIPT_SCHEMA + """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id text PRIMARY KEY,
+    user_id uuid,
+    last_intent text,
+    slots jsonb,
+    last_event_at timestamptz NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS chat_intent_daily (
+    day date NOT NULL,
+    intent text NOT NULL,
+    source text NOT NULL,
+    turns bigint NOT NULL,
+    PRIMARY KEY (day, intent, source)
+);
+"""
+
+
+def conversation_state_key(user_id):
+    return f"chat_session:{user_id}"
+
+
+def _user_uuid(user_id):
+    try:
+        return uuid.UUID(str(user_id)) if user_id else None
+    except ValueError:
+        return None
+
+
+async def publish_turn(session_id, user_id, message, bot_response):
+    """Append one chat turn to the events stream, falling back to the local transcript queue"""
+    event = {
+        "v": EVENT_VERSION,
+        "turn_id": str(uuid.uuid4()),
+        "ts": str(time.time()),
+        "session_id": session_id,
+        "user_id": user_id or "",
+        "message": message,
+        "reply": bot_response["text"],
+        "intent": bot_response.get("intent") or "",
+        "source": bot_response.get("source") or "",
+        "slots": json.dumps(bot_response.get("slots")) if bot_response.get("slots") else "",
+    }
+    try:
+        redis = await get_redis_client()
+        await redis.xadd(CHAT_EVENTS_STREAM, event, maxlen=CHAT_EVENTS_MAXLEN, approximate=True)
+        metrics.increment("chat.events.published")
+    except Exception as e:
+        metrics.increment("chat.events.publish_failures")
+        logger.error(f"Failed to publish chat event, keeping the transcript only: {str(e)}")
+        transcripts.record(session_id, user_id, message, event["reply"], event["intent"] or None,
+                           event["source"] or None)
+
+
+async def store_conversation_state(user_id: str, session_id: str, bot_response: dict):
+    """Store conversation state for an identified user"""
+    try:
+        redis = await get_redis_client()
+        await redis.set(conversation_state_key(user_id), json.dumps({
+            "session_id": session_id,
+            "last_intent": bot_response.get("intent"),
+            "slots": bot_response.get("slots")
+        }), ex=CONVERSATION_STATE_TTL_SECONDS)
+    except Exception as e:
+        logger.error(f"Failed to store conversation state: {str(e)}")
+        # Continue even if Redis storage fails
+
+
+def record_turn(session_id, user_id, message, bot_response, run_in_background):
+    """
+    Hand a finished chat turn to the write-behind layer; never waits for storage
+    Args:
+        bot_response (dict): get_bot_response() result (text, intent, source, slots)
+        run_in_background: The chat handler's task scheduler
+    """
+    if CHAT_WRITE_BEHIND == "stream":
+        run_in_background(publish_turn(session_id, user_id, message, bot_response))
+    else:
+        transcripts.record(session_id, user_id, message, bot_response["text"], bot_response.get("intent"),
+                           bot_response.get("source"))
+        if user_id:
+            run_in_background(store_conversation_state(user_id, session_id, bot_response))
+
+
+def parse_event(fields):
+    """
+    Returns:
+        dict: The event with typed fields
+    Raises:
+        ValueError: Malformed or unsupported event
+    """
+    if fields.get("v") != EVENT_VERSION:
+        raise ValueError(f"Unsupported event version {fields.get('v')!r}")
+    turn_id = uuid.UUID(fields["turn_id"])
+    created_at = datetime.fromtimestamp(float(fields["ts"]), timezone.utc)
+    return {
+        "turn_id": turn_id,
+        "created_at": created_at,
+        "session_id": fields["session_id"],
+        "user_id": fields["user_id"] or None,
+        "message": fields["message"],
+        "reply": fields["reply"],
+        "intent": fields["intent"] or None,
+        "source": fields["source"] or None,
+        "slots": json.loads(fields["slots"]) if fields["slots"] else None,
+    }
+
+
+async def write_events(events):
+    """
+    Apply a batch of events in one transaction. Safe to repeat for the same events:
+    transcript rows have deterministic ids and are inserted ON CONFLICT DO NOTHING,
+    intent counters only count rows that were actually inserted, and session state
+    only moves forward in time.
+    """
+    rows = []
+    for event in events:
+        user_uuid = _user_uuid(event["user_id"])
+        rows.append((uuid.uuid5(TRANSCRIPT_NAMESPACE, f"{event['turn_id']}:user"), event["session_id"], user_uuid,
+                     "user", event["message"], None, None, event["created_at"]))
+        # One microsecond later so the reply sorts after the message in the history
+        rows.append((uuid.uuid5(TRANSCRIPT_NAMESPACE, f"{event['turn_id']}:bot"), event["session_id"], user_uuid,
+                     "bot", event["reply"], event["intent"], event["source"],
+                     event["created_at"] + timedelta(microseconds=1)))
+
+    latest = {}
+    for event in events:
+        if event["session_id"] not in latest or latest[event["session_id"]]["created_at"] <= event["created_at"]:
+            latest[event["session_id"]] = event
+
+    async with transaction() as connection:
+        await connection.execute(
+            "CREATE TEMP TABLE _chat_events_batch (LIKE chat_transcripts INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        await connection.copy_records_to_table("_chat_events_batch", records=rows, columns=list(TRANSCRIPT_COLUMNS))
+        await connection.execute(
+            """
+            WITH inserted AS (
+                INSERT INTO chat_transcripts SELECT * FROM _chat_events_batch
+                ON CONFLICT (id) DO NOTHING
+                RETURNING role, intent, source, created_at
+            )
+            INSERT INTO chat_intent_daily (day, intent, source, turns)
+            SELECT (created_at AT TIME ZONE 'UTC')::date, coalesce(intent, ''), coalesce(source, ''), count(*)
+            FROM inserted WHERE role = 'bot'
+            GROUP BY 1, 2, 3
+            ON CONFLICT (day, intent, source) DO UPDATE SET turns = chat_intent_daily.turns + EXCLUDED.turns
+            """
+        )
+        await connection.executemany(
+            """
+            INSERT INTO chat_sessions (session_id, user_id, last_intent, slots, last_event_at)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (session_id) DO UPDATE
+            SET user_id = coalesce(EXCLUDED.user_id, chat_sessions.user_id), last_intent = EXCLUDED.last_intent,
+                slots = EXCLUDED.slots, last_event_at = EXCLUDED.last_event_at
+            WHERE chat_sessions.last_event_at <= EXCLUDED.last_event_at
+            """,
+            [(event["session_id"], _user_uuid(event["user_id"]), event["intent"],
+              json.dumps(event["slots"]) if event["slots"] is not None else None, event["created_at"])
+             for event in latest.values()]
+        )
+
+    # Short-lived copy of each identified user's conversation state, as before the stream
+    redis = await get_redis_client()
+    async with redis.pipeline(transaction=False) as pipe:
+        for event in latest.values():
+            if event["user_id"]:
+                pipe.set(conversation_state_key(event["user_id"]), json.dumps({
+                    "session_id": event["session_id"],
+                    "last_intent": event["intent"],
+                    "slots": event["slots"],
+                }), ex=CONVERSATION_STATE_TTL_SECONDS)
+        await pipe.execute()
+
+
+class ChatEventConsumer:
+    """
+    Drains the chat events stream into Postgres as one member of a consumer group.
+
+    Delivery is at-least-once: events are acknowledged only after their batch is
+    committed, a consumer first re-reads its own unacknowledged events after a
+    restart, and events left pending by a dead consumer are claimed after
+    CHAT_EVENTS_CLAIM_IDLE_MS. write_events() makes the repeats harmless. An event
+    is dead-lettered only after failing CHAT_EVENTS_MAX_DELIVERIES writes that the
+    database could otherwise take; while Postgres is down the batch is simply retried.
+    """
+
+    def __init__(self, name=None, batch_size=CHAT_EVENTS_BATCH_SIZE):
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.group_info = {}
+        # Message id -> writes that failed while the database was up
+        self.write_failures = {}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            await self.leave_group()
+        self._task = None
+
+    async def leave_group(self):
+        """
+        Remove this consumer from the group, so restarts under new names don't pile up
+        consumers. Kept while it still has pending events: deleting it would drop them,
+        they are claimed by another consumer (or re-read under the same name) instead.
+        """
+        try:
+            redis = await get_redis_client()
+            if await redis.xpending_range(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP, min="-", max="+", count=1,
+                                          consumername=self.name):
+                return
+            await redis.xgroup_delconsumer(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP, self.name)
+        except Exception as e:
+            logger.warning(f"Failed to remove chat event consumer {self.name} from the group: {str(e)}")
+
+    async def ensure_group(self, redis):
+        try:
+            await redis.xgroup_create(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def setup(self):
+        redis = await get_redis_client()
+        await self.ensure_group(redis)
+        async with db_connection() as connection:
+            await connection.execute(SCHEMA)
+        logger.info(f"Chat event consumer {self.name} reading {CHAT_EVENTS_STREAM}")
+        return redis
+
+    async def run(self):
+        redis = None
+        # Own pending events first (left over from a crash), then new ones
+        pending = True
+        last_claim = last_info = 0
+        failures = 0
+        while True:
+            try:
+                if redis is None:
+                    redis = await self.setup()
+                now = time.monotonic()
+                if now - last_info > 5:
+                    await self.refresh_group_info(redis)
+                    last_info = now
+                if now - last_claim > CHAT_EVENTS_CLAIM_IDLE_MS / 1000:
+                    if await self.claim_abandoned(redis):
+                        pending = True
+                    last_claim = now
+
+                response = await redis.xreadgroup(
+                    CHAT_EVENTS_GROUP, self.name, {CHAT_EVENTS_STREAM: "0" if pending else ">"},
+                    count=self.batch_size, block=None if pending else CHAT_EVENTS_BLOCK_MS
+                )
+                messages = response[0][1] if response else []
+                if pending and not messages:
+                    pending = False
+                    continue
+                await self.process(redis, messages)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                metrics.increment("chat.events.consumer_errors")
+                logger.error(f"Chat event consumer failed: {str(e)}")
+                # Unacknowledged events are re-read from the pending list on the next pass
+                pending = True
+                await asyncio.sleep(min(30, 0.5 * 2 ** failures))
+
+    async def process(self, redis, messages):
+        started = time.perf_counter()
+        events, ids, poison, trimmed = [], [], [], []
+        for message_id, fields in messages:
+            if not fields:
+                # Pending entry whose stream entry was trimmed by MAXLEN (read back as {}): nothing left to write
+                trimmed.append(message_id)
+                continue
+            try:
+                events.append(parse_event(fields))
+                ids.append(message_id)
+            except (KeyError, ValueError) as e:
+                logger.error(f"Malformed chat event {message_id}: {str(e)}")
+                poison.append((message_id, fields))
+
+        if events:
+            try:
+                await write_events(events)
+            except Exception as e:
+                written_ids, failed_ids = await self.isolate_failures(ids, events, e)
+                if not written_ids and not await self.database_reachable():
+                    # An outage, not bad events: leave them pending without spending their write attempts
+                    raise
+                # The database took writes, so these events are what fails
+                fields_by_id = dict(messages)
+                for message_id in failed_ids:
+                    self.write_failures[message_id] = self.write_failures.get(message_id, 0) + 1
+                    if self.write_failures[message_id] >= CHAT_EVENTS_MAX_DELIVERIES:
+                        del self.write_failures[message_id]
+                        logger.error(f"Chat event {message_id} failed {CHAT_EVENTS_MAX_DELIVERIES} times, "
+                                     f"moving it to {DEAD_LETTER_STREAM}")
+                        poison.append((message_id, fields_by_id[message_id]))
+                events = [event for message_id, event in zip(ids, events) if message_id in written_ids]
+                ids = written_ids
+            for message_id in ids:
+                self.write_failures.pop(message_id, None)
+
+        if trimmed:
+            metrics.increment("chat.events.trimmed", len(trimmed))
+            logger.error(f"Acknowledging {len(trimmed)} pending chat events trimmed from {CHAT_EVENTS_STREAM} "
+                         f"before they were written")
+        acked = ids + trimmed + [message_id for message_id, _ in poison]
+        if acked:
+            async with redis.pipeline(transaction=True) as pipe:
+                for message_id, fields in poison:
+                    if fields:
+                        pipe.xadd(DEAD_LETTER_STREAM, fields, maxlen=CHAT_EVENTS_MAXLEN, approximate=True)
+                pipe.xack(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP, *acked)
+                await pipe.execute()
+
+        now = time.time()
+        metrics.increment("chat.events.processed", len(events))
+        metrics.increment("chat.events.dead_lettered", len(poison))
+        metrics.observe("chat.events.batch_seconds", time.perf_counter() - started)
+        for event in events:
+            metrics.observe("chat.events.lag_seconds", now - event["created_at"].timestamp())
+
+    async def isolate_failures(self, ids, events, error):
+        """
+        Write the events of a failed batch one by one
+        Returns:
+            tuple: (ids written, ids that failed)
+        """
+        if len(events) == 1:
+            return [], list(ids)
+        logger.warning(f"Chat event batch failed ({str(error)}), writing events one by one")
+        written_ids, failed_ids = [], []
+        for message_id, event in zip(ids, events):
+            try:
+                await write_events([event])
+                written_ids.append(message_id)
+            except Exception as e:
+                metrics.increment("chat.events.write_failures")
+                logger.error(f"Failed to write chat event {message_id}: {str(e)}")
+                failed_ids.append(message_id)
+        return written_ids, failed_ids
+
+    async def database_reachable(self):
+        try:
+            async with db_connection() as connection:
+                await connection.fetchval("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    async def claim_abandoned(self, redis):
+        """
+        Take over events another consumer read but never acknowledged
+        Returns:
+            int: Number of events claimed, they are now in this consumer's pending list
+        """
+        start = "0-0"
+        total = 0
+        while True:
+            # Redis 7 adds a third element (ids of deleted entries), Redis 6.2 returns two
+            response = await redis.xautoclaim(
+                CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP, self.name, CHAT_EVENTS_CLAIM_IDLE_MS,
+                start_id=start, count=self.batch_size
+            )
+            start, claimed = response[0], response[1]
+            total += len(claimed)
+            if start == "0-0" or not claimed:
+                break
+        if total:
+            metrics.increment("chat.events.claimed", total)
+        return total
+
+    async def refresh_group_info(self, redis):
+        """Cache the group's backlog for the chat.events gauge"""
+        for group in await redis.xinfo_groups(CHAT_EVENTS_STREAM):
+            if group["name"] == CHAT_EVENTS_GROUP:
+                self.group_info = {
+                    "pending": group["pending"],
+                    # Entries not yet delivered to any consumer (Redis 7+)
+                    "lag": group.get("lag"),
+                    "consumers": group["consumers"],
+                }
+
+
+chat_event_consumer = ChatEventConsumer()
+metrics.register_gauge("chat.events", lambda: chat_event_consumer.group_info)
+
+
+async def init_chat_events():
+    if CHAT_WRITE_BEHIND != "stream":
+        return
+    if CHAT_EVENTS_CONSUMER_IN_APP:
+        chat_event_consumer.start()
+    else:
+        logger.info(f"Chat events in {CHAT_EVENTS_STREAM} are written by scripts/chat_events_worker.py")
+
+
+async def close_chat_events():
+    await chat_event_consumer.stop()
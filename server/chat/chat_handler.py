@@ -1,94 +1,304 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
 import uuid
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-from database.redis import get_redis_client
-import json
-from utils.lex_utils import init_lex_client, send_message_to_lex
-from utils.speech_service import SpeechService
+from datetime import datetime
+from typing import Literal, Optional
+from utils import lex_utils, metrics
+from utils.lex_utils import init_async_lex_client
+from utils.speech_service import get_speech_service, polly_breaker
+from utils.audio_cache import audio_cache
+from utils.concurrency import DependencyOverloaded
+from utils.resilience import CLOSED
+from chat.audio_jobs import audio_jobs, audio_streams
+from chat.fast_path import get_bot_response
+from chat.transcripts import fetch_history
+from chat.chat_events import record_turn
+from auth import auth
+from auth.auth import optional_user, validate_token
+from models.Models import User
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize Lex client on module load
-lex_initialized = init_lex_client()
+# Strong references to fire-and-forget side effects so they are not garbage collected
+_background_tasks = set()
+
+# How long GET /chat/audio/{audio_id} waits for a deferred synthesis to finish
+AUDIO_FETCH_TIMEOUT_SECONDS = float(os.getenv("AUDIO_FETCH_TIMEOUT_SECONDS", "10"))
+# Audio ids are content addresses, so the client may keep the bytes; shared caches may not, a
+# reply can be personal (a booking confirmation)
+AUDIO_CACHE_CONTROL = os.getenv("AUDIO_CACHE_CONTROL", "private, max-age=86400, immutable")
+# Audio URLs are signed with this key (shared by all workers; derived from the Supabase JWT
+# secret when unset). An audio id is a hash of the reply text, so without the signature anyone
+# could fetch, or confirm a guess of, another patient's reply
+AUDIO_URL_SECRET = os.getenv("AUDIO_URL_SECRET")
+# Longest a chat turn waits for its speech (for a WebSocket stream, for the first chunk). Past
+# it the text goes out alone: SPEECH_BUDGET_OVERRUN=defer finishes the audio for
+# GET /chat/audio/{audio_id}, drop sends the reply without audio.
+SPEECH_LATENCY_BUDGET_SECONDS = float(os.getenv("SPEECH_LATENCY_BUDGET_SECONDS", "1.5"))
+SPEECH_BUDGET_OVERRUN = os.getenv("SPEECH_BUDGET_OVERRUN", "defer")
 
 class ChatMessage(BaseModel):
     message: str
     session_id: Optional[str] = None
-    user_id: Optional[str] = None
+    # "inline" waits for the audio to be ready, "deferred" returns before synthesis finishes,
+    # "stream" returns a URL that relays Polly's audio as it is produced, "none" skips speech
+    audio: Literal["inline", "deferred", "stream", "none"] = "inline"
 
 class ChatResponse(BaseModel):
     text: str
     intent: Optional[str] = None
     status: str
-    audio_base64: Optional[str] = None # Add audio_base64 to the response
+    audio_url: Optional[str] = None # Binary audio served by GET /chat/audio/{audio_id}
+    # "ready", "pending" (still being synthesized), "dropped" or "unavailable" (Polly failing)
+    audio_status: Optional[str] = None
+
+
+def _audio_signature(audio_id: str) -> str:
+    secret = AUDIO_URL_SECRET or f"audio-url:{auth.SUPABASE_JWT_SECRET or ''}"
+    return hmac.new(secret.encode(), audio_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def audio_url(audio_id: str, stream: bool = False) -> str:
+    """URL of GET /chat/audio/{audio_id} (or its /stream variant), signed for the client it is handed to"""
+    return f"/chat/audio/{audio_id}{'/stream' if stream else ''}?sig={_audio_signature(audio_id)}"
+
+
+def check_audio_signature(audio_id: str, sig: str):
+    if not hmac.compare_digest(sig or "", _audio_signature(audio_id)):
+        raise HTTPException(status_code=403, detail="Invalid audio URL")
+
+
+def run_in_background(coro):
+    """Schedule a non-critical side effect without making the response wait for it"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def speech_over_budget(audio_id):
+    """
+    Record a synthesis that missed SPEECH_LATENCY_BUDGET_SECONDS
+    Returns:
+        tuple: (audio id or None, audio status) per SPEECH_BUDGET_OVERRUN
+    """
+    metrics.increment("chat.speech.over_budget")
+    if SPEECH_BUDGET_OVERRUN == "drop":
+        # The Polly request already in flight can't be aborted; its audio still lands in the cache
+        return None, "dropped"
+    return audio_id, "pending"
+
+
+async def synthesize_speech(text: str, budget: float = SPEECH_LATENCY_BUDGET_SECONDS):
+    """
+    Make sure the audio for text is in the speech cache, calling AWS Polly on a miss,
+    but wait at most budget seconds for it
+
+    Returns:
+        tuple: (audio id or None, audio status: "ready", "pending", "dropped" or "unavailable")
+    """
+    speech_service = get_speech_service()
+    audio_id = speech_service.cache_key(text)
+    started = time.perf_counter()
+    # Registered as a deferred job so a reply sent without its audio can still fetch it
+    task = audio_jobs.submit(audio_id, speech_service.get_audio(text))
+    try:
+        await asyncio.wait_for(asyncio.shield(task), timeout=budget)
+        metrics.observe("chat.speech.wait_seconds", time.perf_counter() - started)
+        metrics.increment("chat.speech.within_budget")
+        return audio_id, "ready"
+    except asyncio.TimeoutError:
+        metrics.observe("chat.speech.wait_seconds", time.perf_counter() - started)
+        return speech_over_budget(audio_id)
+    except DependencyOverloaded:
+        # Polly's circuit is open or its queue is full: answer with text only
+        metrics.increment("chat.speech.unavailable")
+        return None, "unavailable"
+    except Exception as e:
+        logger.error(f"Error generating speech: {str(e)}")
+        metrics.increment("chat.speech.failed")
+        return None, "unavailable"
+
+
+def submit_deferred_speech(text: str):
+    """Start synthesis in the background and return the audio id it will be stored under"""
+    speech_service = get_speech_service()
+    audio_id = speech_service.cache_key(text)
+    audio_jobs.submit(audio_id, speech_service.get_audio(text))
+    return audio_id
+
 
 @router.post("/chat")
-async def process_chat_message(request: ChatMessage):
-    """Process user message and return a response from Lex"""
+async def process_chat_message(request: ChatMessage, user: Optional[User] = Depends(optional_user)):
+    """
+    Process user message and return a response from Lex. Signed-in users (bearer token)
+    get the turn saved to their /chat/history; anonymous chats are kept by session only.
+    """
     try:
         logger.info(f"Received chat message: {request.message}")
         
-        # Ensure Lex client is initialized
-        if not lex_initialized:
-            if not init_lex_client():
-                logger.error("Failed to initialize Lex client")
-                return {"text": "Sorry, the dental assistant service is currently unavailable.", "status": "error"}
-        
         # Generate or use existing session ID
         session_id = request.session_id or str(uuid.uuid4())
         
-        # Send the message to Lex
-        lex_response = send_message_to_lex(session_id, request.message)
+        # Stage 1: answer locally if it's a known FAQ, otherwise send the message to Lex
+        # (the only step the text response depends on)
+        lex_response = await get_bot_response(session_id, request.message, str(user.id) if user else None)
 
         if "error" in lex_response:
             logger.error(f"Error from Lex: {lex_response['error']}")
             return {"text": lex_response["text"], "status": "error"}
-        
-        # Request AWS Polly for the audio
-        speech_service = SpeechService()
-        audio_base64 = speech_service.generate_speech(lex_response["text"])
-
-        # Store conversation state if user is identified
-        if request.user_id:
-            try:
-                redis = await get_redis_client()
-                await redis.setex(
-                    f"chat_session:{request.user_id}", 
-                    3600,  # 1 hour expiration
-                    json.dumps({
-                        "session_id": session_id,
-                        "last_intent": lex_response.get("intent"),
-                        "slots": lex_response.get("slots")
-                    })
-                )
-            except Exception as e:
-                logger.error(f"Failed to store conversation state: {str(e)}")
-                # Continue even if Redis storage fails
-        
-        return {
+
+        response = {
             "text": lex_response["text"],
             "intent": lex_response.get("intent"),
             "status": "ok",
             "session_id": session_id,
-            "audio_base64": audio_base64 
         }
-        
+
+        # Stage 2: side effects run alongside speech synthesis and never delay the response
+        record_turn(session_id, str(user.id) if user else None, request.message, lex_response, run_in_background)
+
+        audio_id = None
+        if request.audio == "inline":
+            audio_id, response["audio_status"] = await synthesize_speech(lex_response["text"])
+        elif request.audio != "none" and polly_breaker.is_open():
+            # Polly is known to be down, don't hand out audio URLs that would fail
+            metrics.increment("chat.speech.unavailable")
+            response["audio_status"] = "unavailable"
+        elif request.audio == "deferred":
+            audio_id = submit_deferred_speech(lex_response["text"])
+            response["audio_status"] = "pending"
+        elif request.audio == "stream":
+            speech_service = get_speech_service()
+            stream_id = speech_service.cache_key(lex_response["text"])
+            audio_streams.register(stream_id, lex_response["text"])
+            response["audio_url"] = audio_url(stream_id, stream=True)
+            response["audio_status"] = "pending"
+
+        if audio_id:
+            response["audio_url"] = audio_url(audio_id)
+
+        return response
+
+    except DependencyOverloaded:
+        # Answered with 503 + Retry-After by the app's exception handler
+        raise
     except Exception as e:
         logger.error(f"Error processing chat message: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+@router.get("/chat/audio/{audio_id}")
+async def get_chat_audio(request: Request, audio_id: str = Path(..., pattern="^[0-9a-f]{64}$"),
+                         sig: Optional[str] = None):
+    """Serve the raw audio of a chat turn referenced by the audio_url of /chat"""
+    check_audio_signature(audio_id, sig)
+    etag = f'"{audio_id}"'
+    cache_headers = {"Cache-Control": AUDIO_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    audio = await audio_cache.get(audio_id)
+    if audio is None:
+        # Not cached yet: wait for a deferred synthesis still running on this worker
+        try:
+            audio = await audio_jobs.get(audio_id, timeout=AUDIO_FETCH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Audio is not ready yet")
+        except DependencyOverloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Deferred audio {audio_id} failed: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to generate audio")
+
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+    return Response(content=audio, media_type="audio/mpeg", headers=cache_headers)
+
+@router.get("/chat/audio/{audio_id}/stream")
+async def stream_chat_audio(audio_id: str = Path(..., pattern="^[0-9a-f]{64}$"), sig: Optional[str] = None):
+    """Relay the audio of a chat turn sent with audio="stream" while Polly synthesizes it"""
+    check_audio_signature(audio_id, sig)
+    text = audio_streams.get(audio_id)
+    if text is None:
+        # The id may still be served from the cache (e.g. replayed after the registry expired)
+        audio = await audio_cache.get(audio_id)
+        if audio is None:
+            raise HTTPException(status_code=404, detail="Audio not found or expired")
+        return Response(content=audio, media_type="audio/mpeg", headers={"Cache-Control": AUDIO_CACHE_CONTROL})
+
+    chunks = get_speech_service().stream_audio(text)
+    try:
+        # Wait for the first chunk so Polly errors still produce a proper status code
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    except DependencyOverloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming speech: {str(e)}")
+        raise HTTPException(status_code=502, detail="Failed to generate audio")
+
+    async def relay():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(relay(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
+def encode_history_cursor(row):
+    return base64.urlsafe_b64encode(f"{row['created_at'].isoformat()}|{row['id']}".encode()).decode()
+
+
+def decode_history_cursor(cursor: str):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/chat/history")
+async def get_chat_history(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    session_id: Optional[str] = None,
+    user: User = Depends(validate_token),
+):
+    """
+    The signed-in user's chat messages, newest first. Pass next_cursor back as
+    cursor to get the following page.
+    """
+    rows = await fetch_history(user.id, limit, decode_history_cursor(cursor) if cursor else None, session_id)
+    return {
+        "messages": [
+            {**dict(row), "id": str(row["id"]), "created_at": row["created_at"].isoformat()}
+            for row in rows
+        ],
+        "next_cursor": encode_history_cursor(rows[-1]) if len(rows) == limit else None,
+    }
+
 @router.get("/chat/health")
 async def chat_health():
     """Check if the chat service is healthy"""
     try:
-        if not lex_initialized:
-            if not init_lex_client():
+        # While the Lex circuit is open this reports the cached failure without calling AWS
+        if not lex_utils.async_lex_client:
+            if not await init_async_lex_client():
                 logger.warning("Lex client not initialized")
-                return {"status": "warning", "message": "Lex client not connected"}
-                
+                return {"status": "warning", "message": "Lex client not connected",
+                        "circuit": lex_utils.lex_breaker.state}
+        if lex_utils.lex_breaker.state != CLOSED:
+            return {"status": "warning", "message": "Lex is failing", "circuit": lex_utils.lex_breaker.state}
+
         return {"status": "ok", "message": "Chat service is healthy"}
     except Exception as e:
         logger.error(f"Error checking chat health: {str(e)}")
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+from appointments.availability import CLINIC_DAYS, CLINIC_OPEN_TIME, CLINIC_CLOSE_TIME
+from utils import metrics
+from utils.lex_dialog import load_dialog_state
+from utils.lex_utils import send_message_to_lex_async
+from utils.speech_service import get_speech_service
+
+logger = logging.getLogger(__name__)
+
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+FAQ_PATH = os.getenv("FAQ_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq.json"))
+# A token match may carry this many pleasantries beyond the pattern ("hi there, good morning!")
+FAQ_MAX_EXTRA_TOKENS = int(os.getenv("FAQ_MAX_EXTRA_TOKENS", "2"))
+
+# Words that carry no meaning for matching
+STOPWORDS = {"a", "an", "the", "please", "pls", "um", "uh", "so", "just", "ok", "okay", "oh", "well"}
+# The only words a message may add to a pattern: anything else may be the actual question
+PLEASANTRIES = {"hi", "hello", "hey", "there", "good", "morning", "afternoon", "evening", "thanks", "thank",
+                "you", "very", "much", "great", "again", "dear", "team"}
+# Lex dialog actions that mean the bot is waiting for an answer to its own question;
+# while Lex is collecting slots every message goes to Lex ("thanks" may be an answer)
+OPEN_DIALOG_ACTIONS = {"ElicitSlot", "ConfirmIntent"}
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def normalize(text: str) -> str:
+    text = text.lower().replace("'", "").replace("’", "")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def _tokens(normalized: str):
+    return [token for token in normalized.split() if token not in STOPWORDS]
+
+
+def _clock(value: str) -> str:
+    return datetime.strptime(value, "%H:%M").strftime("%I:%M %p").lstrip("0")
+
+
+def _days(value: str) -> str:
+    """CLINIC_DAYS as text: "Monday to Friday", or "Monday, Wednesday and Friday" when not consecutive"""
+    days = sorted({int(day) for day in value.split(",") if day.strip()})
+    if not days:
+        return ""
+    if len(days) > 2 and days == list(range(days[0], days[-1] + 1)):
+        return f"{DAY_NAMES[days[0]]} to {DAY_NAMES[days[-1]]}"
+    names = [DAY_NAMES[day] for day in days]
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+
+class FaqMatcher:
+    """
+    Answers static, high-frequency questions (greetings, thanks, opening hours...)
+    without calling Lex.
+
+    Messages are matched first by normalized text, then by tokens: every content
+    word of a pattern must be present, with at most FAQ_MAX_EXTRA_TOKENS others,
+    all of them PLEASANTRIES ("hi, tooth pain" is not a greeting). Single-word
+    patterns only match a message made of that word.
+    Messages mentioning a defer_to_lex word (book, cancel...) always go to Lex.
+    """
+
+    def __init__(self, entries=(), defer_to_lex=()):
+        self.defer_to_lex = set(defer_to_lex)
+        self.entries = []
+        self._exact = {}
+        self._by_token = {}
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def load(cls, path=FAQ_PATH):
+        with open(path, encoding="utf-8") as faq_file:
+            table = json.load(faq_file)
+        return cls(table.get("entries", []), table.get("defer_to_lex", []))
+
+    def add(self, entry):
+        entry = dict(entry)
+        entry["answer"] = entry["answer"].format(open_days=_days(CLINIC_DAYS), open_time=_clock(CLINIC_OPEN_TIME),
+                                                 close_time=_clock(CLINIC_CLOSE_TIME))
+        self.entries.append(entry)
+        for pattern in entry["patterns"]:
+            normalized = normalize(pattern)
+            self._exact.setdefault(normalized, entry)
+            tokens = frozenset(_tokens(normalized))
+            if tokens:
+                # Indexed by the rarest-looking (longest) token to keep candidate lists short
+                key = max(tokens, key=len)
+                self._by_token.setdefault(key, []).append((tokens, entry))
+
+    def match(self, message: str):
+        """
+        Returns:
+            dict: The matching FAQ entry (intent, answer, patterns), or None
+        """
+        normalized = normalize(message)
+        if not normalized:
+            return None
+        entry = self._exact.get(normalized)
+        if entry:
+            return entry
+
+        tokens = set(_tokens(normalized))
+        if not tokens or tokens & self.defer_to_lex:
+            return None
+        best = None
+        for token in tokens:
+            for pattern_tokens, entry in self._by_token.get(token, ()):
+                if not pattern_tokens <= tokens:
+                    continue
+                extra = tokens - pattern_tokens
+                if extra and (len(pattern_tokens) == 1 or len(extra) > FAQ_MAX_EXTRA_TOKENS
+                              or not extra <= PLEASANTRIES):
+                    continue
+                if best is None or len(extra) < best[0]:
+                    best = (len(extra), entry)
+        return best[1] if best else None
+
+
+faq_matcher = FaqMatcher()
+
+
+def init_fast_path(path=FAQ_PATH):
+    global faq_matcher
+    if FAQ_ENABLED:
+        faq_matcher = FaqMatcher.load(path)
+        logger.info(f"Loaded {len(faq_matcher.entries)} FAQ entries from {path}")
+
+
+def faq_answers():
+    """Every FAQ answer, for pre-synthesizing their audio"""
+    return [entry["answer"] for entry in faq_matcher.entries]
+
+
+async def _dialog_open(session_id):
+    """Whether Lex is waiting for an answer in this session, by the state its last turn left on any worker"""
+    seen, session_state = await load_dialog_state(session_id)
+    if not seen:
+        return False
+    if session_state is None:
+        # Unknown (last turn failed, Redis unavailable): let Lex answer
+        return True
+    return (session_state.get("dialogAction") or {}).get("type") in OPEN_DIALOG_ACTIONS
+
+
+async def get_bot_response(session_id: str, message: str, patient_id: str = None):
+    """
+    Answer a chat message locally when it is a known FAQ, otherwise ask Lex
+
+    Args:
+        patient_id (str): Signed-in user's id, needed by Lex to fulfill bookings
+
+    Returns:
+        dict: Same shape as send_message_to_lex_async, plus "source" ("faq" or "lex")
+    """
+    entry = faq_matcher.match(message) if FAQ_ENABLED else None
+    # Only FAQ-looking messages pay for the dialog state lookup
+    if entry and not await _dialog_open(session_id):
+        metrics.increment("chat.fast_path.hits")
+        metrics.increment(f"chat.fast_path.hits.{entry['intent']}")
+        return {"text": entry["answer"], "intent": entry["intent"], "session_state": None, "slots": None,
+                "source": "faq"}
+
+    metrics.increment("chat.fast_path.lex_calls")
+    lex_response = await send_message_to_lex_async(session_id, message, patient_id=patient_id)
+    lex_response["source"] = "lex"
+    return lex_response
+
+
+async def warm_faq_audio():
+    """Make sure every FAQ answer's audio is cached, so fast-path turns never wait for Polly"""
+    speech_service = get_speech_service()
+    for answer in faq_answers():
+        try:
+            await speech_service.get_audio(answer)
+        except Exception as e:
+            logger.warning(f"Failed to pre-synthesize FAQ answer: {str(e)}")
+            return
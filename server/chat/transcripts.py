@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+from database.postgres import bulk_insert, db_connection, fetch_query
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Turns waiting to be written; when full, new turns are dropped rather than slowing down chat
+TRANSCRIPT_QUEUE_SIZE = int(os.getenv("TRANSCRIPT_QUEUE_SIZE", "10000"))
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", "500"))
+# A partial batch is written once its oldest message has waited this long
+TRANSCRIPT_FLUSH_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL_SECONDS", "1"))
+TRANSCRIPT_FLUSH_RETRIES = int(os.getenv("TRANSCRIPT_FLUSH_RETRIES", "3"))
+
+TRANSCRIPT_COLUMNS = ("id", "session_id", "user_id", "role", "text", "intent", "source", "created_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_transcripts (
+    id uuid PRIMARY KEY,
+    session_id text NOT NULL,
+    -- No foreign key: the id comes from the chat client, and one bad row must not fail a batch
+    user_id uuid,
+    role text NOT NULL CHECK (role IN ('user', 'bot')),
+    text text NOT NULL,
+    intent text,
+    source text,
+    created_at timestamptz NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS chat_transcripts_user_time_idx
+    ON chat_transcripts (user_id, created_at DESC, id DESC) WHERE user_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS chat_transcripts_session_time_idx
+    ON chat_transcripts (session_id, created_at, id);
+"""
+
+
+def _user_uuid(user_id):
+    try:
+        return uuid.UUID(str(user_id)) if user_id else None
+    except ValueError:
+        return None
+
+
+class TranscriptWriter:
+    """
+    Append-only chat history, written behind the request path.
+
+    record() only puts the turn's rows on a bounded in-memory queue; a background
+    task writes them to Postgres in batches of up to TRANSCRIPT_BATCH_SIZE with
+    COPY, at most TRANSCRIPT_FLUSH_INTERVAL_SECONDS after they were recorded.
+    Rows carry their own ids, so a retried batch is not written twice.
+    """
+
+    def __init__(self, queue_size=TRANSCRIPT_QUEUE_SIZE, batch_size=TRANSCRIPT_BATCH_SIZE,
+                 flush_interval=TRANSCRIPT_FLUSH_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._task = None
+
+    def record(self, session_id, user_id, user_text, bot_text, intent=None, source=None):
+        """Queue one chat turn (the user's message and the bot's reply) without waiting"""
+        if not self._task:
+            return
+        user_uuid = _user_uuid(user_id)
+        received = datetime.now(timezone.utc)
+        rows = [
+            (uuid.uuid4(), session_id, user_uuid, "user", user_text, None, None, received),
+            (uuid.uuid4(), session_id, user_uuid, "bot", bot_text, intent, source, datetime.now(timezone.utc)),
+        ]
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except asyncio.QueueFull:
+                metrics.increment("chat.transcripts.dropped")
+                return
+        metrics.increment("chat.transcripts.recorded")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer after flushing everything still queued"""
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            await self._flush(self._take(self.batch_size))
+
+    def _take(self, limit):
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    batch += self._take(self.batch_size - len(batch))
+                    remaining = deadline - loop.time()
+                    if len(batch) >= self.batch_size or remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                # Shutting down while collecting or flushing: hand the batch back so stop() writes it
+                for row in batch:
+                    try:
+                        self._queue.put_nowait(row)
+                    except asyncio.QueueFull:
+                        metrics.increment("chat.transcripts.dropped")
+                raise
+
+    async def _flush(self, batch):
+        for attempt in range(TRANSCRIPT_FLUSH_RETRIES):
+            try:
+                await bulk_insert("chat_transcripts", TRANSCRIPT_COLUMNS, batch, on_conflict="(id) DO NOTHING")
+                metrics.increment("chat.transcripts.written", len(batch))
+                metrics.observe("chat.transcripts.batch_size", len(batch))
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to write {len(batch)} transcript rows (attempt {attempt + 1}): {str(e)}")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        metrics.increment("chat.transcripts.dropped", len(batch))
+        logger.error(f"Dropped {len(batch)} transcript rows after {TRANSCRIPT_FLUSH_RETRIES} attempts")
+
+    def __len__(self):
+        return self._queue.qsize()
+
+
+transcripts = TranscriptWriter()
+metrics.register_gauge("chat.transcripts.queued", lambda: len(transcripts))
+
+
+async def init_transcripts():
+    async with db_connection() as connection:
+        await connection.execute(SCHEMA)
+    transcripts.start()
+
+
+async def close_transcripts():
+    await transcripts.stop()
+
+
+async def fetch_history(user_id, limit=50, before=None, session_id=None):
+    """
+    A page of a user's chat history, newest first
+
+    Args:
+        before (tuple): (created_at, id) of the last row of the previous page
+        session_id (str): Only return this conversation
+    Returns:
+        list: Transcript rows
+    """
+    conditions = ["user_id = $1"]
+    args = [user_id]
+    if session_id:
+        args.append(session_id)
+        conditions.append(f"session_id = ${len(args)}")
+    if before:
+        args += list(before)
+        conditions.append(f"(created_at, id) < (${len(args) - 1}, ${len(args)})")
+    args.append(limit)
+    return await fetch_query(
+        f"""
+        SELECT id, session_id, role, text, intent, created_at
+        FROM chat_transcripts
+        WHERE {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ${len(args)}
+        """,
+        *args
+    )
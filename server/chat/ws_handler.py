@@ -0,0 +1,380 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from auth.auth import user_from_token
+
+from chat.audio_jobs import audio_jobs
+from chat.chat_handler import SPEECH_LATENCY_BUDGET_SECONDS, audio_url, run_in_background, speech_over_budget
+from chat.chat_events import record_turn
+from chat.fast_path import get_bot_response
+from utils import metrics
+from utils.concurrency import DependencyOverloaded
+from utils.speech_service import get_speech_service
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Heartbeat: the server pings every WS_HEARTBEAT_SECONDS and drops sockets silent for WS_IDLE_TIMEOUT_SECONDS
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "20"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60"))
+# Backpressure: frames waiting to be written to a slow client, and user messages waiting for Lex
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+WS_MAX_PENDING_MESSAGES = int(os.getenv("WS_MAX_PENDING_MESSAGES", "4"))
+# Resumption: recent text frames kept per session and how long a disconnected session is kept
+WS_REPLAY_FRAMES = int(os.getenv("WS_REPLAY_FRAMES", "50"))
+WS_SESSION_TTL_SECONDS = int(os.getenv("WS_SESSION_TTL_SECONDS", "3600"))
+# Sessions kept per worker; past it the least recently seen disconnected ones are dropped
+WS_MAX_SESSIONS = int(os.getenv("WS_MAX_SESSIONS", "10000"))
+
+
+class ChatSocketSession:
+    """State kept for a chat session so a client can reconnect and resume it"""
+
+    def __init__(self, session_id, user_id=None):
+        self.session_id = session_id
+        # Signed-in user who started the session (None if anonymous); only they can resume it
+        self.user_id = user_id
+        self.seq = 0
+        self.frames = deque(maxlen=WS_REPLAY_FRAMES)
+        self.last_seen = time.monotonic()
+        # Sockets currently attached; such a session is never evicted
+        self.sockets = 0
+
+    def record(self, frame):
+        """Number a text frame and keep it for replay"""
+        self.seq += 1
+        frame["seq"] = self.seq
+        self.frames.append(frame)
+        return frame
+
+    def frames_after(self, last_seq):
+        return [frame for frame in self.frames if frame["seq"] > last_seq]
+
+
+class ChatSocketSessions:
+    """
+    In-process registry of resumable chat socket sessions, in least recently seen order.
+    Disconnected sessions expire after WS_SESSION_TTL_SECONDS, and the oldest are
+    dropped when there are more than max_sessions.
+    """
+
+    def __init__(self, max_sessions=WS_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def open(self, session_id=None, user_id=None):
+        """
+        Resume a known session or start a new one, and attach a socket to it
+        Args:
+            user_id (str): Signed-in user opening the socket, None if anonymous
+        Returns:
+            tuple: (ChatSocketSession, bool resumed)
+        Raises:
+            PermissionError: The session was started by someone else
+        """
+        self._evict_expired()
+        session = self._sessions.get(session_id) if session_id else None
+        if session and session.user_id != user_id:
+            metrics.increment("ws_chat.resume_refused")
+            raise PermissionError("The chat session belongs to another user")
+        resumed = session is not None
+        if not session:
+            # Unknown ids are kept so the Lex conversation continues across server restarts
+            session = ChatSocketSession(session_id or str(uuid.uuid4()), user_id)
+            self._sessions[session.session_id] = session
+        session.sockets += 1
+        self.touch(session)
+        self._evict_oldest()
+        return session, resumed
+
+    def close(self, session):
+        """Detach a socket; the session stays resumable until it expires"""
+        session.sockets = max(0, session.sockets - 1)
+        self.touch(session)
+
+    def touch(self, session):
+        session.last_seen = time.monotonic()
+        if session.session_id in self._sessions:
+            self._sessions.move_to_end(session.session_id)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [key for key, session in self._sessions.items()
+                   if not session.sockets and now - session.last_seen > WS_SESSION_TTL_SECONDS]
+        for key in expired:
+            self._sessions.pop(key, None)
+
+    def _evict_oldest(self):
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        idle = [key for key, session in self._sessions.items() if not session.sockets][:excess]
+        for key in idle:
+            self._sessions.pop(key)
+        metrics.increment("ws_chat.sessions_evicted", len(idle))
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+chat_sessions = ChatSocketSessions()
+metrics.register_gauge("ws_chat.sessions", lambda: len(chat_sessions))
+
+
+async def _finish_stream(first_chunk, chunks):
+    """Read the rest of a speech stream that missed its budget, for GET /chat/audio/{audio_id}"""
+    try:
+        audio = [await first_chunk]
+    except StopAsyncIteration:
+        return b""
+    async for chunk in chunks:
+        audio.append(chunk)
+    return b"".join(audio)
+
+
+async def _close_stream(pending_chunk, chunks):
+    """Abandon a speech stream, releasing its Polly call and limiter slot"""
+    pending_chunk.cancel()
+    try:
+        await pending_chunk
+    except (asyncio.CancelledError, StopAsyncIteration, Exception):
+        pass
+    await chunks.aclose()
+
+
+class ChatSocket:
+    """
+    One chat WebSocket connection.
+
+    A receiver reads client frames into a bounded inbox, a worker runs chat turns in
+    order, and a sender drains a bounded outbox. When the client reads slowly the
+    outbox fills up and the worker waits, so audio is never buffered without limit.
+    """
+
+    def __init__(self, websocket: WebSocket, session: ChatSocketSession, user_id=None):
+        self.websocket = websocket
+        # Owner of the turns' transcripts, from the token the socket was opened with
+        self.user_id = user_id
+        self.session = session
+        self.inbox = asyncio.Queue(maxsize=WS_MAX_PENDING_MESSAGES)
+        self.outbox = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.last_received = time.monotonic()
+
+    async def send_json(self, frame, replay=True):
+        if replay:
+            frame = self.session.record(frame)
+        await self.outbox.put(json.dumps(frame))
+
+    async def send_bytes(self, data):
+        await self.outbox.put(data)
+
+    async def run(self, last_seq=None, resumed=False):
+        # The outbox is still empty, so this never waits for the sender
+        await self.send_json({"type": "session", "session_id": self.session.session_id, "resumed": resumed}, replay=False)
+
+        tasks = [
+            asyncio.create_task(self._sender()),
+            asyncio.create_task(self._receiver()),
+            asyncio.create_task(self._worker(last_seq if resumed else None)),
+            asyncio.create_task(self._heartbeat()),
+        ]
+        try:
+            # Any task finishing means the connection is over (disconnect, idle timeout, error)
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                    logger.error(f"Chat socket error: {str(task.exception())}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _sender(self):
+        while True:
+            frame = await self.outbox.get()
+            if isinstance(frame, bytes):
+                await self.websocket.send_bytes(frame)
+            else:
+                await self.websocket.send_text(frame)
+
+    async def _receiver(self):
+        while True:
+            raw = await self.websocket.receive_text()
+            self.last_received = time.monotonic()
+            chat_sessions.touch(self.session)
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                await self.send_json({"type": "error", "error": "Frames must be JSON"}, replay=False)
+                continue
+
+            frame_type = frame.get("type")
+            if frame_type == "ping":
+                await self.send_json({"type": "pong"}, replay=False)
+            elif frame_type == "message" and frame.get("message"):
+                try:
+                    self.inbox.put_nowait(frame)
+                except asyncio.QueueFull:
+                    metrics.increment("ws_chat.messages_rejected")
+                    await self.send_json({"type": "error", "id": frame.get("id"),
+                                          "error": "Too many pending messages"}, replay=False)
+            elif frame_type != "pong":
+                await self.send_json({"type": "error", "error": f"Unknown frame type: {frame_type}"}, replay=False)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            if time.monotonic() - self.last_received > WS_IDLE_TIMEOUT_SECONDS:
+                logger.info(f"Closing idle chat socket for session {self.session.session_id}")
+                await self.websocket.close(code=1001)
+                return
+            await self.send_json({"type": "ping"}, replay=False)
+
+    async def _worker(self, replay_after=None):
+        # Replayed frames can outnumber the outbox, so they go out while the sender is running
+        if replay_after is not None:
+            for frame in self.session.frames_after(replay_after):
+                await self.outbox.put(json.dumps(frame))
+        while True:
+            frame = await self.inbox.get()
+            await self._handle_turn(frame)
+
+    async def _handle_turn(self, frame):
+        message_id = frame.get("id")
+        session_id = self.session.session_id
+
+        try:
+            lex_response = await get_bot_response(session_id, frame["message"], self.user_id)
+        except DependencyOverloaded as e:
+            # Not replayed: the client should resend the message after retry_after seconds
+            await self.send_json({"type": "error", "id": message_id, "status": "overloaded",
+                                  "error": "The assistant is busy, please try again shortly",
+                                  "retry_after": e.retry_after}, replay=False)
+            return
+        if "error" in lex_response:
+            logger.error(f"Error from Lex: {lex_response['error']}")
+            await self.send_json({"type": "text", "id": message_id, "status": "error", "text": lex_response["text"]})
+            return
+
+        record_turn(session_id, self.user_id, frame["message"], lex_response, run_in_background)
+
+        # Push the text first so it can be displayed while the audio is synthesized
+        speech_service = get_speech_service()
+        audio_id = speech_service.cache_key(lex_response["text"])
+        await self.send_json({
+            "type": "text",
+            "id": message_id,
+            "status": "ok",
+            "text": lex_response["text"],
+            "intent": lex_response.get("intent"),
+            "audio_url": audio_url(audio_id),
+        })
+
+        if not frame.get("audio", True):
+            return
+
+        # Audio frames are not replayed on resume, the text frame carries an audio_url instead
+        await self.send_json({"type": "audio_start", "id": message_id, "audio_id": audio_id,
+                              "content_type": "audio/mpeg"}, replay=False)
+        # The same reply may already be synthesizing (deferred by another turn): wait for that
+        # job instead of paying for a second Polly call. Its audio arrives as a single chunk
+        chunks = None
+        pending_chunk = audio_jobs.running(audio_id)
+        if pending_chunk is None:
+            chunks = speech_service.stream_audio(lex_response["text"])
+            pending_chunk = asyncio.ensure_future(chunks.__anext__())
+        try:
+            # Only the first chunk counts against the budget, the rest arrive as Polly produces them
+            first_chunk = await asyncio.wait_for(asyncio.shield(pending_chunk), timeout=SPEECH_LATENCY_BUDGET_SECONDS)
+            metrics.increment("chat.speech.within_budget")
+        except StopAsyncIteration:
+            first_chunk = b""
+        except asyncio.TimeoutError:
+            # Free the socket for the next turn. The stream keeps going in the background (and
+            # into the audio cache) so the Polly call isn't paid for twice
+            deferred_id, status = speech_over_budget(audio_id)
+            end = {"type": "audio_end", "id": message_id, "status": status}
+            if deferred_id:
+                end["audio_url"] = audio_url(deferred_id)
+            if chunks is not None:
+                if audio_jobs.running(audio_id):
+                    # Another turn deferred the same audio meanwhile, it will be served from that job
+                    await _close_stream(pending_chunk, chunks)
+                else:
+                    audio_jobs.submit(audio_id, _finish_stream(pending_chunk, chunks))
+            await self.send_json(end, replay=False)
+            return
+        except DependencyOverloaded:
+            metrics.increment("chat.speech.unavailable")
+            await self.send_json({"type": "audio_end", "id": message_id, "status": "unavailable"}, replay=False)
+            return
+        except Exception as e:
+            logger.error(f"Error streaming speech: {str(e)}")
+            metrics.increment("chat.speech.failed")
+            await self.send_json({"type": "audio_end", "id": message_id, "status": "error"}, replay=False)
+            return
+
+        try:
+            await self.send_bytes(first_chunk)
+            if chunks is not None:
+                async for chunk in chunks:
+                    await self.send_bytes(chunk)
+        except Exception as e:
+            logger.error(f"Error streaming speech: {str(e)}")
+            await self.send_json({"type": "audio_end", "id": message_id, "status": "error"}, replay=False)
+            return
+        await self.send_json({"type": "audio_end", "id": message_id, "status": "ok"}, replay=False)
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """
+    Chat over a single WebSocket per session.
+
+    Query parameters: session_id to resume a session, last_seq to replay the text
+    frames missed while disconnected, token (a Supabase access token, optional) to save
+    the conversation to the user's chat history. Only the user who started a session
+    (or, for an anonymous one, another anonymous socket) can resume it. Client frames are {"type": "message", "id",
+    "message", "audio"} and {"type": "ping"}. For each message the server
+    sends a "text" frame, then "audio_start", binary audio frames and "audio_end".
+    When speech misses its latency budget, "audio_end" has status "pending" and an
+    audio_url to fetch it from (or status "dropped"); "unavailable" means no audio.
+    """
+    await websocket.accept()
+    user_id = None
+    token = websocket.query_params.get("token")
+    if token:
+        try:
+            user_id = str((await user_from_token(token)).id)
+        except HTTPException as e:
+            await websocket.close(code=1008, reason=str(e.detail))
+            return
+        except DependencyOverloaded as e:
+            # 1013: try again later
+            await websocket.close(code=1013, reason=str(e))
+            return
+    session_id = websocket.query_params.get("session_id")
+    last_seq = websocket.query_params.get("last_seq")
+    try:
+        session, resumed = chat_sessions.open(session_id, user_id)
+    except PermissionError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    metrics.increment("ws_chat.connections")
+    try:
+        await ChatSocket(websocket, session, user_id).run(
+            last_seq=int(last_seq) if last_seq and last_seq.isdigit() else None,
+            resumed=resumed
+        )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_sessions.close(session)
+        logger.info(f"Chat socket closed for session {session.session_id}")
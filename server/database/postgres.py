@@ -1,17 +1,73 @@
+import asyncio
 import asyncpg
+import contextvars
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import HTTPException
 
+from utils import metrics
 from utils.aws_utils import get_secret
+from utils.concurrency import DependencyOverloaded
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing: POSTGRES_MAX_CONNECTIONS is the budget for the whole deployment and is split
+# across the WEB_CONCURRENCY worker processes; POSTGRES_POOL_MAX_SIZE overrides the per-worker size.
+# Without WEB_CONCURRENCY the worker count is unknown, so each worker keeps the former pool of 10
+POSTGRES_MAX_CONNECTIONS = int(os.getenv("POSTGRES_MAX_CONNECTIONS", "40"))
+POSTGRES_POOL_MAX_SIZE = os.getenv("POSTGRES_POOL_MAX_SIZE")
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "2"))
+POSTGRES_POOL_DEFAULT_MAX_SIZE = 10
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY")
+# Fail fast: a request waits at most this long for a free connection, then gets a 503
+POSTGRES_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("POSTGRES_ACQUIRE_TIMEOUT_SECONDS", "2"))
+POSTGRES_CONNECT_TIMEOUT_SECONDS = float(os.getenv("POSTGRES_CONNECT_TIMEOUT_SECONDS", "10"))
+POSTGRES_COMMAND_TIMEOUT_SECONDS = float(os.getenv("POSTGRES_COMMAND_TIMEOUT_SECONDS", "120"))
+POSTGRES_MAX_INACTIVE_CONNECTION_SECONDS = float(os.getenv("POSTGRES_MAX_INACTIVE_CONNECTION_SECONDS", "300"))
+# Prepared statement cache per connection, set the size to 0 behind a transaction-mode pgbouncer
+POSTGRES_STATEMENT_CACHE_SIZE = int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", "256"))
+POSTGRES_STATEMENT_CACHE_LIFETIME_SECONDS = int(os.getenv("POSTGRES_STATEMENT_CACHE_LIFETIME_SECONDS", "3600"))
 
 # Global variables for connections
 postgres_pool = None
+# (connection, owning task) held by the current request, see db_connection()
+_current_connection = contextvars.ContextVar("postgres_connection", default=None)
+
+
+def pool_size():
+    """
+    Per-worker pool size
+    Returns:
+        tuple: (min_size, max_size)
+    """
+    if POSTGRES_POOL_MAX_SIZE:
+        max_size = int(POSTGRES_POOL_MAX_SIZE)
+    elif WEB_CONCURRENCY:
+        max_size = max(1, POSTGRES_MAX_CONNECTIONS // max(1, int(WEB_CONCURRENCY)))
+    else:
+        max_size = min(POSTGRES_POOL_DEFAULT_MAX_SIZE, POSTGRES_MAX_CONNECTIONS)
+    return min(POSTGRES_POOL_MIN_SIZE, max_size), max_size
+
+
+async def check_connection_budget(connection, max_size):
+    """Warn when the pools of all workers could open more connections than the server accepts"""
+    workers = int(WEB_CONCURRENCY or 1)
+    limit = await connection.fetchval(
+        "SELECT current_setting('max_connections')::int - current_setting('superuser_reserved_connections')::int"
+    )
+    if workers * max_size > limit:
+        logger.warning(f"{workers} workers x {max_size} Postgres connections exceed the server limit of {limit}, "
+                       f"lower POSTGRES_MAX_CONNECTIONS or POSTGRES_POOL_MAX_SIZE")
 
 
 # Initialize PostgreSQL connection pool
 async def init_postgres():
     global postgres_pool
-    pg_creds = get_secret("postgres")
+    # Secrets Manager access is blocking, keep it off the event loop
+    pg_creds = await asyncio.to_thread(get_secret, "postgres")
+    min_size, max_size = pool_size()
     try:
         postgres_pool = await asyncpg.create_pool(
             host=pg_creds["host"],
@@ -19,14 +75,23 @@ async def init_postgres():
             user=pg_creds["username"],
             password=pg_creds["password"],
             database="defaultdb",
-            min_size=5,
-            max_size=10,
-            command_timeout=120,
-            timeout=60
+            min_size=min_size,
+            max_size=max_size,
+            command_timeout=POSTGRES_COMMAND_TIMEOUT_SECONDS,
+            timeout=POSTGRES_CONNECT_TIMEOUT_SECONDS,
+            max_inactive_connection_lifetime=POSTGRES_MAX_INACTIVE_CONNECTION_SECONDS,
+            statement_cache_size=POSTGRES_STATEMENT_CACHE_SIZE,
+            max_cached_statement_lifetime=POSTGRES_STATEMENT_CACHE_LIFETIME_SECONDS
         )
+        logger.info(f"Postgres pool created with {min_size}-{max_size} connections ({WEB_CONCURRENCY or 'unknown'} workers)")
     except Exception as e:
         print(f"Error creating postgres pool: {e}")
         raise
+    try:
+        async with postgres_pool.acquire() as connection:
+            await check_connection_budget(connection, max_size)
+    except Exception as e:
+        logger.warning(f"Could not check the Postgres connection limit: {str(e)}")
 
 # Close PostgreSQL connection pool
 async def close_postgres():
@@ -34,13 +99,86 @@ async def close_postgres():
         await postgres_pool.close()
 
 
-# Dependency to get a PostgreSQL connection from the pool
-async def get_postgres_connection():
+@asynccontextmanager
+async def acquire_connection(timeout=None):
+    """
+    Acquire a pooled connection, waiting at most POSTGRES_ACQUIRE_TIMEOUT_SECONDS
+
+    Raises:
+        DependencyOverloaded: When no connection frees up in time (a 503 with Retry-After)
+    """
     if not postgres_pool:
         raise RuntimeError("PostgreSQL pool is not initialized")
-    async with postgres_pool.acquire() as connection:
+
+    started = time.perf_counter()
+    try:
+        connection = await postgres_pool.acquire(timeout=timeout or POSTGRES_ACQUIRE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        metrics.increment("postgres.pool.acquire_timeouts")
+        logger.warning("Timed out waiting for a Postgres connection")
+        raise DependencyOverloaded("postgres", retry_after=1)
+    finally:
+        metrics.observe("postgres.pool.acquire_seconds", time.perf_counter() - started)
+
+    try:
         yield connection
+    finally:
+        await postgres_pool.release(connection)
+
+
+@asynccontextmanager
+async def db_connection():
+    """
+    Connection for the current request or task.
+
+    Reuses the connection already held by this context (a get_postgres_connection
+    dependency, an enclosing db_connection() or transaction()) so a request's queries
+    share one connection; otherwise acquires one for the duration of the block.
+    """
+    # Tasks started from a request inherit its context, but not its connection
+    current = _current_connection.get()
+    if current is not None and current[1] is asyncio.current_task():
+        yield current[0]
+        return
+
+    async with acquire_connection() as connection:
+        token = _current_connection.set((connection, asyncio.current_task()))
+        try:
+            yield connection
+        finally:
+            _current_connection.reset(token)
+
+
+@asynccontextmanager
+async def transaction(isolation=None):
+    """
+    Run the block in a transaction on the current connection. Nested blocks become
+    savepoints, and helpers called inside (fetch_query, execute_many...) join it.
 
+    Args:
+        isolation (str): Optional isolation level ("serializable", "repeatable_read"...)
+    """
+    async with db_connection() as connection:
+        async with connection.transaction(isolation=isolation):
+            yield connection
+
+
+# Dependency to get a PostgreSQL connection from the pool
+async def get_postgres_connection():
+    async with db_connection() as connection:
+        yield connection
+
+
+def _pool_usage():
+    if not postgres_pool:
+        return {}
+    size = postgres_pool.get_size()
+    idle = postgres_pool.get_idle_size()
+    return {"min": postgres_pool.get_min_size(), "max": postgres_pool.get_max_size(),
+            "size": size, "idle": idle, "in_use": size - idle}
+
+
+metrics.register_gauge("postgres.pool", _pool_usage)
 
 
 async def insert_query(query: str, *args):
@@ -53,7 +191,7 @@ async def insert_query(query: str, *args):
         None
     """
     try:
-        async for connection in get_postgres_connection():
+        async with db_connection() as connection:
             await connection.execute(query, *args)
     except asyncpg.PostgresError as e:
         print(e)
@@ -69,8 +207,60 @@ async def fetch_query(query: str, *args):
         List[asyncpg.Record]: Query results
     """
     try:
-        async for connection in get_postgres_connection():
-            result = await connection.fetch(query, *args)
-            return result
+        async with db_connection() as connection:
+            return await connection.fetch(query, *args)
+    except asyncpg.PostgresError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+async def execute_many(query: str, args_list):
+    """
+    Executes a statement once per parameter tuple in a single batch
+    Args:
+        query (str): The SQL statement to execute
+        args_list (Iterable[tuple]): One tuple of parameters per execution
+    Returns:
+        None
+    """
+    try:
+        async with db_connection() as connection:
+            await connection.executemany(query, args_list)
+    except asyncpg.PostgresError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def bulk_insert(table: str, columns, records, on_conflict: str = None):
+    """
+    Inserts many rows with COPY, the fastest way to load data into Postgres
+    Args:
+        table (str): Target table (users, appointments, chat_transcripts...)
+        columns (list): Column names, in the order of each record
+        records (Iterable[tuple]): Rows to insert
+        on_conflict (str): Optional conflict clause, e.g. "(id) DO NOTHING". COPY can't
+            resolve conflicts itself, so rows are then copied to a temporary table first
+    Returns:
+        int: Number of rows inserted
+    """
+    column_list = ", ".join(_quote_ident(column) for column in columns)
+    try:
+        async with transaction() as connection:
+            if not on_conflict:
+                result = await connection.copy_records_to_table(table, records=records, columns=list(columns))
+                return int(result.split()[-1])
+
+            staging = f"_bulk_{table}"
+            await connection.execute(
+                f"CREATE TEMP TABLE {_quote_ident(staging)} (LIKE {_quote_ident(table)} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            await connection.copy_records_to_table(staging, records=records, columns=list(columns))
+            result = await connection.execute(
+                f"INSERT INTO {_quote_ident(table)} ({column_list}) "
+                f"SELECT {column_list} FROM {_quote_ident(staging)} ON CONFLICT {on_conflict}"
+            )
+            return int(result.split()[-1])
     except asyncpg.PostgresError as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
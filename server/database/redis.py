@@ -1,31 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialWithJitterBackoff
+from redis.exceptions import ConnectionError, TimeoutError
 
+from database.redis_cache import ClientSideCache
+from utils import metrics
 from utils.aws_utils import get_secret
 
+logger = logging.getLogger(__name__)
+
+# Pool: requests wait at most REDIS_POOL_TIMEOUT_SECONDS for a free connection instead of
+# opening unbounded connections (or waiting forever)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT_SECONDS = float(os.getenv("REDIS_POOL_TIMEOUT_SECONDS", "2"))
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "5"))
+REDIS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REDIS_CONNECT_TIMEOUT_SECONDS", "3"))
+# Idle connections are PINGed before reuse once this old, so dead ones are replaced
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+REDIS_RETRY_ATTEMPTS = int(os.getenv("REDIS_RETRY_ATTEMPTS", "3"))
+REDIS_RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("REDIS_RETRY_BACKOFF_BASE_SECONDS", "0.05"))
+REDIS_RETRY_BACKOFF_CAP_SECONDS = float(os.getenv("REDIS_RETRY_BACKOFF_CAP_SECONDS", "1"))
+REDIS_SSL = os.getenv("REDIS_SSL", "true").lower() == "true"
+# Client-side caching of hot read keys, invalidated by Redis key tracking (Redis 6+)
+REDIS_CLIENT_CACHE = os.getenv("REDIS_CLIENT_CACHE", "false").lower() == "true"
+REDIS_CLIENT_CACHE_PREFIXES = os.getenv("REDIS_CLIENT_CACHE_PREFIXES", "user:,revoked:").split(",")
+REDIS_CLIENT_CACHE_MAX_ENTRIES = int(os.getenv("REDIS_CLIENT_CACHE_MAX_ENTRIES", "10000"))
+
+redis_pool = None
 redis_client = None
+client_cache = ClientSideCache(REDIS_CLIENT_CACHE_PREFIXES, REDIS_CLIENT_CACHE_MAX_ENTRIES,
+                               REDIS_HEALTH_CHECK_INTERVAL_SECONDS)
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """Blocking pool that records how long callers wait for a connection"""
+
+    async def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        except ConnectionError:
+            metrics.increment("redis.pool.acquire_timeouts")
+            raise
+        finally:
+            metrics.observe("redis.pool.acquire_seconds", time.perf_counter() - started)
 
 
 # Initialize Redis connection
 async def init_redis():
-    global redis_client
-    redis_creds = get_secret("redis")
+    global redis_pool, redis_client
+    # Secrets Manager access is blocking, keep it off the event loop
+    redis_creds = await asyncio.to_thread(get_secret, "redis")
     try:
-        redis_client = redis.Redis(host=redis_creds["host"],
-                                   port=redis_creds["port"],
-                                   password=redis_creds["password"],
-                                   ssl=True,
-                                   decode_responses=True)
+        redis_pool = MeteredConnectionPool(
+            host=redis_creds["host"],
+            port=redis_creds["port"],
+            password=redis_creds["password"],
+            connection_class=redis.SSLConnection if REDIS_SSL else redis.Connection,
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT_SECONDS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_SECONDS,
+            socket_keepalive=True,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+            retry=Retry(
+                ExponentialWithJitterBackoff(base=REDIS_RETRY_BACKOFF_BASE_SECONDS, cap=REDIS_RETRY_BACKOFF_CAP_SECONDS),
+                REDIS_RETRY_ATTEMPTS
+            ),
+            retry_on_error=[ConnectionError, TimeoutError],
+        )
+        redis_client = redis.Redis(connection_pool=redis_pool)
+        await redis_client.ping()
         print("Connected to Redis")
     except Exception as e:
         print(f"Error creating redis pool: {e}")
         raise
 
+    if REDIS_CLIENT_CACHE:
+        client_cache.start(redis_pool)
+
 
 # Close Redis connection
 async def close_redis():
+    await client_cache.stop()
     if redis_client:
-        await redis_client.close()
+        await redis_client.aclose()
+    if redis_pool:
+        await redis_pool.aclose()
 
 
 async def get_redis_client():
     return redis_client
+
+
+async def cached_mget(*keys):
+    """
+    Read hot keys (see REDIS_CLIENT_CACHE_PREFIXES) through the client-side cache when
+    it is enabled, otherwise with a plain MGET
+    Returns:
+        list: Values in key order, None for missing keys
+    """
+    if REDIS_CLIENT_CACHE:
+        return await client_cache.mget(redis_client, *keys)
+    return await redis_client.mget(*keys)
+
+
+def _pool_usage():
+    if not redis_pool:
+        return {}
+    return {
+        "max": redis_pool.max_connections,
+        "in_use": len(redis_pool._in_use_connections),
+        "idle": len(redis_pool._available_connections),
+    }
+
+
+metrics.register_gauge("redis.pool", _pool_usage)
+metrics.register_gauge("redis.client_cache.entries", lambda: len(client_cache))
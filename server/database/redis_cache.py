@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+# Stored for keys that don't exist, so negative lookups are cached too
+_MISSING = object()
+
+
+class ClientSideCache:
+    """
+    Server-assisted client-side cache for hot read keys (Redis 6+ key tracking).
+
+    A dedicated connection subscribes to __redis__:invalidate and a second one turns
+    on broadcast tracking (CLIENT TRACKING ON BCAST PREFIX ... REDIRECT <listener>),
+    so Redis reports every write to a key under the tracked prefixes, made by any
+    client. Entries are dropped on those reports, and the whole cache is flushed
+    whenever either connection is lost.
+    """
+
+    def __init__(self, prefixes, max_entries=10000, health_check_interval=30):
+        self.prefixes = tuple(prefixes)
+        self.max_entries = max_entries
+        self.health_check_interval = health_check_interval
+        self._entries = OrderedDict()
+        # Bumped on every invalidation; values read while it moved are not stored
+        self._epoch = 0
+        self._listeners = []
+        self._pool = None
+        self._task = None
+        self._connected = asyncio.Event()
+
+    def add_listener(self, callback):
+        """Call callback(key) on every invalidated key, callback(None) when everything is flushed"""
+        self._listeners.append(callback)
+
+    def start(self, pool):
+        """Start tracking on connections created from pool"""
+        self._pool = pool
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._flush()
+
+    async def mget(self, client, *keys):
+        """
+        Read keys through the cache, fetching all misses with one MGET
+
+        Args:
+            client: Redis client to read misses with
+            *keys (str): Keys under a tracked prefix
+        Returns:
+            list: Values in key order, None for missing keys
+        """
+        values = {}
+        misses = []
+        for key in keys:
+            value = self._entries.get(key) if self._connected.is_set() else None
+            if value is None:
+                misses.append(key)
+            else:
+                self._entries.move_to_end(key)
+                values[key] = value
+
+        metrics.increment("redis.client_cache.hits", len(keys) - len(misses))
+        if misses:
+            metrics.increment("redis.client_cache.misses", len(misses))
+            epoch = self._epoch
+            fetched = await client.mget(*misses)
+            for key, value in zip(misses, fetched):
+                values[key] = _MISSING if value is None else value
+            if self._connected.is_set() and epoch == self._epoch:
+                for key in misses:
+                    self._store(key, values[key])
+
+        return [None if values[key] is _MISSING else values[key] for key in keys]
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _invalidate(self, keys):
+        self._epoch += 1
+        if keys is None:
+            self._flush()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+            metrics.increment("redis.client_cache.invalidations")
+            self._notify(key)
+
+    def _flush(self):
+        self._epoch += 1
+        self._entries.clear()
+        self._notify(None)
+
+    def _notify(self, key):
+        for callback in self._listeners:
+            try:
+                callback(key)
+            except Exception as e:
+                logger.error(f"Client cache listener failed: {str(e)}")
+
+    async def _run(self):
+        while True:
+            listener = tracker = None
+            try:
+                listener = self._make_connection()
+                tracker = self._make_connection()
+                await listener.connect()
+                await tracker.connect()
+
+                await listener.send_command("CLIENT", "ID")
+                listener_id = await listener.read_response()
+                await listener.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+                await listener.read_response()
+
+                prefix_args = [arg for prefix in self.prefixes for arg in ("PREFIX", prefix)]
+                await tracker.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", listener_id, "BCAST", *prefix_args)
+                await tracker.read_response()
+
+                self._flush()
+                self._connected.set()
+                logger.info(f"Redis client-side cache tracking {', '.join(self.prefixes)}")
+
+                # Tracking silently stops if the tracker connection drops, so it is pinged too
+                tasks = [asyncio.create_task(self._listen(listener)), asyncio.create_task(self._watch(tracker))]
+                try:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                for task in done:
+                    task.result()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.increment("redis.client_cache.reconnects")
+                logger.warning(f"Redis client-side cache tracking lost: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                self._connected.clear()
+                self._flush()
+                for connection in (listener, tracker):
+                    if connection:
+                        await connection.disconnect()
+
+    def _make_connection(self):
+        # Outside the pool: the listener blocks on reads indefinitely, and health checks
+        # (a PING before commands) are done by _watch instead
+        kwargs = dict(self._pool.connection_kwargs, socket_timeout=None, health_check_interval=0)
+        return self._pool.connection_class(**kwargs)
+
+    async def _listen(self, listener):
+        while True:
+            message = await listener.read_response(timeout=None)
+            # ["message", "__redis__:invalidate", [keys]], keys is None on FLUSHALL/FLUSHDB
+            if isinstance(message, list) and len(message) == 3 and message[0] == "message":
+                self._invalidate(message[2])
+
+    async def _watch(self, tracker):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await tracker.send_command("PING")
+            await tracker.read_response()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,111 @@
+import json
+import logging
+
+from database.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Lifetimes of the keys in a user's session bundle
+USER_TTL_SECONDS = 86400
+SESSION_TTL_SECONDS = 3600
+REFRESH_TTL_SECONDS = 86400
+# Keys per UNLINK call during bulk invalidation
+INVALIDATE_BATCH_SIZE = 500
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def session_key(user_id):
+    return f"session:{user_id}"
+
+
+def refresh_key(user_id):
+    return f"refresh:{user_id}"
+
+
+class SessionStore:
+    """
+    A user's session bundle in Redis: profile (user:{id}), access token
+    (session:{id}) and refresh token (refresh:{id}).
+
+    The keys keep their own TTLs. Each operation is one round trip: writes
+    go through a MULTI/EXEC pipeline, and reads use MGET.
+    """
+
+    async def save(self, user_id, access_token=None, refresh_token=None, user_data=None):
+        """
+        Write the given parts of a session bundle atomically
+
+        Args:
+            user_id (str): Owner of the session
+            access_token (str): Stored as session:{id}
+            refresh_token (str): Stored as refresh:{id}
+            user_data (dict): Profile stored as user:{id}
+        """
+        redis = await get_redis_client()
+        async with redis.pipeline(transaction=True) as pipe:
+            if user_data is not None:
+                pipe.set(user_key(user_id), json.dumps(user_data), ex=USER_TTL_SECONDS)
+            if access_token:
+                pipe.set(session_key(user_id), access_token, ex=SESSION_TTL_SECONDS)
+            if refresh_token:
+                pipe.set(refresh_key(user_id), refresh_token, ex=REFRESH_TTL_SECONDS)
+            await pipe.execute()
+
+    async def rotate(self, user_id, access_token, refresh_token):
+        """
+        Store refreshed tokens and read the cached profile in the same round trip
+
+        Returns:
+            dict: The cached profile, or None if user:{id} expired
+        """
+        redis = await get_redis_client()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(session_key(user_id), access_token, ex=SESSION_TTL_SECONDS)
+            pipe.set(refresh_key(user_id), refresh_token, ex=REFRESH_TTL_SECONDS)
+            pipe.get(user_key(user_id))
+            _, _, user_data_raw = await pipe.execute()
+        return json.loads(user_data_raw) if user_data_raw else None
+
+    async def load(self, user_id):
+        """
+        Read a whole session bundle
+
+        Returns:
+            dict: user (dict or None), access_token and refresh_token (str or None)
+        """
+        redis = await get_redis_client()
+        user_data_raw, access_token, refresh_token = await redis.mget(
+            user_key(user_id), session_key(user_id), refresh_key(user_id)
+        )
+        return {
+            "user": json.loads(user_data_raw) if user_data_raw else None,
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+        }
+
+    async def invalidate(self, *user_ids):
+        """
+        Delete the session bundles of one or more users
+
+        Returns:
+            int: Number of keys deleted
+        """
+        keys = [key for user_id in user_ids for key in (user_key(user_id), session_key(user_id), refresh_key(user_id))]
+        if not keys:
+            return 0
+
+        redis = await get_redis_client()
+        if len(keys) <= INVALIDATE_BATCH_SIZE:
+            return await redis.unlink(*keys)
+
+        # Large invalidations are sent as one pipeline of bounded UNLINK calls
+        async with redis.pipeline(transaction=False) as pipe:
+            for start in range(0, len(keys), INVALIDATE_BATCH_SIZE):
+                pipe.unlink(*keys[start:start + INVALIDATE_BATCH_SIZE])
+            return sum(await pipe.execute())
+
+
+session_store = SessionStore()
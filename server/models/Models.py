@@ -1,7 +1,8 @@
+from datetime import datetime
 from uuid import UUID
 from fastapi import UploadFile, File
 from pydantic import BaseModel, EmailStr, Field, HttpUrl, Json
-from typing import Optional, List
+from typing import Literal, Optional, List
 import re
 import phonenumbers
 
@@ -46,3 +47,23 @@ class User(BaseModel):
     role: Optional[str] = ""
     firstname: str = None
     lastname: str = None
+
+
+class AppointmentRequest(BaseModel):
+    service: str = Field(..., min_length=1, max_length=100)
+    starts_at: datetime
+    # Any free provider is picked when omitted
+    provider_id: Optional[UUID] = None
+    # Defaults to the usual length of the service
+    duration_minutes: Optional[int] = Field(None, ge=5, le=480)
+    notes: Optional[str] = Field(None, max_length=1000)
+
+
+class AppointmentUpdate(BaseModel):
+    service: Optional[str] = Field(None, min_length=1, max_length=100)
+    starts_at: Optional[datetime] = None
+    provider_id: Optional[UUID] = None
+    duration_minutes: Optional[int] = Field(None, ge=5, le=480)
+    # Patients may only cancel; the other changes of status are recorded by staff
+    status: Optional[Literal["scheduled", "completed", "no_show", "cancelled"]] = None
+    notes: Optional[str] = Field(None, max_length=1000)
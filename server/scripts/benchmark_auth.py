@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gotrue import SyncGoTrueClient
+
+from scripts.fake_gotrue import FakeGoTrueServer
+
+
+async def login_storm(label, logins, sign_in):
+    """Run all logins concurrently on one event loop, like a single worker at clinic opening"""
+    started = time.perf_counter()
+    results = await asyncio.gather(*[sign_in(i) for i in range(logins)], return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    failures = sum(1 for result in results if isinstance(result, Exception))
+
+    print(f"\n{label}")
+    print(f"- {logins} logins in {elapsed * 1000:.0f} ms ({logins / elapsed:.1f} logins/s)")
+    if failures:
+        print(f"- {failures} failed, first error: {next(r for r in results if isinstance(r, Exception))}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare the blocking and async GoTrue clients under a login storm")
+    parser.add_argument("--logins", type=int, default=100, help="Number of concurrent logins")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated GoTrue latency in seconds")
+    args = parser.parse_args()
+
+    print("Login Storm Benchmark")
+    print("=====================")
+
+    server = FakeGoTrueServer(latency=args.latency).start()
+    for i in range(args.logins):
+        server.add_user(f"patient{i}@example.com", "password123")
+
+    from auth.auth_client import init_auth_client, close_auth_client, get_auth_client
+
+    try:
+        # Previous behaviour: the synchronous client called from async endpoints
+        sync_client = SyncGoTrueClient(url=server.url, persist_session=False, auto_refresh_token=False)
+
+        async def sync_sign_in(i):
+            return sync_client.sign_in_with_password({"email": f"patient{i}@example.com", "password": "password123"})
+
+        await login_storm("Blocking client on the event loop", args.logins, sync_sign_in)
+
+        init_auth_client(server.url, "benchmark-key", gotrue_url=server.url)
+
+        async def async_sign_in(i):
+            return await get_auth_client().sign_in_with_password({"email": f"patient{i}@example.com", "password": "password123"})
+
+        await login_storm("Async client with a shared connection pool", args.logins, async_sign_in)
+    finally:
+        await close_auth_client()
+        server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
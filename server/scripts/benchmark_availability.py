@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, time as dt_time
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from appointments.availability import (
+    AvailabilityIndex, AVAILABILITY_HORIZON_DAYS, CLINIC_OPEN_TIME, CLINIC_CLOSE_TIME
+)
+
+
+class IntervalList:
+    """Baseline: every provider's appointments as a list of (start, end), scanned on each query"""
+
+    def __init__(self, index, open_time, close_time):
+        self.index = index
+        self.open_time = open_time
+        self.close_time = close_time
+        self.bookings = {}
+
+    def book(self, provider_id, start, end):
+        self.bookings.setdefault(provider_id, []).append((start, end))
+
+    def is_free(self, provider_id, start, end):
+        local_start, local_end = start.astimezone(self.index.tz), end.astimezone(self.index.tz)
+        if (local_start.date() != local_end.date() or not self.index.opening_mask(local_start.date())
+                or local_start.time() < self.open_time or local_end.time() > self.close_time):
+            return False
+        return all(not (booked_start < end and booked_end > start)
+                   for booked_start, booked_end in self.bookings.get(provider_id, []))
+
+    def next_free(self, after, duration_minutes, providers):
+        # Walk the slot grid and test every candidate like a query per slot would
+        duration = timedelta(minutes=duration_minutes)
+        day = after.astimezone(self.index.tz).date()
+        for _ in range(AVAILABILITY_HORIZON_DAYS + 1):
+            opening = self.index.opening_mask(day)
+            for slot in range(self.index.slots_per_day):
+                start = self.index.slot_start(day, slot)
+                if start < after or not opening >> slot & 1:
+                    continue
+                last = slot + -(-duration_minutes // self.index.slot_minutes) - 1
+                if last >= self.index.slots_per_day or not opening >> last & 1:
+                    continue
+                for provider_id in providers:
+                    if self.is_free(provider_id, start, start + duration):
+                        return provider_id, start
+            day += timedelta(days=1)
+        return None
+
+
+def fill(index, baseline, providers, bookings, days, rng):
+    start_day = datetime.now(index.tz).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    booked = 0
+    attempts = 0
+    while booked < bookings and attempts < bookings * 20:
+        attempts += 1
+        provider_id = rng.choice(providers)
+        day = start_day + timedelta(days=rng.randrange(days))
+        start = day + timedelta(minutes=rng.randrange(8 * 60, 17 * 60, index.slot_minutes))
+        end = start + timedelta(minutes=rng.choice([30, 45, 60]))
+        if index.is_free(provider_id, start, end):
+            index.book(f"a{booked}", provider_id, start, end)
+            baseline.book(provider_id, start, end)
+            booked += 1
+    return start_day, booked
+
+
+def time_queries(label, queries, check):
+    started = time.perf_counter()
+    for query in queries:
+        check(*query)
+    elapsed = time.perf_counter() - started
+    print(f"- {label:<34} {elapsed / len(queries) * 1e6:>10.1f} us/query")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the appointment availability index")
+    parser.add_argument("--providers", type=int, default=8, help="Number of providers")
+    parser.add_argument("--bookings", type=int, default=20000, help="Appointments to book")
+    parser.add_argument("--days", type=int, default=365, help="Days the appointments are spread over")
+    parser.add_argument("--queries", type=int, default=2000, help="Queries per measurement")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    index = AvailabilityIndex()
+    baseline = IntervalList(index, dt_time.fromisoformat(CLINIC_OPEN_TIME), dt_time.fromisoformat(CLINIC_CLOSE_TIME))
+    providers = [f"provider-{i}" for i in range(args.providers)]
+    index.set_providers(providers)
+
+    print("=" * 70)
+    print(f"Availability: {args.providers} providers, {args.bookings} bookings over {args.days} days")
+    print("=" * 70)
+    started = time.perf_counter()
+    start_day, booked = fill(index, baseline, providers, args.bookings, args.days, rng)
+    print(f"Booked {booked} appointments in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    conflict_queries = []
+    for _ in range(args.queries):
+        start = start_day + timedelta(days=rng.randrange(args.days),
+                                      minutes=rng.randrange(8 * 60, 17 * 60, index.slot_minutes))
+        conflict_queries.append((rng.choice(providers), start, start + timedelta(minutes=45)))
+    answers = [index.is_free(*query) for query in conflict_queries]
+    assert answers == [baseline.is_free(*query) for query in conflict_queries], "index and baseline disagree"
+
+    print("\nConflict check:")
+    naive = time_queries("interval list scan", conflict_queries, baseline.is_free)
+    indexed = time_queries("bitset index", conflict_queries, index.is_free)
+    print(f"  speedup: {naive / indexed:.0f}x")
+
+    next_queries = [
+        (start_day + timedelta(days=rng.randrange(args.days)), rng.choice([30, 60, 90]), providers)
+        for _ in range(max(1, args.queries // 20))
+    ]
+    for query in next_queries[:20]:
+        assert index.next_free(*query) == baseline.next_free(*query), "index and baseline disagree"
+
+    print("\nNext free slot (any provider):")
+    naive = time_queries("interval list scan", next_queries, baseline.next_free)
+    indexed = time_queries("bitset index", next_queries, index.next_free)
+    print(f"  speedup: {naive / indexed:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables from .env file
+load_dotenv()
+
+from database.postgres import init_postgres, close_postgres, insert_query, execute_many, bulk_insert, transaction
+
+TABLE = "bulk_insert_benchmark"
+
+
+async def timed(label, rows, operation):
+    await insert_query(f"TRUNCATE {TABLE}")
+    started = time.perf_counter()
+    await operation()
+    elapsed = time.perf_counter() - started
+    print(f"- {label:<32} {elapsed * 1000:>9.1f} ms  ({rows / elapsed:>10.0f} rows/s)")
+
+
+async def run(rows):
+    await init_postgres()
+    try:
+        await insert_query(f"CREATE TABLE IF NOT EXISTS {TABLE} (id integer PRIMARY KEY, email text, role text)")
+        records = [(i, f"patient{i}@example.com", "patient") for i in range(rows)]
+        query = f"INSERT INTO {TABLE} (id, email, role) VALUES ($1, $2, $3)"
+
+        async def row_by_row():
+            for record in records:
+                await insert_query(query, *record)
+
+        async def row_by_row_one_connection():
+            async with transaction():
+                for record in records:
+                    await insert_query(query, *record)
+
+        print(f"\nInserting {rows} rows")
+        await timed("insert_query per row", rows, row_by_row)
+        await timed("per row, one transaction", rows, row_by_row_one_connection)
+        await timed("execute_many", rows, lambda: execute_many(query, records))
+        await timed("bulk_insert (COPY)", rows, lambda: bulk_insert(TABLE, ["id", "email", "role"], records))
+        await timed("bulk_insert (COPY + ON CONFLICT)", rows,
+                    lambda: bulk_insert(TABLE, ["id", "email", "role"], records, on_conflict="(id) DO NOTHING"))
+    finally:
+        await insert_query(f"DROP TABLE IF EXISTS {TABLE}")
+        await close_postgres()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row inserts, execute_many and COPY")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows inserted by each method")
+    args = parser.parse_args()
+
+    print("Bulk Insert Benchmark")
+    print("=====================")
+    asyncio.run(run(args.rows))
+
+
+if __name__ == "__main__":
+    main()
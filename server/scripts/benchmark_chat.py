@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from scripts.fake_aws import FakeAWSServer, configure_environment
+
+
+def build_app():
+    """Build an app exposing the real /chat router plus the legacy blocking Lex path for comparison"""
+    from chat.chat_handler import router as chat_router, ChatMessage
+    from utils import lex_utils
+    from utils.speech_service import SpeechService
+
+    app = FastAPI()
+    app.include_router(chat_router)
+
+    @app.post("/chat-blocking")
+    async def blocking_chat(request: ChatMessage):
+        # Pre-async behaviour: boto3 Lex and Polly calls made directly on the event loop
+        if not lex_utils.lex_client:
+            lex_utils.init_lex_client()
+        lex_response = lex_utils.send_message_to_lex(request.session_id, request.message)
+        audio_base64 = SpeechService().generate_speech(lex_response["text"])
+        return {"text": lex_response["text"], "status": "ok", "audio_base64": audio_base64}
+
+    return app
+
+
+async def run_session(client, path, session_id, turns, latencies, audio="inline"):
+    for turn in range(turns):
+        started = time.perf_counter()
+        response = await client.post(path, json={"message": f"turn {turn}", "session_id": session_id, "audio": audio})
+        response.raise_for_status()
+        if response.json().get("status") != "ok":
+            raise RuntimeError(f"Chat turn failed: {response.json()}")
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_benchmark(path, sessions, turns, audio="inline"):
+    from utils.lex_utils import init_async_lex_client, close_async_lex_client
+
+    app = build_app()
+    await init_async_lex_client()
+    latencies = []
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            # Warm up connections and clients
+            await run_session(client, path, "warmup", 1, [])
+
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                run_session(client, path, f"session-{i}", turns, latencies, audio) for i in range(sessions)
+            ])
+            elapsed = time.perf_counter() - started
+    finally:
+        await close_async_lex_client()
+
+    latencies.sort()
+    print(f"\n{path} (audio={audio}): {sessions} concurrent sessions x {turns} turns")
+    print(f"- Throughput: {len(latencies) / elapsed:.1f} turns/s ({elapsed:.2f}s total)")
+    print(f"- Latency p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"- Latency p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"- Latency max: {latencies[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /chat throughput against a local fake Lex")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Messages sent per session")
+    parser.add_argument("--lex-latency", type=float, default=0.05, help="Simulated Lex latency in seconds")
+    parser.add_argument("--polly-latency", type=float, default=0.1, help="Simulated Polly latency in seconds")
+    parser.add_argument("--audio", choices=["inline", "deferred", "none"], default="inline",
+                        help="Audio mode requested from /chat")
+    parser.add_argument("--skip-blocking", action="store_true", help="Only benchmark the async /chat path")
+    args = parser.parse_args()
+
+    print("Chat Throughput Benchmark")
+    print("=========================")
+
+    server = FakeAWSServer(lex_latency=args.lex_latency, polly_latency=args.polly_latency).start()
+    configure_environment(server.url)
+    print(f"Fake AWS listening on {server.url} (Lex {args.lex_latency * 1000:.0f} ms, Polly {args.polly_latency * 1000:.0f} ms)")
+
+    try:
+        asyncio.run(run_benchmark("/chat", args.sessions, args.turns, args.audio))
+        if not args.skip_blocking:
+            asyncio.run(run_benchmark("/chat-blocking", args.sessions, args.turns))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis.asyncio as redis
+from redis.asyncio.connection import Connection
+
+import database.redis as redis_db
+from database.session_store import session_store
+
+USER_DATA = {"user_id": "benchmark", "firstname": "Ada", "lastname": "Lovelace",
+             "email": "ada@example.com", "role": "patient"}
+
+round_trips = 0
+
+
+def count_round_trips():
+    """Count every packet of commands sent to Redis, a pipeline counts once"""
+    original = Connection.send_packed_command
+
+    async def send_packed_command(self, command, check_health=True):
+        global round_trips
+        round_trips += 1
+        return await original(self, command, check_health)
+
+    Connection.send_packed_command = send_packed_command
+
+
+async def start_latency_proxy(target_host, target_port, rtt):
+    """TCP proxy adding half the round-trip time in each direction, like a remote Redis over TLS"""
+    loop = asyncio.get_running_loop()
+
+    def no_delay(writer):
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def pipe(reader, writer):
+        # Every chunk is delivered rtt/2 after it arrived, chunks in flight don't wait for each other
+        queue = asyncio.Queue()
+
+        async def deliver():
+            while (item := await queue.get()) is not None:
+                deadline, data = item
+                await asyncio.sleep(max(0, deadline - loop.time()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        delivery = asyncio.create_task(deliver())
+        while data := await reader.read(65536):
+            queue.put_nowait((loop.time() + rtt / 2, data))
+        queue.put_nowait(None)
+        await delivery
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(target_host, target_port)
+        no_delay(client_writer)
+        no_delay(server_writer)
+        try:
+            await asyncio.gather(pipe(client_reader, server_writer), pipe(server_reader, client_writer),
+                                 return_exceptions=True)
+        except asyncio.CancelledError:
+            # Connections still open when the benchmark exits
+            pass
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def sequential_login(client, user_id):
+    await client.set(f"user:{user_id}", json.dumps(USER_DATA), ex=86400)
+    await client.set(f"session:{user_id}", "access-token", ex=3600)
+    await client.set(f"refresh:{user_id}", "refresh-token", ex=86400)
+
+
+async def sequential_signup(client, user_id):
+    await client.set(f"session:{user_id}", "access-token", ex=3600)
+    await client.set(f"refresh:{user_id}", "refresh-token", ex=86400)
+
+
+async def sequential_refresh(client, user_id):
+    await client.set(f"session:{user_id}", "access-token-2", ex=3600)
+    await client.set(f"refresh:{user_id}", "refresh-token-2", ex=86400)
+    return await client.get(f"user:{user_id}")
+
+
+async def sequential_logout(client, user_id):
+    await client.delete(f"user:{user_id}", f"session:{user_id}", f"refresh:{user_id}")
+
+
+OPERATIONS = [
+    ("login", sequential_login,
+     lambda user_id: session_store.save(user_id, "access-token", "refresh-token", USER_DATA)),
+    ("signup", sequential_signup,
+     lambda user_id: session_store.save(user_id, "access-token", "refresh-token")),
+    ("refresh", sequential_refresh,
+     lambda user_id: session_store.rotate(user_id, "access-token-2", "refresh-token-2")),
+    ("logout", sequential_logout,
+     lambda user_id: session_store.invalidate(user_id)),
+]
+
+
+async def measure(iterations, operation):
+    global round_trips
+    durations = []
+    round_trips = 0
+    for i in range(iterations):
+        started = time.perf_counter()
+        await operation(f"benchmark-{i}")
+        durations.append(time.perf_counter() - started)
+    return round_trips / iterations, statistics.median(durations) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Round trips per auth operation: sequential commands vs SessionStore")
+    parser.add_argument("--host", default=os.getenv("REDIS_HOST", "localhost"), help="Redis host")
+    parser.add_argument("--port", type=int, default=int(os.getenv("REDIS_PORT", "6379")), help="Redis port")
+    parser.add_argument("--rtt", type=float, default=2.0, help="Simulated network round-trip time in ms")
+    parser.add_argument("--iterations", type=int, default=200, help="Operations per measurement")
+    args = parser.parse_args()
+
+    print("Session Store Round-Trip Benchmark")
+    print("==================================")
+
+    count_round_trips()
+    proxy, proxy_port = await start_latency_proxy(args.host, args.port, args.rtt / 1000)
+    client = redis.Redis(host="127.0.0.1", port=proxy_port, decode_responses=True)
+    redis_db.redis_client = client
+
+    try:
+        # Warm the connection pool so connection setup isn't measured
+        await client.ping()
+
+        print(f"\nSimulated RTT: {args.rtt} ms, {args.iterations} operations each")
+        print(f"{'operation':<10} {'sequential':>22} {'SessionStore':>24}")
+        for name, sequential, store in OPERATIONS:
+            seq_trips, seq_ms = await measure(args.iterations, lambda user_id: sequential(client, user_id))
+            store_trips, store_ms = await measure(args.iterations, store)
+            print(f"{name:<10} {seq_trips:>4.1f} trips {seq_ms:>7.2f} ms p50 {store_trips:>6.1f} trips {store_ms:>7.2f} ms p50")
+    finally:
+        await session_store.invalidate(*[f"benchmark-{i}" for i in range(args.iterations)])
+        await client.aclose()
+        proxy.close()
+        await proxy.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
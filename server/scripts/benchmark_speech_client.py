@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.fake_aws import FakeAWSServer, configure_environment
+
+
+def measure(label, iterations, make_service):
+    """Time client acquisition and a full synthesize call per iteration"""
+    setup_times = []
+    call_times = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        service = make_service()
+        ready = time.perf_counter()
+        service.synthesize(f"Benchmark prompt {i}")
+        finished = time.perf_counter()
+        setup_times.append(ready - started)
+        call_times.append(finished - started)
+
+    print(f"\n{label} ({iterations} requests)")
+    print(f"- Client setup p50: {statistics.median(setup_times) * 1000:.2f} ms")
+    print(f"- Request total p50: {statistics.median(call_times) * 1000:.2f} ms")
+    print(f"- Request total mean: {statistics.mean(call_times) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request and shared Polly client overhead")
+    parser.add_argument("--iterations", type=int, default=200, help="Number of synthesize calls per mode")
+    args = parser.parse_args()
+
+    print("Polly Client Overhead Benchmark")
+    print("===============================")
+
+    server = FakeAWSServer(polly_latency=0).start()
+    configure_environment(server.url)
+
+    from utils.speech_service import SpeechService, speech_services, get_speech_service
+
+    try:
+        measure("Per-request client: SpeechService()", args.iterations, SpeechService)
+        measure("Shared client: get_speech_service()", args.iterations, get_speech_service)
+    finally:
+        speech_services.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import asyncio
+import logging
+import argparse
+import signal
+from dotenv import load_dotenv
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables from .env file
+load_dotenv()
+
+from database.postgres import init_postgres, close_postgres
+from database.redis import init_redis, close_redis
+from chat.chat_events import ChatEventConsumer, CHAT_EVENTS_BATCH_SIZE, CHAT_EVENTS_STREAM
+from utils import metrics
+
+
+async def report(consumer, interval):
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = metrics.snapshot()
+        lag = snapshot["timings"].get("chat.events.lag_seconds", {})
+        print(f"processed={metrics.get_counter('chat.events.processed')} "
+              f"dead_lettered={metrics.get_counter('chat.events.dead_lettered')} "
+              f"group={consumer.group_info} lag={lag}")
+
+
+async def run(name, batch_size, report_interval):
+    await init_postgres()
+    await init_redis()
+    consumer = ChatEventConsumer(name=name, batch_size=batch_size)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+
+    consumer.start()
+    reporter = asyncio.create_task(report(consumer, report_interval))
+    try:
+        await stop.wait()
+    finally:
+        # Unacknowledged events stay pending and are re-read on the next start (or claimed by
+        # another worker); a consumer without pending events leaves the group
+        reporter.cancel()
+        await consumer.stop()
+        await close_redis()
+        await close_postgres()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the chat events stream into Postgres")
+    parser.add_argument("--name", default=None, help="Consumer name (defaults to host-pid); keep it stable across restarts")
+    parser.add_argument("--batch-size", type=int, default=CHAT_EVENTS_BATCH_SIZE, help="Events per read and per transaction")
+    parser.add_argument("--report-interval", type=float, default=30, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print("Chat Events Worker")
+    print("==================")
+    print(f"\nConsuming {CHAT_EVENTS_STREAM}\n")
+    asyncio.run(run(args.name, args.batch_size, args.report_interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Minimal local stand-in for the AWS APIs used by the chat path (Secrets Manager,
+Lex V2 runtime and Polly). Used by the benchmark scripts so they can run without
+an AWS account and with a controlled, repeatable service latency.
+
+The server is wired in through the standard botocore per-service endpoint
+variables (AWS_ENDPOINT_URL_SECRETS_MANAGER, ...), see configure_environment().
+"""
+import json
+import os
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+LEX_TEXT_PATH = re.compile(
+    r"^/bots/(?P<bot>[^/]+)/botAliases/(?P<alias>[^/]+)/botLocales/(?P<locale>[^/]+)/sessions/(?P<session>[^/]+)/text$"
+)
+
+# Roughly one second of 24kbps MP3 audio
+FAKE_AUDIO = b"\xff\xf3\x44\xc4" + b"\x00" * 3000
+
+FAKE_SECRETS = {
+    "lex": {
+        "AWS_REGION": "ca-central-1",
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "LEX_BOT_ID": "FAKEBOT000",
+        "LEX_BOT_ALIAS_ID": "FAKEALIAS0",
+        "LEX_BOT_LOCALE_ID": "en_CA"
+    }
+}
+
+
+class FakeAWSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Avoid Nagle/delayed-ACK stalls on keep-alive connections
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _send(self, status, body, content_type="application/x-amz-json-1.1", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = self.rfile.read(length) if length else b""
+        target = self.headers.get("X-Amz-Target", "")
+
+        if target == "secretsmanager.GetSecretValue":
+            return self._get_secret_value(json.loads(payload or b"{}"))
+        if target == "secretsmanager.BatchGetSecretValue":
+            return self._batch_get_secret_value(json.loads(payload or b"{}"))
+        if target == "secretsmanager.ListSecrets":
+            return self._send(200, json.dumps({"SecretList": []}).encode())
+
+        match = LEX_TEXT_PATH.match(self.path)
+        if match:
+            return self._recognize_text(match.group("session"), json.loads(payload or b"{}"))
+
+        if self.path.startswith("/v1/speech"):
+            return self._synthesize_speech(json.loads(payload or b"{}"))
+
+        self._send(404, json.dumps({"message": f"Unknown operation {self.path}"}).encode())
+
+    def _get_secret_value(self, request):
+        self.server.count("secretsmanager")
+        secret_id = request.get("SecretId")
+        secret = self.server.secrets.get(secret_id)
+        if secret is None:
+            body = {"__type": "ResourceNotFoundException", "message": f"Secret {secret_id} not found"}
+            return self._send(400, json.dumps(body).encode())
+        body = {"ARN": f"arn:aws:secretsmanager:ca-central-1:000000000000:secret:{secret_id}",
+                "Name": secret_id,
+                "SecretString": json.dumps(secret)}
+        self._send(200, json.dumps(body).encode())
+
+    def _batch_get_secret_value(self, request):
+        self.server.count("secretsmanager")
+        values, errors = [], []
+        for secret_id in request.get("SecretIdList", []):
+            secret = self.server.secrets.get(secret_id)
+            if secret is None:
+                errors.append({"SecretId": secret_id, "ErrorCode": "ResourceNotFoundException",
+                               "Message": f"Secret {secret_id} not found"})
+            else:
+                values.append({"Name": secret_id, "SecretString": json.dumps(secret)})
+        self._send(200, json.dumps({"SecretValues": values, "Errors": errors}).encode())
+
+    def _recognize_text(self, session_id, request):
+        time.sleep(self.server.lex_latency)
+        self.server.count("lex")
+        text = request.get("text", "")
+        body = {
+            "sessionId": session_id,
+            "messages": [{"content": f"You said: {text}", "contentType": "PlainText"}],
+            "sessionState": {"intent": {"name": "FallbackIntent", "state": "Fulfilled", "slots": {}}},
+            "interpretations": [{"intent": {"name": "FallbackIntent", "slots": {}}}]
+        }
+        self._send(200, json.dumps(body).encode(), content_type="application/json")
+
+    def _synthesize_speech(self, request):
+        time.sleep(self.server.polly_latency)
+        self.server.count("polly")
+        self._send(200, FAKE_AUDIO, content_type="audio/mpeg",
+                   headers={"x-amzn-RequestCharacters": str(len(request.get("Text", "")))})
+
+
+class FakeAWSServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, lex_latency=0.05, polly_latency=0.1, secrets=None, port=0):
+        super().__init__(("127.0.0.1", port), FakeAWSHandler)
+        self.lex_latency = lex_latency
+        self.polly_latency = polly_latency
+        self.secrets = secrets or FAKE_SECRETS
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, service):
+        with self._lock:
+            self.calls[service] = self.calls.get(service, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def configure_environment(url):
+    """Point boto3/aioboto3 at the fake server using dummy credentials"""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "ca-central-1"
+    os.environ["AWS_REGION"] = "ca-central-1"
+    for service in ("SECRETS_MANAGER", "LEX_RUNTIME_V2", "POLLY"):
+        os.environ[f"AWS_ENDPOINT_URL_{service}"] = url
@@ -0,0 +1,161 @@
+"""
+Minimal local stand-in for the Supabase GoTrue auth API used by auth.auth (signup,
+password and refresh token grants, resend, recover and the user endpoint).
+
+Tokens are HS256 JWTs signed with the server's jwt_secret, so they pass
+auth.validate_token when SUPABASE_JWT_SECRET matches. Point the app at it with
+GOTRUE_URL=<server.url>.
+"""
+import json
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import jwt
+
+FAKE_JWT_SECRET = "fake-gotrue-jwt-secret-with-at-least-32-bytes"
+
+
+class FakeGoTrueHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, error_code, message):
+        self._send(status, {"code": status, "error_code": error_code, "msg": message})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _bearer_user(self):
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        try:
+            claims = jwt.decode(token, self.server.jwt_secret, algorithms=["HS256"], audience="authenticated")
+        except jwt.InvalidTokenError:
+            return None
+        return self.server.users_by_id.get(claims["sub"])
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        self.server.count()
+        url = urlparse(self.path)
+        body = self._read_json()
+
+        if url.path.endswith("/signup"):
+            if body.get("email") in self.server.users:
+                return self._error(422, "user_already_exists", "User already registered")
+            user = self.server.add_user(body["email"], body["password"])
+            return self._send(200, self.server.session(user))
+
+        if url.path.endswith("/token"):
+            grant_type = parse_qs(url.query).get("grant_type", [""])[0]
+            if grant_type == "password":
+                user = self.server.users.get(body.get("email"))
+                if not user or user["password"] != body.get("password"):
+                    return self._error(400, "invalid_credentials", "Invalid login credentials")
+                return self._send(200, self.server.session(user))
+            if grant_type == "refresh_token":
+                user = self.server.refresh_tokens.pop(body.get("refresh_token"), None)
+                if not user:
+                    return self._error(400, "refresh_token_not_found", "Invalid Refresh Token: Refresh Token Not Found")
+                return self._send(200, self.server.session(user))
+
+        if url.path.endswith("/resend") or url.path.endswith("/recover"):
+            return self._send(200, {})
+
+        self._error(404, "not_found", f"Unknown path {url.path}")
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.server.count()
+        if urlparse(self.path).path.endswith("/user"):
+            user = self._bearer_user()
+            if not user:
+                return self._error(401, "bad_jwt", "invalid JWT: token is invalid")
+            return self._send(200, self.server.public_user(user))
+        self._error(404, "not_found", f"Unknown path {self.path}")
+
+    def do_PUT(self):
+        time.sleep(self.server.latency)
+        self.server.count()
+        if urlparse(self.path).path.endswith("/user"):
+            user = self._bearer_user()
+            if not user:
+                return self._error(401, "bad_jwt", "invalid JWT: token is invalid")
+            body = self._read_json()
+            if "password" in body:
+                user["password"] = body["password"]
+            return self._send(200, self.server.public_user(user))
+        self._error(404, "not_found", f"Unknown path {self.path}")
+
+
+class FakeGoTrueServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency=0.05, jwt_secret=FAKE_JWT_SECRET, port=0):
+        super().__init__(("127.0.0.1", port), FakeGoTrueHandler)
+        self.latency = latency
+        self.jwt_secret = jwt_secret
+        self.users = {}
+        self.users_by_id = {}
+        self.refresh_tokens = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self):
+        with self._lock:
+            self.calls += 1
+
+    def add_user(self, email, password):
+        user = {"id": str(uuid.uuid4()), "email": email, "password": password,
+                "created_at": datetime.now(timezone.utc).isoformat()}
+        with self._lock:
+            self.users[email] = user
+            self.users_by_id[user["id"]] = user
+        return user
+
+    def public_user(self, user):
+        return {"id": user["id"], "aud": "authenticated", "role": "authenticated", "email": user["email"],
+                "app_metadata": {"provider": "email"}, "user_metadata": {}, "created_at": user["created_at"]}
+
+    def session(self, user, expires_in=3600):
+        now = int(time.time())
+        access_token = jwt.encode({"sub": user["id"], "email": user["email"], "aud": "authenticated",
+                                   "role": "authenticated", "iat": now, "exp": now + expires_in,
+                                   "session_id": str(uuid.uuid4())}, self.jwt_secret, algorithm="HS256")
+        refresh_token = uuid.uuid4().hex
+        with self._lock:
+            self.refresh_tokens[refresh_token] = user
+        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer",
+                "expires_in": expires_in, "expires_at": now + expires_in, "user": self.public_user(user)}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
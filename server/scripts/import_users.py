@@ -0,0 +1,60 @@
+import os
+import sys
+import csv
+import uuid
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables from .env file
+load_dotenv()
+
+from database.postgres import init_postgres, close_postgres, bulk_insert
+
+USER_COLUMNS = ["id", "email", "role", "firstname", "lastname"]
+
+
+def load_users(path):
+    """Read users from a CSV export with id, email, role, firstname and lastname columns"""
+    with open(path, newline="", encoding="utf-8") as users_file:
+        return [
+            (uuid.UUID(row["id"]), row["email"].strip().lower(), row.get("role") or "patient",
+             row.get("firstname"), row.get("lastname"))
+            for row in csv.DictReader(users_file)
+        ]
+
+
+async def import_users(users, batch_size):
+    """COPY the users in batches, skipping ids that already exist"""
+    await init_postgres()
+    try:
+        imported = 0
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            imported += await bulk_insert("users", USER_COLUMNS, batch, on_conflict="(id) DO NOTHING")
+            print(f"✓ {start + len(batch):>7} / {len(users)} rows processed")
+        return imported
+    finally:
+        await close_postgres()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users exported from a clinic system")
+    parser.add_argument("file", help="CSV file with id, email, role, firstname, lastname columns")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per COPY")
+    args = parser.parse_args()
+
+    print("User Import")
+    print("===========")
+
+    users = load_users(args.file)
+    print(f"\nImporting {len(users)} users from {args.file}\n")
+    imported = asyncio.run(import_users(users, args.batch_size))
+    print(f"\nImported {imported} users, {len(users) - imported} already existed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+AWS Lambda handler that forwards Lex V2 code hook events to the API (POST /lex/hook).
+
+Lex can only call a Lambda, so this stays a thin relay and all slot validation
+lives next to the availability index in the API. Deploy it with the standard
+Python runtime (no dependencies) and set:
+    LEX_HOOK_URL     e.g. https://api.example.com/lex/hook
+    LEX_HOOK_SECRET  same value as the API's LEX_HOOK_SECRET
+Then attach it to the bot alias and enable the dialog and fulfillment code
+hooks on the booking intent.
+"""
+import json
+import os
+import urllib.request
+
+LEX_HOOK_URL = os.environ.get("LEX_HOOK_URL")
+LEX_HOOK_SECRET = os.environ.get("LEX_HOOK_SECRET", "")
+# Lex waits at most a few seconds for a code hook
+LEX_HOOK_TIMEOUT_SECONDS = float(os.environ.get("LEX_HOOK_TIMEOUT_SECONDS", "2.5"))
+
+
+def _delegate(event):
+    # If the API can't be reached, let Lex carry on with its own prompts
+    session_state = event.get("sessionState", {})
+    return {
+        "sessionState": {
+            "sessionAttributes": session_state.get("sessionAttributes", {}),
+            "dialogAction": {"type": "Delegate"},
+            "intent": session_state.get("intent", {}),
+        }
+    }
+
+
+def lambda_handler(event, context):
+    request = urllib.request.Request(
+        LEX_HOOK_URL,
+        data=json.dumps(event).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Lex-Hook-Secret": LEX_HOOK_SECRET},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=LEX_HOOK_TIMEOUT_SECONDS) as response:
+            return json.loads(response.read())
+    except Exception as e:
+        print(f"Lex hook relay failed: {e}")
+        if event.get("invocationSource") == "FulfillmentCodeHook":
+            session_state = event.get("sessionState", {})
+            return {
+                "sessionState": {
+                    "sessionAttributes": session_state.get("sessionAttributes", {}),
+                    "dialogAction": {"type": "Close"},
+                    "intent": {**session_state.get("intent", {}), "state": "Failed"},
+                },
+                "messages": [{"contentType": "PlainText",
+                              "content": "Sorry, I couldn't book your appointment right now. Please try again later."}],
+            }
+        return _delegate(event)
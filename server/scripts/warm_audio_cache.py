@@ -0,0 +1,66 @@
+import os
+import sys
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+# Add parent directory to path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables from .env file
+load_dotenv()
+
+from database.redis import init_redis, close_redis
+from utils import metrics
+from utils.speech_service import get_speech_service, speech_services
+from chat.fast_path import FAQ_PATH, faq_answers, init_fast_path
+
+DEFAULT_PROMPTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chat", "known_prompts.txt")
+
+
+def load_prompts(path):
+    """Read one prompt per line, skipping blanks and # comments"""
+    with open(path, encoding="utf-8") as prompts_file:
+        return [line.strip() for line in prompts_file if line.strip() and not line.startswith("#")]
+
+
+async def warm_audio_cache(prompts, voice_id, engine, language_code):
+    """Pre-synthesize every prompt into the Redis audio cache tier"""
+    await init_redis()
+    try:
+        speech_service = get_speech_service(voice_id=voice_id)
+        for prompt in prompts:
+            audio = await speech_service.get_audio(prompt, language_code=language_code, engine=engine)
+            print(f"✓ {len(audio):>7} bytes  {prompt}")
+    finally:
+        await close_redis()
+        speech_services.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-synthesize the bot's known prompts into the audio cache")
+    parser.add_argument("--file", default=DEFAULT_PROMPTS_FILE, help="Prompt file, one prompt per line")
+    parser.add_argument("--faq-file", default=FAQ_PATH, help="FAQ table whose answers are warmed too")
+    parser.add_argument("--skip-faq", action="store_true", help="Only warm the prompt file")
+    parser.add_argument("--voice", default="Joanna", help="Polly voice id")
+    parser.add_argument("--engine", default="standard", help="Polly engine")
+    parser.add_argument("--language-code", default="en-US", help="Polly language code")
+    args = parser.parse_args()
+
+    print("Audio Cache Warm-up")
+    print("===================")
+
+    prompts = load_prompts(args.file)
+    if not args.skip_faq:
+        # FAQ answers are served by the chat fast path without Lex, so their audio must be ready too
+        init_fast_path(args.faq_file)
+        prompts += [answer for answer in faq_answers() if answer not in prompts]
+    print(f"\nWarming {len(prompts)} prompts from {args.file}{'' if args.skip_faq else ' and ' + args.faq_file}\n")
+    asyncio.run(warm_audio_cache(prompts, args.voice, args.engine, args.language_code))
+
+    already_cached = metrics.get_counter("audio_cache.redis_hits") + metrics.get_counter("audio_cache.lru_hits")
+    print(f"\nSynthesized {metrics.get_counter('audio_cache.misses')} prompts, {already_cached} were already cached")
+
+
+if __name__ == "__main__":
+    main()
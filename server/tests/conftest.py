@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Modules read their configuration at import time; keep the tests off real AWS and Supabase
+os.environ.setdefault("supabase_secret_name", "test")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ca-central-1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from appointments import appointments_handler, store
+from appointments.availability import availability
+from models.Models import AppointmentUpdate, User
+
+PATIENT_ID = uuid4()
+PROVIDER_ID = uuid4()
+
+
+def appointment(status="scheduled"):
+    starts_at = datetime.now(availability.tz).replace(microsecond=0) + timedelta(days=30)
+    return {
+        "id": uuid4(), "patient_id": PATIENT_ID, "provider_id": PROVIDER_ID, "provider_name": "Dr. Smith",
+        "service": "cleaning", "starts_at": starts_at, "ends_at": starts_at + timedelta(minutes=45),
+        "status": status, "notes": None, "version": 0,
+    }
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """The appointment handed to the handler and the changes it asked the store to save"""
+    state = {"record": appointment(), "changes": None}
+
+    async def get_appointment(appointment_id, connection=None):
+        return state["record"]
+
+    async def update_appointment(appointment_id, changes):
+        state["changes"] = changes
+        return {**state["record"], **changes}
+
+    monkeypatch.setattr(store, "get_appointment", get_appointment)
+    monkeypatch.setattr(store, "update_appointment", update_appointment)
+    monkeypatch.setattr(availability, "is_free", lambda *args, **kwargs: True)
+    return state
+
+
+def patch(state, role="", **changes):
+    user = User(id=PATIENT_ID if role == "" else uuid4(), email="someone@example.com", role=role)
+    return asyncio.run(appointments_handler.update_appointment(state["record"]["id"], AppointmentUpdate(**changes), user))
+
+
+def test_patient_can_cancel(saved):
+    assert patch(saved, status="cancelled")["status"] == "cancelled"
+
+
+@pytest.mark.parametrize("status", ["completed", "no_show"])
+def test_patient_cannot_record_an_outcome(saved, status):
+    with pytest.raises(HTTPException) as error:
+        patch(saved, status=status)
+    assert error.value.status_code == 403
+    assert saved["changes"] is None
+
+
+def test_patient_cannot_reopen_a_cancelled_appointment(saved):
+    saved["record"] = appointment("cancelled")
+    with pytest.raises(HTTPException) as error:
+        patch(saved, status="scheduled")
+    assert error.value.status_code == 403
+
+
+def test_patient_cannot_move_a_cancelled_appointment(saved):
+    saved["record"] = appointment("cancelled")
+    with pytest.raises(HTTPException) as error:
+        patch(saved, notes="running late")
+    assert error.value.status_code == 409
+
+
+def test_patient_cannot_change_provider(saved):
+    with pytest.raises(HTTPException) as error:
+        patch(saved, provider_id=uuid4())
+    assert error.value.status_code == 403
+
+
+def test_staff_records_outcomes_of_any_patient(saved):
+    assert patch(saved, role="staff", status="no_show")["status"] == "no_show"
+    provider_id = uuid4()
+    assert patch(saved, role="admin", provider_id=provider_id)["provider_id"] == str(provider_id)
+
+
+def test_other_patients_get_not_found(saved):
+    with pytest.raises(HTTPException) as error:
+        patch(saved, role="patient", status="cancelled")
+    assert error.value.status_code == 404
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from appointments.availability import AvailabilityIndex
+
+PROVIDER = "p1"
+APPOINTMENT = "a1"
+
+
+def monday_at(hour):
+    index = AvailabilityIndex()
+    return index, datetime(2030, 1, 7, hour, tzinfo=index.tz)
+
+
+def test_notification_ahead_of_local_update_is_kept():
+    index, nine = monday_at(9)
+    ten = nine + timedelta(hours=1)
+    index.book(APPOINTMENT, PROVIDER, nine, nine + timedelta(minutes=30), 0)
+    # The move's NOTIFY lands first, then the worker applies its own (older) view of the row
+    index.book(APPOINTMENT, PROVIDER, ten, ten + timedelta(minutes=30), 2)
+    index.book(APPOINTMENT, PROVIDER, nine, nine + timedelta(minutes=30), 1)
+    assert index.is_free(PROVIDER, nine, nine + timedelta(minutes=30))
+    assert not index.is_free(PROVIDER, ten, ten + timedelta(minutes=30))
+
+
+def test_release_is_not_undone_by_a_late_booking():
+    index, nine = monday_at(9)
+    index.release(APPOINTMENT, 3)
+    index.book(APPOINTMENT, PROVIDER, nine, nine + timedelta(minutes=30), 2)
+    assert index.is_free(PROVIDER, nine, nine + timedelta(minutes=30))
+    assert len(index) == 0
+
+
+def test_unversioned_changes_always_apply():
+    index, nine = monday_at(9)
+    index.book(APPOINTMENT, PROVIDER, nine, nine + timedelta(minutes=30), 5)
+    index.release(APPOINTMENT)
+    assert index.is_free(PROVIDER, nine, nine + timedelta(minutes=30))
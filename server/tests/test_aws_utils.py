@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from utils import aws_utils
+from utils.concurrency import DependencyOverloaded
+
+
+class SheddingLimiter:
+    def slot_sync(self):
+        raise DependencyOverloaded("secrets", retry_after=1)
+
+
+class Client:
+    class meta:
+        region_name = "ca-central-1"
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def get_secret_value(self, SecretId):
+        self.calls.append(SecretId)
+        if SecretId in self.failing:
+            raise RuntimeError(f"{SecretId} is gone")
+        return {"SecretString": '{"value": "from aws"}'}
+
+    def batch_get_secret_value(self, SecretIdList):
+        raise RuntimeError("batch API not allowed")
+
+
+@pytest.fixture(autouse=True)
+def secrets(monkeypatch):
+    monkeypatch.setattr(aws_utils, "_secret_cache", {})
+    monkeypatch.setenv("REDIS_HOST", "localhost")
+
+
+def test_shed_call_uses_the_fallback_without_caching_it_for_long(monkeypatch):
+    monkeypatch.setattr(aws_utils, "get_secrets_client", lambda: Client())
+    monkeypatch.setattr(aws_utils, "secrets_limiter", SheddingLimiter())
+    assert aws_utils.get_secret("redis") == {"host": "localhost"}
+
+    _, fetched_at = aws_utils._secret_cache["redis"]
+    age = time.monotonic() - fetched_at
+    # Stale (so refreshed on the next read) once SECRET_FALLBACK_TTL_SECONDS have passed
+    assert age + aws_utils.SECRET_FALLBACK_TTL_SECONDS >= aws_utils.SECRET_CACHE_TTL_SECONDS
+
+
+def test_fallback_does_not_replace_a_cached_value(monkeypatch):
+    aws_utils._secret_cache["redis"] = ({"value": "from aws"}, time.monotonic() - aws_utils.SECRET_CACHE_TTL_SECONDS)
+    monkeypatch.setattr(aws_utils, "get_secrets_client", lambda: Client())
+    monkeypatch.setattr(aws_utils, "secrets_limiter", SheddingLimiter())
+    assert aws_utils._fetch_single_flight("redis") == {"host": "localhost"}
+    assert aws_utils._secret_cache["redis"][0] == {"value": "from aws"}
+
+
+def test_refresher_keeps_going_past_a_failing_secret(monkeypatch):
+    client = Client(failing={"postgres"})
+    monkeypatch.setattr(aws_utils, "get_secrets_client", lambda: client)
+    long_ago = time.monotonic() - 10
+    aws_utils._secret_cache.update({"postgres": ({}, long_ago), "supabase": ({}, long_ago), "redis": ({}, long_ago)})
+
+    aws_utils.start_secret_refresher(interval_seconds=0.05)
+    try:
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and aws_utils._secret_cache["redis"][0] != {"value": "from aws"}:
+            time.sleep(0.01)
+    finally:
+        aws_utils.stop_secret_refresher()
+    assert aws_utils._secret_cache["supabase"][0] == {"value": "from aws"}
+    assert aws_utils._secret_cache["redis"][0] == {"value": "from aws"}
@@ -0,0 +1,33 @@
+import asyncio
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from chat import chat_handler
+
+AUDIO_ID = "ab" * 32
+
+
+def fetch(audio_id, sig):
+    request = Request({"type": "http", "method": "GET", "path": f"/chat/audio/{audio_id}", "headers": []})
+    return asyncio.run(chat_handler.get_chat_audio(request, audio_id, sig))
+
+
+def test_signed_url_serves_private_audio(monkeypatch):
+    async def cached(audio_id):
+        return b"mp3"
+
+    monkeypatch.setattr(chat_handler.audio_cache, "get", cached)
+    sig = parse_qs(urlparse(chat_handler.audio_url(AUDIO_ID)).query)["sig"][0]
+    response = fetch(AUDIO_ID, sig)
+    assert response.body == b"mp3"
+    assert response.headers["cache-control"].startswith("private")
+
+
+@pytest.mark.parametrize("sig", [None, "0" * 32])
+def test_unsigned_or_forged_url_is_refused(sig):
+    with pytest.raises(HTTPException) as error:
+        fetch(AUDIO_ID, sig)
+    assert error.value.status_code == 403
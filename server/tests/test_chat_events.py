@@ -0,0 +1,143 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from chat import chat_events
+from chat.chat_events import CHAT_EVENTS_GROUP, CHAT_EVENTS_STREAM, DEAD_LETTER_STREAM, ChatEventConsumer
+from utils import metrics
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def get_redis_client():
+        return client
+
+    monkeypatch.setattr(chat_events, "get_redis_client", get_redis_client)
+    return client
+
+
+def turn(message):
+    return {"text": f"reply to {message}", "intent": None, "source": "lex", "slots": None}
+
+
+async def read_pending(redis, consumer, new=True):
+    await consumer.ensure_group(redis)
+    response = await redis.xreadgroup(CHAT_EVENTS_GROUP, consumer.name, {CHAT_EVENTS_STREAM: ">" if new else "0"},
+                                      count=100)
+    return response[0][1] if response else []
+
+
+def test_trimmed_pending_entry_is_acked(redis):
+    async def scenario():
+        consumer = ChatEventConsumer(name="c1")
+        await chat_events.publish_turn("s1", None, "hi", turn("hi"))
+        await read_pending(redis, consumer)
+        # MAXLEN trimmed the entry while it was still pending
+        await redis.xtrim(CHAT_EVENTS_STREAM, maxlen=0)
+        messages = await read_pending(redis, consumer, new=False)
+        assert messages and messages[0][1] == {}
+
+        await consumer.process(redis, messages)
+        assert (await redis.xpending(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP))["pending"] == 0
+        assert await redis.xlen(DEAD_LETTER_STREAM) == 0
+
+    trimmed = metrics.get_counter("chat.events.trimmed")
+    asyncio.run(scenario())
+    assert metrics.get_counter("chat.events.trimmed") == trimmed + 1
+
+
+def test_outage_does_not_dead_letter(redis, monkeypatch):
+    async def write_events(events):
+        raise ConnectionError("database is down")
+
+    async def database_reachable(self):
+        return False
+
+    monkeypatch.setattr(chat_events, "write_events", write_events)
+    monkeypatch.setattr(ChatEventConsumer, "database_reachable", database_reachable)
+
+    async def scenario():
+        consumer = ChatEventConsumer(name="c1")
+        for message in ("a", "b", "c"):
+            await chat_events.publish_turn("s1", None, message, turn(message))
+        messages = await read_pending(redis, consumer)
+        for _ in range(chat_events.CHAT_EVENTS_MAX_DELIVERIES * 2):
+            with pytest.raises(ConnectionError):
+                await consumer.process(redis, messages)
+        assert consumer.write_failures == {}
+        assert (await redis.xpending(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP))["pending"] == 3
+        assert await redis.xlen(DEAD_LETTER_STREAM) == 0
+
+    asyncio.run(scenario())
+
+
+def test_event_failing_alone_is_dead_lettered(redis, monkeypatch):
+    written = []
+
+    async def write_events(events):
+        if len(events) > 1 or events[0]["message"] == "bad":
+            raise ValueError("row rejected")
+        written.extend(event["message"] for event in events)
+
+    async def database_reachable(self):
+        return True
+
+    monkeypatch.setattr(chat_events, "write_events", write_events)
+    monkeypatch.setattr(ChatEventConsumer, "database_reachable", database_reachable)
+
+    async def scenario():
+        consumer = ChatEventConsumer(name="c1")
+        for message in ("a", "bad", "c"):
+            await chat_events.publish_turn("s1", None, message, turn(message))
+        messages = await read_pending(redis, consumer)
+        await consumer.process(redis, messages)
+        assert sorted(written) == ["a", "c"]
+
+        bad = [message for message in messages if message[1]["message"] == "bad"]
+        for _ in range(chat_events.CHAT_EVENTS_MAX_DELIVERIES - 1):
+            assert await redis.xlen(DEAD_LETTER_STREAM) == 0
+            await consumer.process(redis, bad)
+        assert await redis.xlen(DEAD_LETTER_STREAM) == 1
+        assert (await redis.xpending(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP))["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_stop_leaves_group_only_without_pending_events(redis):
+    async def consumers():
+        return {consumer["name"]: consumer["pending"]
+                for consumer in await redis.xinfo_consumers(CHAT_EVENTS_STREAM, CHAT_EVENTS_GROUP)}
+
+    async def scenario():
+        idle, busy = ChatEventConsumer(name="idle"), ChatEventConsumer(name="busy")
+        await read_pending(redis, idle)
+        await chat_events.publish_turn("s1", None, "hi", turn("hi"))
+        await read_pending(redis, busy)
+        assert await consumers() == {"idle": 0, "busy": 1}
+
+        await idle.leave_group()
+        await busy.leave_group()
+        assert await consumers() == {"busy": 1}
+
+    asyncio.run(scenario())
+
+
+def test_claim_abandoned_accepts_redis_6_replies(redis, monkeypatch):
+    xautoclaim = redis.xautoclaim
+
+    async def xautoclaim_6_2(*args, **kwargs):
+        # Redis 6.2 has no list of deleted ids
+        return (await xautoclaim(*args, **kwargs))[:2]
+
+    monkeypatch.setattr(redis, "xautoclaim", xautoclaim_6_2)
+    monkeypatch.setattr(chat_events, "CHAT_EVENTS_CLAIM_IDLE_MS", 0)
+
+    async def scenario():
+        await chat_events.publish_turn("s1", None, "hi", turn("hi"))
+        await read_pending(redis, ChatEventConsumer(name="dead"))
+        assert await ChatEventConsumer(name="c1").claim_abandoned(redis) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from chat import fast_path
+from chat.fast_path import FaqMatcher, _days
+from utils import lex_dialog, lex_utils
+
+
+class FakeLex:
+    def __init__(self):
+        self.calls = []
+
+    async def recognize_text(self, **request):
+        self.calls.append(request["text"])
+        action = "ElicitSlot" if "book" in request["text"] else "Close"
+        return {"messages": [{"content": "lex reply"}], "sessionState": {"dialogAction": {"type": action}}}
+
+
+@pytest.fixture
+def lex(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def get_redis_client():
+        return client
+
+    fake = FakeLex()
+    monkeypatch.setattr(lex_dialog, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(lex_utils, "async_lex_client", fake)
+    monkeypatch.setattr(fast_path, "FAQ_ENABLED", True)
+    monkeypatch.setattr(fast_path, "faq_matcher", FaqMatcher.load())
+    return fake
+
+
+def test_faq_is_answered_locally(lex):
+    response = asyncio.run(fast_path.get_bot_response("s1", "thanks"))
+    assert response["source"] == "faq"
+    assert lex.calls == []
+
+
+def test_faq_during_a_dialog_goes_to_lex(lex):
+    async def scenario():
+        await fast_path.get_bot_response("s1", "book a cleaning")
+        return await fast_path.get_bot_response("s1", "thanks")
+
+    assert asyncio.run(scenario())["source"] == "lex"
+    assert lex.calls == ["book a cleaning", "thanks"]
+
+
+def test_dialog_opened_on_another_worker_is_seen(lex):
+    async def scenario():
+        # Another worker ran the turn that asked for a slot
+        await lex_dialog.save_dialog_state("s1", {"dialogAction": {"type": "ElicitSlot"}})
+        return await fast_path.get_bot_response("s1", "hi")
+
+    assert asyncio.run(scenario())["source"] == "lex"
+
+
+def test_unknown_dialog_state_goes_to_lex(lex):
+    async def scenario():
+        await lex_dialog.save_dialog_state("s1", None)
+        return await fast_path.get_bot_response("s1", "hi")
+
+    assert asyncio.run(scenario())["source"] == "lex"
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("hi", "Greeting"),
+    ("Hi there, good morning!", "Greeting"),
+    ("hi, tooth pain", None),
+    ("hey its urgent", None),
+    ("hi what are your hours", "OpeningHours"),
+])
+def test_match(message, intent):
+    entry = FaqMatcher.load().match(message)
+    assert (entry["intent"] if entry else None) == intent
+
+
+def test_opening_days_come_from_configuration():
+    assert _days("0,1,2,3,4") == "Monday to Friday"
+    assert _days("0,2,4") == "Monday, Wednesday and Friday"
+    assert _days("5") == "Saturday"
@@ -0,0 +1,70 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from utils import lex_dialog, lex_utils
+from utils.lex_cache import LexResponseCache
+
+
+class FakeLex:
+    """RecognizeText that answers with the dialog action scripted for each message"""
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.calls = []
+
+    async def recognize_text(self, **request):
+        self.calls.append(request["text"])
+        return {
+            "messages": [{"content": f"reply to {request['text']}"}],
+            "sessionState": {"dialogAction": {"type": self.actions[request["text"]]}},
+        }
+
+
+@pytest.fixture
+def lex(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def get_redis_client():
+        return client
+
+    fake = FakeLex({"hello": "Close", "what are your hours": "Close", "book a cleaning": "ElicitSlot"})
+    monkeypatch.setattr(lex_dialog, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(lex_utils, "async_lex_client", fake)
+    monkeypatch.setattr(lex_utils, "LEX_RESPONSE_CACHE", True)
+    return fake
+
+
+def on_worker(monkeypatch, cache, session_id, message):
+    monkeypatch.setattr(lex_utils, "lex_response_cache", cache)
+    return asyncio.run(lex_utils.send_message_to_lex_async(session_id, message))
+
+
+def test_idle_reply_is_cached(lex, monkeypatch):
+    worker = LexResponseCache()
+    on_worker(monkeypatch, worker, "s1", "hello")
+    on_worker(monkeypatch, worker, "s1", "what are your hours")
+    on_worker(monkeypatch, worker, "s1", "what are your hours")
+    assert lex.calls == ["hello", "what are your hours"]
+
+
+def test_dialog_opened_on_another_worker_bypasses_the_cache(lex, monkeypatch):
+    worker_a, worker_b = LexResponseCache(), LexResponseCache()
+    on_worker(monkeypatch, worker_a, "s1", "hello")
+    on_worker(monkeypatch, worker_a, "s1", "what are your hours")
+    # Worker B starts a booking: Lex now waits for a slot value
+    on_worker(monkeypatch, worker_b, "s1", "book a cleaning")
+
+    on_worker(monkeypatch, worker_a, "s1", "what are your hours")
+    assert lex.calls == ["hello", "what are your hours", "book a cleaning", "what are your hours"]
+
+
+def test_unknown_state_bypasses_the_cache(lex, monkeypatch):
+    worker = LexResponseCache()
+    on_worker(monkeypatch, worker, "s1", "hello")
+    on_worker(monkeypatch, worker, "s1", "what are your hours")
+    asyncio.run(lex_dialog.save_dialog_state("s1", None))
+
+    on_worker(monkeypatch, worker, "s1", "what are your hours")
+    assert lex.calls.count("what are your hours") == 2
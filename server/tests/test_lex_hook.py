@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import fakeredis
+import pytest
+
+from appointments import lex_hook, store
+from appointments.availability import availability
+from utils import lex_dialog, lex_utils
+
+SESSION_ID = "chat-session"
+PATIENT_ID = str(uuid4())
+
+
+class RecordingLex:
+    def __init__(self):
+        self.requests = []
+
+    async def recognize_text(self, **request):
+        self.requests.append(request)
+        return {"messages": [{"content": "ok"}], "sessionState": {"dialogAction": {"type": "ElicitSlot"}}}
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def get_redis_client():
+        return client
+
+    monkeypatch.setattr(lex_dialog, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(lex_utils, "LEX_RESPONSE_CACHE", False)
+    return client
+
+
+@pytest.fixture
+def booked(monkeypatch):
+    """Patients the hook booked for"""
+    patients = []
+
+    async def create_appointment(patient_id, provider_id, service, starts_at, ends_at, notes=None):
+        patients.append(str(patient_id))
+        return {"id": uuid4()}
+
+    monkeypatch.setattr(store, "create_appointment", create_appointment)
+    return patients
+
+
+def fulfill(patient_id):
+    starts_at = datetime.now(availability.tz) + timedelta(days=7)
+    event = {
+        "sessionId": SESSION_ID,
+        "sessionState": {"intent": {"name": "BookAppointment", "slots": {}},
+                         "sessionAttributes": {"patient_id": patient_id}},
+    }
+    response = asyncio.run(lex_hook.fulfill_booking(event, str(uuid4()), starts_at, starts_at + timedelta(minutes=30)))
+    return response["sessionState"]["intent"]["state"]
+
+
+def send(patient_id=None):
+    return asyncio.run(lex_utils.send_message_to_lex_async(SESSION_ID, "book a cleaning", patient_id=patient_id))
+
+
+def test_patient_attribute_is_sent_on_every_turn(redis, monkeypatch):
+    fake = RecordingLex()
+    monkeypatch.setattr(lex_utils, "async_lex_client", fake)
+    send(PATIENT_ID)
+    send()
+    attributes = [request["sessionState"]["sessionAttributes"] for request in fake.requests]
+    assert attributes == [{"patient_id": PATIENT_ID}, {"patient_id": ""}]
+
+
+def test_hook_books_for_the_owner_of_the_turn(redis, booked, monkeypatch):
+    monkeypatch.setattr(lex_utils, "async_lex_client", RecordingLex())
+    send(PATIENT_ID)
+    assert fulfill(PATIENT_ID) == "Fulfilled"
+    assert booked == [PATIENT_ID]
+
+
+def test_hook_refuses_a_patient_who_did_not_send_the_turn(redis, booked, monkeypatch):
+    monkeypatch.setattr(lex_utils, "async_lex_client", RecordingLex())
+    send()
+    assert fulfill(PATIENT_ID) == "Failed"
+    assert booked == []
+
+
+def test_hook_refuses_when_the_owner_is_unknown(redis, booked):
+    assert fulfill(PATIENT_ID) == "Failed"
+    assert booked == []
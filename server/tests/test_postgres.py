@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from database import postgres
+from utils.concurrency import DependencyOverloaded
+
+
+class BusyPool:
+    async def acquire(self, timeout=None):
+        raise asyncio.TimeoutError()
+
+
+def test_acquire_timeout_sheds_load(monkeypatch):
+    monkeypatch.setattr(postgres, "postgres_pool", BusyPool())
+
+    async def acquire():
+        async with postgres.acquire_connection():
+            pass
+
+    with pytest.raises(DependencyOverloaded) as error:
+        asyncio.run(acquire())
+    assert error.value.dependency == "postgres"
+
+
+@pytest.mark.parametrize("workers, override, expected", [
+    (None, None, 10),
+    ("4", None, 10),
+    ("8", None, 5),
+    (None, "25", 25),
+])
+def test_pool_size(monkeypatch, workers, override, expected):
+    monkeypatch.setattr(postgres, "WEB_CONCURRENCY", workers)
+    monkeypatch.setattr(postgres, "POSTGRES_POOL_MAX_SIZE", override)
+    assert postgres.pool_size()[1] == expected
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+from auth import principal_cache as principal_cache_module
+from auth.principal_cache import PrincipalCache, token_id
+from database import session_store as session_store_module
+from utils.concurrency import DependencyOverloaded
+
+USER_ID = "6b1f0f5e-8d1a-4c55-9a43-3f0f8c1a2b3c"
+
+
+def claims(**extra):
+    return {"sub": USER_ID, "exp": int(time.time()) + 3600, **extra}
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def get_redis_client():
+        return client
+
+    async def cached_mget(*keys):
+        return await client.mget(*keys)
+
+    monkeypatch.setattr(principal_cache_module, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(principal_cache_module, "cached_mget", cached_mget)
+    monkeypatch.setattr(session_store_module, "get_redis_client", get_redis_client)
+    asyncio.run(client.set(f"user:{USER_ID}", "{}"))
+    return client
+
+
+def test_logout_revokes_the_token_on_every_worker(redis):
+    payload = claims(session_id="s1")
+    this_worker, other_worker = PrincipalCache(), PrincipalCache()
+
+    async def scenario():
+        await this_worker.get(payload, "token")
+        await other_worker.get(payload, "token")
+        await this_worker.invalidate(USER_ID, payload, "token")
+        # The other worker still holds the principal in its LRU
+        await other_worker.get(payload, "token")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 401
+
+
+def test_tokens_without_session_or_jti_are_revoked_one_by_one(redis):
+    # Same expiry, as two tokens issued in the same second would have
+    payload = claims()
+    cache = PrincipalCache()
+
+    async def scenario():
+        await cache.invalidate(USER_ID, payload, "first token")
+        return await cache.get(payload, "second token")
+
+    assert str(asyncio.run(scenario()).id) == USER_ID
+    assert token_id(payload, "first token") != token_id(payload, "second token")
+
+
+def test_redis_failure_rejects_cached_principals(redis, monkeypatch):
+    payload = claims(session_id="s1")
+    cache = PrincipalCache()
+    asyncio.run(cache.get(payload, "token"))
+
+    async def broken_mget(*keys):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(principal_cache_module, "cached_mget", broken_mget)
+    with pytest.raises(DependencyOverloaded):
+        asyncio.run(cache.get(payload, "token"))
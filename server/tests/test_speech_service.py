@@ -0,0 +1,66 @@
+import asyncio
+import io
+
+import pytest
+
+from utils import speech_service
+from utils.speech_service import SpeechService, polly_limiter
+
+
+class FakePolly:
+    def __init__(self, audio):
+        self.audio = audio
+
+    def synthesize_speech(self, **request):
+        return {"AudioStream": io.BytesIO(self.audio)}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    stored = {}
+
+    async def get(key):
+        return stored.get(key)
+
+    async def set(key, audio):
+        stored[key] = audio
+
+    monkeypatch.setattr(speech_service.audio_cache, "get", get)
+    monkeypatch.setattr(speech_service.audio_cache, "set", set)
+    return stored
+
+
+def test_polly_slot_is_released_before_a_slow_client_is_done(cache):
+    audio = bytes(range(256)) * 64
+    service = SpeechService(client=FakePolly(audio))
+
+    async def slow_client():
+        chunks = service.stream_audio("Your appointment is booked", chunk_size=1024)
+        received = [await chunks.__anext__()]
+        # The client has read one chunk; Polly's stream is already drained into the buffer
+        for _ in range(100):
+            if polly_limiter.stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        in_flight = polly_limiter.stats()["in_flight"]
+        received += [chunk async for chunk in chunks]
+        return in_flight, b"".join(received)
+
+    in_flight, received = asyncio.run(slow_client())
+    assert in_flight == 0
+    assert received == audio
+    assert list(cache.values()) == [audio]
+
+
+def test_client_leaving_early_still_caches_the_clip(cache):
+    audio = b"x" * 10000
+    service = SpeechService(client=FakePolly(audio))
+
+    async def leave_after_first_chunk():
+        chunks = service.stream_audio("See you soon", chunk_size=1000)
+        await chunks.__anext__()
+        await chunks.aclose()
+        await asyncio.gather(*speech_service._stream_readers)
+
+    asyncio.run(leave_after_first_chunk())
+    assert list(cache.values()) == [audio]
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from chat import ws_handler
+from chat.ws_handler import ChatSocket, ChatSocketSessions
+
+
+class FakeWebSocket:
+    """Client that sends nothing until told to disconnect and records what it receives"""
+
+    def __init__(self):
+        self.sent = []
+        self.disconnected = asyncio.Event()
+
+    async def receive_text(self):
+        await self.disconnected.wait()
+        raise WebSocketDisconnect()
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=None):
+        self.disconnected.set()
+
+
+def test_resume_replays_more_frames_than_the_outbox_holds(monkeypatch):
+    registry = ChatSocketSessions()
+    monkeypatch.setattr(ws_handler, "chat_sessions", registry)
+    missed = ws_handler.WS_SEND_QUEUE_SIZE + 8
+
+    async def scenario():
+        session, _ = registry.open("s1")
+        for index in range(missed):
+            session.record({"type": "text", "text": f"reply {index}"})
+        registry.close(session)
+
+        websocket = FakeWebSocket()
+        session, resumed = registry.open("s1")
+        socket_run = asyncio.create_task(ChatSocket(websocket, session).run(last_seq=0, resumed=resumed))
+        while len(websocket.sent) < missed + 1:
+            await asyncio.sleep(0.01)
+        websocket.disconnected.set()
+        await socket_run
+        registry.close(session)
+        return websocket.sent, session
+
+    sent, session = asyncio.run(asyncio.wait_for(scenario(), timeout=3))
+    assert sent[0] == {"type": "session", "session_id": "s1", "resumed": True}
+    assert [frame["seq"] for frame in sent[1:]] == list(range(1, missed + 1))
+    assert session.sockets == 0
+
+
+def test_resume_is_refused_for_another_user():
+    registry = ChatSocketSessions()
+    session, _ = registry.open("s1", user_id="owner")
+    registry.close(session)
+
+    with pytest.raises(PermissionError):
+        registry.open("s1", user_id="someone-else")
+    with pytest.raises(PermissionError):
+        registry.open("s1")
+    assert registry.open("s1", user_id="owner") == (session, True)
+
+
+def test_sessions_with_open_sockets_are_not_evicted():
+    registry = ChatSocketSessions(max_sessions=2)
+    live, _ = registry.open("live")
+    for session_id in ("a", "b", "c"):
+        registry.close(registry.open(session_id)[0])
+    assert "live" in registry._sessions
+    assert len(registry) == 2
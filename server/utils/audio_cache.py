@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from database.redis import get_redis_client
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tier 1: in-process LRU bounded by the total size of the cached audio
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Tier 2: shared Redis cache, survives restarts and is shared by all workers
+AUDIO_CACHE_REDIS_TTL_SECONDS = int(os.getenv("AUDIO_CACHE_REDIS_TTL_SECONDS", str(7 * 86400)))
+AUDIO_CACHE_REDIS_PREFIX = "audio:"
+
+
+def audio_cache_key(text: str, voice_id: str, engine: str, language_code: str, output_format: str) -> str:
+    """
+    Content address for a synthesized clip. Every Polly parameter that changes the
+    produced audio is part of the key.
+    """
+    material = "\x1f".join([voice_id, engine, language_code, output_format, text])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LRUAudioCache:
+    """Thread-safe LRU cache of audio bytes bounded by total size"""
+
+    def __init__(self, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is not None:
+                self._items.move_to_end(key)
+            return audio
+
+    def set(self, key, audio: bytes):
+        size = len(audio)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+
+            self._items[key] = audio
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                metrics.increment("audio_cache.evictions")
+
+    def __len__(self):
+        return len(self._items)
+
+
+class AudioCache:
+    """
+    Two-tier cache for synthesized speech: an in-process LRU in front of Redis.
+
+    Redis is configured with decode_responses=True, so audio is stored there base64
+    encoded. Redis errors are logged and treated as a miss.
+    """
+
+    def __init__(self, max_bytes=AUDIO_CACHE_MAX_BYTES, redis_ttl=AUDIO_CACHE_REDIS_TTL_SECONDS):
+        self.lru = LRUAudioCache(max_bytes)
+        self.redis_ttl = redis_ttl
+
+    async def get(self, key):
+        """
+        Look up a clip in the LRU, then in Redis
+        Args:
+            key (str): Key from audio_cache_key()
+        Returns:
+            bytes: The cached audio or None
+        """
+        audio = self.lru.get(key)
+        if audio is not None:
+            metrics.increment("audio_cache.lru_hits")
+            return audio
+
+        try:
+            redis = await get_redis_client()
+            if redis:
+                encoded = await redis.get(f"{AUDIO_CACHE_REDIS_PREFIX}{key}")
+                if encoded:
+                    audio = base64.b64decode(encoded)
+                    self.lru.set(key, audio)
+                    metrics.increment("audio_cache.redis_hits")
+                    return audio
+        except Exception as e:
+            logger.warning(f"Audio cache Redis lookup failed: {str(e)}")
+
+        metrics.increment("audio_cache.misses")
+        return None
+
+    async def set(self, key, audio: bytes):
+        """Store a clip in both tiers"""
+        self.lru.set(key, audio)
+        try:
+            redis = await get_redis_client()
+            if redis:
+                await redis.setex(
+                    f"{AUDIO_CACHE_REDIS_PREFIX}{key}",
+                    self.redis_ttl,
+                    base64.b64encode(audio).decode("utf-8")
+                )
+        except Exception as e:
+            logger.warning(f"Audio cache Redis write failed: {str(e)}")
+
+
+audio_cache = AudioCache()
+
+metrics.register_gauge("audio_cache.lru_bytes", lambda: audio_cache.lru.current_bytes)
+metrics.register_gauge("audio_cache.lru_entries", lambda: len(audio_cache.lru))
@@ -1,7 +1,38 @@
 import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
 import json
+import logging
 import os
+import threading
+import time
+from concurrent.futures import Future
+
+from utils import metrics
+from utils.concurrency import AdaptiveLimiter, DependencyOverloaded
+
+logger = logging.getLogger(__name__)
+
+# Secrets are cached in-process: entries younger than SECRET_CACHE_TTL_SECONDS are served
+# directly, older ones are served while a background refresh runs, and entries older than
+# SECRET_CACHE_MAX_STALE_SECONDS are fetched again before returning.
+SECRET_CACHE_TTL_SECONDS = int(os.environ.get("SECRET_CACHE_TTL_SECONDS", "900"))
+SECRET_CACHE_MAX_STALE_SECONDS = int(os.environ.get("SECRET_CACHE_MAX_STALE_SECONDS", "3600"))
+# Fallback values (environment, mock) stand in only this long before Secrets Manager is tried again
+SECRET_FALLBACK_TTL_SECONDS = int(os.environ.get("SECRET_FALLBACK_TTL_SECONDS", "60"))
+# BatchGetSecretValue accepts at most 20 secret ids per call
+SECRET_BATCH_SIZE = 20
+# Concurrent Secrets Manager calls per worker (botocore's default pool has 10 connections)
+SECRETS_CONCURRENCY_LIMIT = int(os.environ.get("SECRETS_CONCURRENCY_LIMIT", "4"))
+SECRETS_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("SECRETS_QUEUE_TIMEOUT_SECONDS", "5"))
+
+secrets_limiter = AdaptiveLimiter("secrets", SECRETS_CONCURRENCY_LIMIT, 10, SECRETS_QUEUE_TIMEOUT_SECONDS)
+
+_secret_cache = {}
+_secret_inflight = {}
+_secret_lock = threading.Lock()
+_secrets_client = None
+_secrets_client_lock = threading.Lock()
+_refresher_stop = None
 
 
 def validate_aws_credentials():
@@ -13,8 +44,7 @@ def validate_aws_credentials():
     try:
         # Change the region to ca-central-1
         region_name = os.environ.get("AWS_REGION", "ca-central-1")
-        session = boto3.session.Session()
-        client = session.client(service_name='secretsmanager', region_name=region_name)
+        client = get_secrets_client()
         
         # Test by listing secrets (doesn't require specific permissions)
         client.list_secrets(MaxResults=1)
@@ -64,9 +94,63 @@ def get_secret_from_env(secret_name: str):
     return None
 
 
-def get_secret(secret_name: str, use_fallback=True):
+def get_secrets_client():
+    """Return the process-wide Secrets Manager client"""
+    global _secrets_client
+    if _secrets_client is None:
+        with _secrets_client_lock:
+            if _secrets_client is None:
+                # Get region from environment or use ca-central-1 as default
+                region_name = os.environ.get("AWS_REGION", "ca-central-1")
+                session = boto3.session.Session()
+                _secrets_client = session.client(
+                    service_name='secretsmanager',
+                    region_name=region_name
+                )
+    return _secrets_client
+
+
+def get_secret_fallback(secret_name: str):
     """
-    Retrieve a secret from AWS Secrets Manager with fallback to environment variables.
+    Fallback values used when Secrets Manager is unavailable: environment variables,
+    then mock values for development when USE_MOCK_SECRETS=true.
+    Returns:
+        dict: Secret key-value pairs or None if no fallback is available
+    """
+    # Try to get from environment variables instead
+    env_secrets = get_secret_from_env(secret_name)
+    if env_secrets:
+        return env_secrets
+
+    # For development, provide mock values if env var is set
+    if os.environ.get('USE_MOCK_SECRETS', '').lower() == 'true':
+        print(f"Using mock values for {secret_name}")
+        if secret_name == 'supabase':
+            return {
+                "SUPABASE_URL": "https://example.supabase.co",
+                "SUPABASE_SERVICE_ROLE_KEY": "mock-service-key",
+                "JWT_SECRET": "mock-jwt-secret"
+            }
+        elif secret_name == 'redis':
+            return {
+                "host": "localhost",
+                "port": "6379",
+                "password": "",
+                "ssl": "False"
+            }
+        elif secret_name == 'postgres':
+            return {
+                "host": "localhost",
+                "port": "5432",
+                "username": "postgres",
+                "password": "postgres"
+            }
+    return None
+
+
+def fetch_secret(secret_name: str, use_fallback=True):
+    """
+    Retrieve a secret from AWS Secrets Manager (uncached) with fallback to environment variables.
     Args:
         secret_name (str): The name of the secret to retrieve.
         use_fallback (bool): Whether to try environment variables as fallback
@@ -74,64 +158,234 @@ def get_secret(secret_name: str, use_fallback=True):
         dict: A dictionary containing the secret key-value pairs.
     Raises:
         ClientError: If there is an error retrieving the secret and no fallback is available.
+        DependencyOverloaded: If Secrets Manager calls are shed and no fallback is available.
     """
-    # Get region from environment or use ca-central-1 as default
-    region_name = os.environ.get("AWS_REGION", "ca-central-1")
+    return _fetch_secret(secret_name, use_fallback)[0]
+
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
+def _fetch_secret(secret_name: str, use_fallback=True):
+    """
+    Returns:
+        tuple: (secret dict, bool whether it is a fallback value)
+    """
+    client = get_secrets_client()
 
-    print(f"Getting secret: {secret_name} from region {region_name}")
+    print(f"Getting secret: {secret_name} from region {client.meta.region_name}")
 
     try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
+        with secrets_limiter.slot_sync():
+            get_secret_value_response = client.get_secret_value(
+                SecretId=secret_name
+            )
         
         secret_str = get_secret_value_response['SecretString']
         secret_dict = json.loads(secret_str)
         print(f"Successfully retrieved secret {secret_name} from AWS Secrets Manager")
-        return secret_dict
+        return secret_dict, False
     
-    except ClientError as e:
+    except (ClientError, DependencyOverloaded) as e:
         print(f"Error getting secret: {e}")
         
         if use_fallback:
-            # Try to get from environment variables instead
-            env_secrets = get_secret_from_env(secret_name)
-            if env_secrets:
-                return env_secrets
-            
-            # For development, provide mock values if env var is set
-            if os.environ.get('USE_MOCK_SECRETS', '').lower() == 'true':
-                print(f"Using mock values for {secret_name}")
-                if secret_name == 'supabase':
-                    return {
-                        "SUPABASE_URL": "https://example.supabase.co",
-                        "SUPABASE_SERVICE_ROLE_KEY": "mock-service-key",
-                        "JWT_SECRET": "mock-jwt-secret"
-                    }
-                elif secret_name == 'redis':
-                    return {
-                        "host": "localhost",
-                        "port": "6379",
-                        "password": "",
-                        "ssl": "False"
-                    }
-                elif secret_name == 'postgres':
-                    return {
-                        "host": "localhost",
-                        "port": "5432",
-                        "username": "postgres",
-                        "password": "postgres"
-                    }
+            fallback = get_secret_fallback(secret_name)
+            if fallback:
+                metrics.increment("secrets.fallbacks")
+                return fallback, True
         
         # Re-raise the exception if no fallback is available
         raise e
     except Exception as e:
         print(f"Unexpected error getting secret: {e}")
         raise
+
+
+def _fetch_single_flight(secret_name: str, use_fallback=True):
+    """Fetch a secret, sharing one Secrets Manager call between concurrent callers"""
+    with _secret_lock:
+        future = _secret_inflight.get(secret_name)
+        owner = future is None
+        if owner:
+            future = Future()
+            _secret_inflight[secret_name] = future
+
+    if not owner:
+        metrics.increment("secrets.coalesced_fetches")
+        return future.result()
+
+    metrics.increment("secrets.fetches")
+    try:
+        secret, is_fallback = _fetch_secret(secret_name, use_fallback)
+        fetched_at = time.monotonic()
+        if is_fallback:
+            # Dated so it turns stale after SECRET_FALLBACK_TTL_SECONDS: still served, but every
+            # read past that retries Secrets Manager in the background until the real value is back
+            fetched_at -= max(0, SECRET_CACHE_TTL_SECONDS - SECRET_FALLBACK_TTL_SECONDS)
+        with _secret_lock:
+            # A fallback never replaces a value already cached, even a stale one
+            if not is_fallback or secret_name not in _secret_cache:
+                _secret_cache[secret_name] = (secret, fetched_at)
+        future.set_result(secret)
+        return secret
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _secret_lock:
+            _secret_inflight.pop(secret_name, None)
+
+
+def _refresh_in_background(secret_name: str):
+    def refresh():
+        try:
+            _fetch_single_flight(secret_name)
+        except Exception as e:
+            logger.warning(f"Background refresh of secret {secret_name} failed: {str(e)}")
+
+    with _secret_lock:
+        if secret_name in _secret_inflight:
+            return
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_secret(secret_name: str, use_fallback=True, force_refresh=False):
+    """
+    Retrieve a secret from AWS Secrets Manager with fallback to environment variables.
+    Results are cached in-process (see SECRET_CACHE_TTL_SECONDS).
+    Args:
+        secret_name (str): The name of the secret to retrieve.
+        use_fallback (bool): Whether to try environment variables as fallback
+        force_refresh (bool): Bypass the cache, e.g. after a credential was rejected
+    Returns:
+        dict: A dictionary containing the secret key-value pairs.
+    Raises:
+        ClientError: If there is an error retrieving the secret and no fallback is available.
+    """
+    if not force_refresh:
+        with _secret_lock:
+            entry = _secret_cache.get(secret_name)
+
+        if entry:
+            secret, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < SECRET_CACHE_TTL_SECONDS:
+                metrics.increment("secrets.cache_hits")
+                return secret
+            if age < SECRET_CACHE_MAX_STALE_SECONDS:
+                # Serve the cached value and pick up rotated values in the background
+                metrics.increment("secrets.stale_hits")
+                _refresh_in_background(secret_name)
+                return secret
+
+    return _fetch_single_flight(secret_name, use_fallback)
+
+
+def _fetch_batch(secret_names):
+    """
+    Fetch secrets with BatchGetSecretValue and store them in the cache.
+    Returns:
+        dict: The secrets that were fetched (failed ones are left out)
+    """
+    results = {}
+    client = get_secrets_client()
+    for start in range(0, len(secret_names), SECRET_BATCH_SIZE):
+        batch = secret_names[start:start + SECRET_BATCH_SIZE]
+        try:
+            with secrets_limiter.slot_sync():
+                response = client.batch_get_secret_value(SecretIdList=batch)
+            metrics.increment("secrets.batch_fetches")
+            fetched_at = time.monotonic()
+            with _secret_lock:
+                for value in response.get('SecretValues', []):
+                    secret = json.loads(value['SecretString'])
+                    _secret_cache[value['Name']] = (secret, fetched_at)
+                    results[value['Name']] = secret
+            for error in response.get('Errors', []):
+                print(f"Error getting secret {error.get('SecretId')} in batch: {error.get('Message')}")
+        except Exception as e:
+            # Older permissions may not allow the batch API, callers fall back to one call per secret
+            print(f"Batch secret retrieval failed: {e}")
+    return results
+
+
+def get_secrets(secret_names, use_fallback=True):
+    """
+    Retrieve several secrets, fetching the uncached ones with BatchGetSecretValue.
+    Args:
+        secret_names (list): The names of the secrets to retrieve.
+        use_fallback (bool): Whether to try environment variables as fallback
+    Returns:
+        dict: Secret name to secret key-value pairs.
+    """
+    results = {}
+    missing = []
+    now = time.monotonic()
+    with _secret_lock:
+        for name in secret_names:
+            entry = _secret_cache.get(name)
+            if entry and now - entry[1] < SECRET_CACHE_TTL_SECONDS:
+                results[name] = entry[0]
+            else:
+                missing.append(name)
+
+    if missing:
+        results.update(_fetch_batch(missing))
+
+    # Anything the batch call could not return goes through the single-secret path and its fallbacks
+    for name in secret_names:
+        if name not in results:
+            results[name] = get_secret(name, use_fallback)
+    return results
+
+
+def invalidate_secret(secret_name: str = None):
+    """Drop one secret (or every secret) from the cache"""
+    with _secret_lock:
+        if secret_name:
+            _secret_cache.pop(secret_name, None)
+        else:
+            _secret_cache.clear()
+
+
+def start_secret_refresher(interval_seconds: float = None):
+    """
+    Periodically refresh cached secrets in a daemon thread so rotated values are
+    picked up before their cache entry expires.
+    """
+    global _refresher_stop
+    if _refresher_stop is not None:
+        return
+
+    interval_seconds = interval_seconds or SECRET_CACHE_TTL_SECONDS / 2
+    stop = threading.Event()
+    _refresher_stop = stop
+
+    def refresh_loop():
+        while not stop.wait(interval_seconds):
+            with _secret_lock:
+                due = [name for name, (_, fetched_at) in _secret_cache.items()
+                       if time.monotonic() - fetched_at >= interval_seconds]
+            if not due:
+                continue
+            # Refetch every due secret in as few calls as possible, readers keep the old value meanwhile
+            refreshed = _fetch_batch(due)
+            failed = 0
+            for name in due:
+                if name in refreshed:
+                    continue
+                try:
+                    _fetch_single_flight(name)
+                except Exception as e:
+                    # One failing secret must not hold back the others
+                    failed += 1
+                    logger.warning(f"Refresh of secret {name} failed: {str(e)}")
+            logger.info(f"Refreshed {len(due) - failed} of {len(due)} cached secrets")
+
+    threading.Thread(target=refresh_loop, name="secret-refresher", daemon=True).start()
+
+
+def stop_secret_refresher():
+    """Stop the background refresh thread"""
+    global _refresher_stop
+    if _refresher_stop is not None:
+        _refresher_stop.set()
+        _refresher_stop = None
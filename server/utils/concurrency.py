@@ -0,0 +1,218 @@
+"""
+Per-dependency concurrency limits for outbound calls (Lex, Polly, Secrets Manager).
+
+Each dependency gets an AdaptiveLimiter: calls beyond its current limit wait in a
+FIFO queue, and a call that would wait longer than the limiter's deadline is
+rejected at once with DependencyOverloaded, which the API turns into
+503 + Retry-After. The limit itself adapts (AIMD): it grows by one per window of
+successful calls made while saturated and is halved when the dependency throttles.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from botocore.exceptions import ClientError
+
+from utils import metrics
+
+# AWS error codes that mean "slow down" rather than "this request is wrong"
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "LimitExceededException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "SlowDown",
+}
+# Upper bound for the Retry-After hint
+MAX_RETRY_AFTER_SECONDS = 30
+
+
+class DependencyOverloaded(Exception):
+    """A dependency has no capacity left for this call; retry after retry_after seconds"""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f"{dependency} is overloaded, retry after {retry_after}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def is_throttling_error(error):
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """
+    Bounds the concurrent calls made to one dependency.
+
+    Usable from coroutines (async with limiter.slot()) and from worker threads
+    (with limiter.slot_sync()); both share the same limit and queue. A throttling
+    error raised inside the block halves the limit (at most once per
+    decrease_cooldown seconds), so a throttled dependency sheds load instead of
+    turning every queued call into another throttled call.
+
+    Args:
+        name (str): Metric prefix (<name>.limiter.*)
+        initial_limit (int): Concurrent calls allowed before any feedback
+        max_limit (int): Never allow more than this (e.g. the connection pool size)
+        max_wait (float): Longest a call may queue before it is shed
+    """
+
+    def __init__(self, name, initial_limit, max_limit, max_wait, min_limit=1,
+                 decrease_factor=0.5, decrease_cooldown=1.0):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.max_wait = max_wait
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self._limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self._in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+        # Moving average of call duration, used to predict queue waits
+        self._latency = None
+        metrics.register_gauge(f"{name}.limiter", self.stats)
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    def retry_after(self):
+        # Time for the current queue to drain at the current limit
+        latency = self._latency or self.max_wait
+        drain = (len(self._waiters) + 1) / self.limit * latency
+        return min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(drain)))
+
+    def _try_acquire(self, wake):
+        """
+        Take a slot now, or queue a waiter woken by wake() once one is free
+
+        Returns:
+            _Waiter: None if a slot was taken immediately
+        Raises:
+            DependencyOverloaded: If the queue is already longer than max_wait
+        """
+        with self._lock:
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return None
+            if self._latency is not None and (len(self._waiters) + 1) / self.limit * self._latency > self.max_wait:
+                # The call would time out in the queue anyway, fail it without making it wait
+                retry_after = self.retry_after()
+            else:
+                waiter = _Waiter(wake)
+                self._waiters.append(waiter)
+                return waiter
+        metrics.increment(f"{self.name}.limiter.shed")
+        raise DependencyOverloaded(self.name, retry_after)
+
+    def _abandon(self, waiter):
+        """Give up waiting; a slot granted in the meantime is passed on"""
+        with self._lock:
+            if waiter.granted:
+                self._in_flight -= 1
+                self._grant()
+            else:
+                self._waiters.remove(waiter)
+            return self.retry_after()
+
+    def _timed_out(self, waiter):
+        metrics.increment(f"{self.name}.limiter.shed")
+        return DependencyOverloaded(self.name, self._abandon(waiter))
+
+    def _grant(self):
+        # Called with the lock held
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            waiter.wake()
+
+    def _release(self, elapsed, error=None):
+        throttled = error is not None and is_throttling_error(error)
+        with self._lock:
+            saturated = self._in_flight >= self.limit
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif error is None:
+                self._latency = elapsed if self._latency is None else 0.9 * self._latency + 0.1 * elapsed
+                # Only grow while the limit is what holds calls back
+                if saturated:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._grant()
+        if throttled:
+            metrics.increment(f"{self.name}.limiter.throttled")
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the dependency's slots for the duration of the block"""
+        queued_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._try_acquire(lambda: loop.call_soon_threadsafe(_resolve, future))
+        if waiter:
+            try:
+                await asyncio.wait_for(future, timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                raise self._timed_out(waiter) from None
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        started = time.monotonic()
+        metrics.observe(f"{self.name}.limiter.queue_seconds", started - queued_at)
+        try:
+            yield
+        except BaseException as e:
+            self._release(time.monotonic() - started, e)
+            raise
+        self._release(time.monotonic() - started)
+
+    @contextmanager
+    def slot_sync(self):
+        """slot() for blocking code running in a worker thread"""
+        queued_at = time.monotonic()
+        event = threading.Event()
+        waiter = self._try_acquire(event.set)
+        if waiter and not event.wait(self.max_wait):
+            raise self._timed_out(waiter)
+        started = time.monotonic()
+        metrics.observe(f"{self.name}.limiter.queue_seconds", started - queued_at)
+        try:
+            yield
+        except BaseException as e:
+            self._release(time.monotonic() - started, e)
+            raise
+        self._release(time.monotonic() - started)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "latency_seconds": round(self._latency, 4) if self._latency is not None else None,
+        }
@@ -0,0 +1,133 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: only enable once the bot's stateless intents are known not to have side effects
+LEX_RESPONSE_CACHE = os.getenv("LEX_RESPONSE_CACHE", "false").lower() == "true"
+LEX_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("LEX_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+LEX_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LEX_RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+# Dialog actions after which Lex holds no dialog state for the session
+IDLE_DIALOG_ACTIONS = {"Close", "ElicitIntent"}
+
+
+def normalize_input(message: str) -> str:
+    return " ".join(message.lower().split()).strip(" .!?")
+
+
+def state_fingerprint(session_state):
+    """
+    The parts of a Lex sessionState that can change its answer to the next message:
+    dialog action, intent, which slots are filled, and the session attributes
+    """
+    session_state = session_state or {}
+    intent = session_state.get("intent") or {}
+    material = {
+        "action": (session_state.get("dialogAction") or {}).get("type"),
+        "slot": (session_state.get("dialogAction") or {}).get("slotToElicit"),
+        "intent": intent.get("name"),
+        "intent_state": intent.get("state"),
+        "filled": sorted(name for name, slot in (intent.get("slots") or {}).items() if slot),
+        "attributes": session_state.get("sessionAttributes") or {},
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def _is_idle(session_state):
+    action = ((session_state or {}).get("dialogAction") or {}).get("type")
+    return action in IDLE_DIALOG_ACTIONS
+
+
+def _is_cacheable(result):
+    """An idle reply from an intent without filled slots, which a fulfillment hook can't have acted on"""
+    session_state = result.get("session_state")
+    slots = ((session_state or {}).get("intent") or {}).get("slots") or {}
+    return _is_idle(session_state) and not any(slots.values())
+
+
+class LexResponseCache:
+    """
+    Caches Lex replies to turns that start and end with no dialog in progress
+    (FAQ-style intents, fallback replies...).
+
+    Lex keeps dialog state server side, so a turn can only be answered from the
+    cache if skipping the Lex call leaves that state unchanged: the session must
+    be idle before the message and Lex's answer must leave it idle. Every other
+    turn (slot filling, confirmations, dialog-opening turns) bypasses the cache,
+    and replies that completed an intent with slots (a booking) are never stored.
+    The session's state comes from utils.lex_dialog (shared by all workers, since
+    the previous turn may have run on another one); sessions whose state is not on
+    record or unknown bypass the cache too.
+    """
+
+    def __init__(self, ttl=LEX_RESPONSE_CACHE_TTL_SECONDS, max_entries=LEX_RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _key(self, bot, session_state, message, patient_id=None):
+        if session_state is None or not _is_idle(session_state):
+            return None
+        return (bot, patient_id, state_fingerprint(session_state), normalize_input(message))
+
+    def get(self, bot, session_state, message, patient_id=None):
+        """
+        Args:
+            session_state (dict): The session's current Lex state (lex_dialog.load_dialog_state),
+                None if unknown
+            patient_id (str): Signed-in patient sent to Lex as a session attribute; replies are
+                cached per patient since the bot's code hooks may answer differently for each
+
+        Returns:
+            tuple: (cache key or None if the turn must bypass the cache, cached result or None)
+        """
+        key = self._key(bot, session_state, message, patient_id)
+        if key is None:
+            self.bypassed += 1
+            metrics.increment("lex.response_cache.bypassed")
+            return None, None
+
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.increment("lex.response_cache.hits")
+            return key, copy.deepcopy(entry[1])
+        if entry:
+            del self._entries[key]
+        self.misses += 1
+        metrics.increment("lex.response_cache.misses")
+        return key, None
+
+    def put(self, key, result):
+        """Store the result if the turn was cacheable"""
+        if key is not None and "error" not in result and _is_cacheable(result):
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+lex_response_cache = LexResponseCache()
+metrics.register_gauge("lex.response_cache", lambda: lex_response_cache.stats() if LEX_RESPONSE_CACHE else {})
@@ -0,0 +1,87 @@
+"""
+Last Lex dialog state and owner of each chat session, kept in Redis.
+
+A session's turns may land on any API worker, so whether Lex is in the middle of a
+dialog (collecting slots, waiting for a confirmation) can't be judged from what one
+worker has seen. Every Lex turn stores the sessionState it left behind, and the
+decisions that skip Lex (the response cache, the FAQ fast path) read it back.
+
+Every turn also records who sent it (the authenticated patient, "" when anonymous),
+so the Lex code hook can check the patient_id session attribute it is handed.
+"""
+import json
+import logging
+import os
+
+from database.redis import get_redis_client
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Keep in line with the bot's idle session timeout: once Lex forgets a session, so can we
+LEX_DIALOG_STATE_TTL_SECONDS = int(os.getenv("LEX_DIALOG_STATE_TTL_SECONDS", "300"))
+
+
+def dialog_state_key(session_id):
+    return f"lex_dialog:{session_id}"
+
+
+async def load_dialog_state(session_id):
+    """
+    Returns:
+        tuple: (bool seen, sessionState or None). seen is False when no Lex turn of the
+            session is on record; the state is None when it is unknown (a failed turn,
+            Redis unavailable), {} when Lex returned none
+    """
+    try:
+        redis = await get_redis_client()
+        value = await redis.get(dialog_state_key(session_id))
+    except Exception as e:
+        metrics.increment("lex.dialog_state.errors")
+        logger.warning(f"Failed to read the Lex dialog state of session {session_id}: {str(e)}")
+        return True, None
+    if value is None:
+        return False, None
+    return True, json.loads(value)
+
+
+async def save_dialog_state(session_id, session_state):
+    """
+    Record the state a Lex turn left the session in; None records it as unknown
+    (the turn failed or timed out and Lex may or may not have run it)
+    """
+    try:
+        redis = await get_redis_client()
+        await redis.set(dialog_state_key(session_id), json.dumps(session_state), ex=LEX_DIALOG_STATE_TTL_SECONDS)
+    except Exception as e:
+        metrics.increment("lex.dialog_state.errors")
+        logger.warning(f"Failed to store the Lex dialog state of session {session_id}: {str(e)}")
+
+
+def session_owner_key(session_id):
+    return f"lex_owner:{session_id}"
+
+
+async def save_session_owner(session_id, patient_id):
+    """Record the authenticated sender of the session's current turn ("" when anonymous)"""
+    try:
+        redis = await get_redis_client()
+        await redis.set(session_owner_key(session_id), patient_id, ex=LEX_DIALOG_STATE_TTL_SECONDS)
+    except Exception as e:
+        metrics.increment("lex.dialog_state.errors")
+        logger.warning(f"Failed to store the owner of session {session_id}: {str(e)}")
+
+
+async def load_session_owner(session_id):
+    """
+    Returns:
+        str: The patient who sent the session's last turn, "" when anonymous, None when
+            unknown (no turn on record or Redis unavailable)
+    """
+    try:
+        redis = await get_redis_client()
+        return await redis.get(session_owner_key(session_id))
+    except Exception as e:
+        metrics.increment("lex.dialog_state.errors")
+        logger.warning(f"Failed to read the owner of session {session_id}: {str(e)}")
+        return None
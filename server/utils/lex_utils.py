@@ -1,18 +1,65 @@
+import asyncio
 import boto3
+import aioboto3
 import logging
 import os
+from contextlib import AsyncExitStack
+from botocore.config import Config
 from utils.aws_utils import get_secret
+from utils.concurrency import AdaptiveLimiter, DependencyOverloaded, is_throttling_error
+from utils.lex_cache import LEX_RESPONSE_CACHE, lex_response_cache
+from utils.lex_dialog import load_dialog_state, save_dialog_state, save_session_owner
+from utils.resilience import (CLOSED, CircuitBreaker, CircuitOpenError, RetryBudget, call_with_retries,
+                              is_aws_outage, is_aws_unsent)
 
 logger = logging.getLogger(__name__)
 lex_client = None
 
+# Async Lex client used by the /chat request path (managed by app.lifespan)
+async_lex_client = None
+_async_lex_exit_stack = None
+_async_lex_init_lock = asyncio.Lock()
+
+# Per-call timeout and connection pool size for the async Lex client
+LEX_TIMEOUT_SECONDS = float(os.getenv("LEX_TIMEOUT_SECONDS", "5"))
+LEX_MAX_POOL_CONNECTIONS = int(os.getenv("LEX_MAX_POOL_CONNECTIONS", "50"))
+# Concurrent RecognizeText calls per worker: the limit starts at LEX_CONCURRENCY_LIMIT and
+# adapts to throttling, up to the pool size. Turns that would queue longer than
+# LEX_QUEUE_TIMEOUT_SECONDS get a 503 instead.
+LEX_CONCURRENCY_LIMIT = int(os.getenv("LEX_CONCURRENCY_LIMIT", "20"))
+LEX_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LEX_QUEUE_TIMEOUT_SECONDS", "1"))
+
+lex_limiter = AdaptiveLimiter("lex", LEX_CONCURRENCY_LIMIT, LEX_MAX_POOL_CONNECTIONS, LEX_QUEUE_TIMEOUT_SECONDS)
+# Client creation and RecognizeText failures open the circuit; only requests that never reached
+# Lex are retried, a turn Lex may have run is never sent twice
+lex_breaker = CircuitBreaker("lex")
+lex_retry_budget = RetryBudget("lex")
+
+
+def _load_lex_config():
+    """
+    Fetch Lex credentials from AWS Secrets Manager and store the bot configuration
+    in the environment.
+
+    Returns:
+        dict: The Lex credentials
+    """
+    lex_creds = get_secret("lex")
+    logger.info("Retrieved Lex credentials from AWS Secrets Manager")
+
+    # Store Lex bot configuration
+    os.environ['LEX_BOT_ID'] = lex_creds.get('LEX_BOT_ID', '')
+    os.environ['LEX_BOT_ALIAS_ID'] = lex_creds.get('LEX_BOT_ALIAS_ID', '')
+    os.environ['LEX_BOT_LOCALE_ID'] = lex_creds.get('LEX_BOT_LOCALE_ID', 'en_CA')
+    return lex_creds
+
+
 def init_lex_client():
     """Initialize Amazon Lex client with credentials from AWS Secrets Manager"""
     global lex_client
     try:
         # Get Lex credentials from AWS Secrets Manager
-        lex_creds = get_secret("lex")
-        logger.info("Retrieved Lex credentials from AWS Secrets Manager")
+        lex_creds = _load_lex_config()
         
         # Create Lex client
         lex_client = boto3.client(
@@ -22,17 +69,83 @@ def init_lex_client():
             aws_secret_access_key=lex_creds.get('AWS_SECRET_ACCESS_KEY')
         )
         
-        # Store Lex bot configuration
-        os.environ['LEX_BOT_ID'] = lex_creds.get('LEX_BOT_ID', '')
-        os.environ['LEX_BOT_ALIAS_ID'] = lex_creds.get('LEX_BOT_ALIAS_ID', '')
-        os.environ['LEX_BOT_LOCALE_ID'] = lex_creds.get('LEX_BOT_LOCALE_ID', 'en_CA')
-        
         logger.info(f"Lex client initialized for bot: {os.environ['LEX_BOT_ID']}")
         return True
     except Exception as e:
         logger.error(f"Failed to initialize Lex client: {str(e)}")
         return False
 
+
+async def init_async_lex_client():
+    """
+    Initialize the async (aioboto3) Amazon Lex client used by the /chat endpoint.
+
+    The client keeps a pooled HTTP connection to Lex for the lifetime of the process
+    and must be released with close_async_lex_client().
+
+    Returns:
+        bool: True if the client is ready (False at once while the Lex circuit is open)
+    """
+    if async_lex_client:
+        return True
+
+    async with _async_lex_init_lock:
+        # Another request may have finished initializing while we waited
+        if async_lex_client:
+            return True
+        # After repeated failures, don't pay for another Secrets Manager fetch on every request
+        if not lex_breaker.allow():
+            return False
+        ready = await _create_async_lex_client()
+        if ready:
+            lex_breaker.record_success()
+        else:
+            lex_breaker.record_failure()
+        return ready
+
+
+async def _create_async_lex_client():
+    """Build the aioboto3 Lex client and register it for cleanup"""
+    global async_lex_client, _async_lex_exit_stack
+    try:
+        # Secrets Manager access is blocking, keep it off the event loop
+        lex_creds = await asyncio.to_thread(_load_lex_config)
+
+        session = aioboto3.Session(
+            aws_access_key_id=lex_creds.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=lex_creds.get('AWS_SECRET_ACCESS_KEY'),
+            region_name=lex_creds.get('AWS_REGION', 'ca-central-1')
+        )
+        config = Config(
+            connect_timeout=LEX_TIMEOUT_SECONDS,
+            read_timeout=LEX_TIMEOUT_SECONDS,
+            max_pool_connections=LEX_MAX_POOL_CONNECTIONS,
+            # No botocore retries: call_with_retries only retries requests that never reached Lex
+            retries={"max_attempts": 1, "mode": "standard"}
+        )
+
+        exit_stack = AsyncExitStack()
+        async_lex_client = await exit_stack.enter_async_context(
+            session.client('lexv2-runtime', config=config)
+        )
+        _async_lex_exit_stack = exit_stack
+
+        logger.info(f"Async Lex client initialized for bot: {os.environ['LEX_BOT_ID']}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to initialize async Lex client: {str(e)}")
+        async_lex_client = None
+        return False
+
+
+async def close_async_lex_client():
+    """Close the async Lex client and its connection pool"""
+    global async_lex_client, _async_lex_exit_stack
+    if _async_lex_exit_stack:
+        await _async_lex_exit_stack.aclose()
+    async_lex_client = None
+    _async_lex_exit_stack = None
+
 def validate_lex_credentials():
     """Test connection to Amazon Lex using stored credentials"""
     if not lex_client:
@@ -57,6 +170,18 @@ def validate_lex_credentials():
         logger.error(f"Failed to validate Lex credentials: {str(e)}")
         return False, f"Error connecting to Lex: {str(e)}"
 
+def _parse_lex_response(response):
+    """Convert a RecognizeText response into the result shape used by the chat handler"""
+    messages = response.get('messages', [])
+    combined_message = " ".join([msg.get('content', '') for msg in messages]) if messages else "I'm sorry, I couldn't process your request."
+
+    return {
+        "text": combined_message,
+        "session_state": response.get('sessionState'),
+        "intent": response.get('interpretations', [{}])[0].get('intent', {}).get('name') if response.get('interpretations') else None,
+        "slots": response.get('interpretations', [{}])[0].get('intent', {}).get('slots') if response.get('interpretations') else None
+    }
+
 def send_message_to_lex(session_id: str, message: str):
     """
     Send a message to Amazon Lex and get the response
@@ -94,17 +219,101 @@ def send_message_to_lex(session_id: str, message: str):
             text=message
         )
         
-        # Process the response
-        messages = response.get('messages', [])
-        combined_message = " ".join([msg.get('content', '') for msg in messages]) if messages else "I'm sorry, I couldn't process your request."
-        
+        return _parse_lex_response(response)
+    except Exception as e:
+        logger.error(f"Error sending message to Lex: {str(e)}")
+        return {
+            "text": "Sorry, I encountered an error while processing your request.",
+            "error": str(e),
+            "session_state": None
+        }
+
+
+async def _recognize_text(bot, session_id, message, timeout, patient_id=None):
+    # Sent on every turn, "" for anonymous users, so a session never keeps the patient of an
+    # earlier turn. Read by the fulfillment code hook (appointments.lex_hook) to book for them
+    session_state = {"sessionAttributes": {"patient_id": patient_id or ""}}
+    async with lex_limiter.slot():
+        return await asyncio.wait_for(
+            async_lex_client.recognize_text(
+                botId=bot[0],
+                botAliasId=bot[1],
+                localeId=bot[2],
+                sessionId=session_id,
+                text=message,
+                sessionState=session_state
+            ),
+            timeout=timeout
+        )
+
+
+async def send_message_to_lex_async(session_id: str, message: str, timeout: float = None, patient_id: str = None):
+    """
+    Send a message to Amazon Lex without blocking the event loop
+
+    Args:
+        session_id (str): Unique session identifier for the conversation
+        message (str): Message text from the user
+        timeout (float): Maximum time in seconds to wait for Lex (defaults to LEX_TIMEOUT_SECONDS)
+        patient_id (str): Signed-in user's id, passed to Lex as the patient_id session attribute
+
+    Returns:
+        dict: Response from Lex containing message and session state
+    Raises:
+        DependencyOverloaded: If Lex is throttling, this worker's Lex queue is full or the
+            Lex circuit is open; the message was not processed and can be retried
+    """
+    bot = (os.environ.get('LEX_BOT_ID'), os.environ.get('LEX_BOT_ALIAS_ID'), os.environ.get('LEX_BOT_LOCALE_ID', 'en_CA'))
+    cache_key = None
+    if LEX_RESPONSE_CACHE:
+        _, session_state = await load_dialog_state(session_id)
+        cache_key, cached = lex_response_cache.get(bot, session_state, message, patient_id)
+        if cached:
+            return cached
+
+    if not async_lex_client:
+        if not await init_async_lex_client():
+            if lex_breaker.state != CLOSED:
+                raise CircuitOpenError("lex", lex_breaker.retry_after())
+            return {
+                "text": "Sorry, I couldn't connect to the dental assistant service.",
+                "session_state": None,
+                "error": "Lex client not initialized"
+            }
+
+    # The code hook only books for the patient recorded here
+    await save_session_owner(session_id, patient_id or "")
+    try:
+        logger.debug(f"Sending message to Lex for session {session_id}")
+
+        response = await call_with_retries(
+            _recognize_text, bot, session_id, message, timeout or LEX_TIMEOUT_SECONDS, patient_id,
+            breaker=lex_breaker, budget=lex_retry_budget, is_failure=is_aws_outage, should_retry=is_aws_unsent
+        )
+
+        result = _parse_lex_response(response)
+        # Read by the response cache and the FAQ fast path, whichever worker gets the next turn
+        await save_dialog_state(session_id, result.get("session_state") or {})
+        if LEX_RESPONSE_CACHE:
+            lex_response_cache.put(cache_key, result)
+        return result
+    except DependencyOverloaded:
+        raise
+    except asyncio.TimeoutError:
+        # Lex may or may not have processed the message, its dialog state is unknown now
+        await save_dialog_state(session_id, None)
+        logger.error(f"Timed out waiting for Lex after {timeout or LEX_TIMEOUT_SECONDS}s")
         return {
-            "text": combined_message,
-            "session_state": response.get('sessionState'),
-            "intent": response.get('interpretations', [{}])[0].get('intent', {}).get('name') if response.get('interpretations') else None,
-            "slots": response.get('interpretations', [{}])[0].get('intent', {}).get('slots') if response.get('interpretations') else None
+            "text": "Sorry, the dental assistant is taking too long to respond. Please try again.",
+            "error": "Lex request timed out",
+            "session_state": None
         }
     except Exception as e:
+        if is_throttling_error(e):
+            # Throttled requests are rejected before Lex runs the turn, the dialog state is unchanged
+            logger.warning(f"Lex is throttling requests: {str(e)}")
+            raise DependencyOverloaded("lex", lex_limiter.retry_after())
+        await save_dialog_state(session_id, None)
         logger.error(f"Error sending message to Lex: {str(e)}")
         return {
             "text": "Sorry, I encountered an error while processing your request.",
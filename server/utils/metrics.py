@@ -0,0 +1,59 @@
+"""
+Process-local counters and gauges exposed by the /metrics endpoint.
+
+Counters are monotonically increasing (hits, misses, calls avoided...). Gauges are
+callables evaluated when a snapshot is taken (current cache size, pool usage...).
+"""
+import threading
+from collections import defaultdict
+
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+_gauges = {}
+
+
+def increment(name: str, amount: int = 1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name: str, value: float):
+    """Record a duration or size sample (count, sum and max are kept)"""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["sum"] += value
+        timing["max"] = max(timing["max"], value)
+
+
+def register_gauge(name: str, callback):
+    """Register a callable whose return value is reported under name"""
+    _gauges[name] = callback
+
+
+def get_counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """
+    Collect the current value of every metric
+    Returns:
+        dict: counters, timings and gauges
+    """
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: dict(value) for name, value in _timings.items()}
+
+    gauges = {}
+    for name, callback in list(_gauges.items()):
+        try:
+            gauges[name] = callback()
+        except Exception as e:
+            gauges[name] = f"error: {str(e)}"
+
+    return {"counters": counters, "timings": timings, "gauges": gauges}
@@ -0,0 +1,234 @@
+"""
+Circuit breakers and budgeted retries for calls to external services (Lex, Polly, Supabase).
+
+A CircuitBreaker remembers that a dependency is down: after
+CIRCUIT_FAILURE_THRESHOLD consecutive failures it opens and calls fail at once
+with CircuitOpenError (a 503 + Retry-After, like a shed call) instead of waiting
+for another timeout. After the recovery delay one probe call is let through
+(half-open); its outcome closes the circuit or reopens it for twice as long.
+
+call_with_retries() retries failed calls with jittered exponential backoff, but
+only while the dependency's RetryBudget allows, so retries stay a small fraction
+of traffic during an outage instead of multiplying it.
+
+Defaults can be overridden per dependency by suffixing the name, e.g.
+CIRCUIT_FAILURE_THRESHOLD_LEX=10 (same convention as STARTUP_TIMEOUT_<NAME>).
+"""
+import asyncio
+import os
+import random
+import time
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from utils import metrics
+from utils.concurrency import DependencyOverloaded
+
+# Consecutive failures that open a circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# How long an open circuit rejects calls before a probe; doubles after each failed probe
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "5"))
+CIRCUIT_MAX_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_MAX_RECOVERY_SECONDS", "60"))
+# Retries allowed per call made (0.1 = at most 10% extra load), plus a small steady allowance
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.05"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _setting(name, dependency, default):
+    return float(os.getenv(f"{name}_{dependency.upper()}", default))
+
+
+class CircuitOpenError(DependencyOverloaded):
+    """The dependency is known to be down; the call was not attempted"""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(dependency, retry_after)
+        self.args = (f"{dependency} circuit is open, retry after {retry_after}s",)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit for one dependency.
+
+    Callers ask allow() (or check(), which raises) before calling, then report the
+    outcome with record_success() or record_failure(). Only outages count as
+    failures: a 4xx answer means the dependency is up.
+    """
+
+    def __init__(self, name, failure_threshold=None, recovery_seconds=None, max_recovery_seconds=None):
+        self.name = name
+        self.failure_threshold = int(failure_threshold or _setting("CIRCUIT_FAILURE_THRESHOLD", name, CIRCUIT_FAILURE_THRESHOLD))
+        self.recovery_seconds = recovery_seconds or _setting("CIRCUIT_RECOVERY_SECONDS", name, CIRCUIT_RECOVERY_SECONDS)
+        self.max_recovery_seconds = max_recovery_seconds or _setting("CIRCUIT_MAX_RECOVERY_SECONDS", name,
+                                                                     CIRCUIT_MAX_RECOVERY_SECONDS)
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._open_for = self.recovery_seconds
+        self._probe_started = None
+        metrics.register_gauge(f"{name}.circuit", self.stats)
+
+    def allow(self):
+        """Whether a call may be attempted now (in half-open state, only one probe at a time)"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self._open_for:
+                return False
+            self.state = HALF_OPEN
+            self._probe_started = None
+        # A probe whose caller never reported back (cancelled) is given up after the recovery delay
+        if self._probe_started is not None and now - self._probe_started < self._open_for:
+            return False
+        self._probe_started = now
+        metrics.increment(f"{self.name}.circuit.probes")
+        return True
+
+    def is_open(self):
+        """Whether calls are being rejected right now (doesn't take the half-open probe)"""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self._open_for
+
+    def check(self):
+        """
+        Raises:
+            CircuitOpenError: If the circuit rejects the call
+        """
+        if not self.allow():
+            metrics.increment(f"{self.name}.circuit.rejected")
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def retry_after(self):
+        remaining = self._open_for - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record_success(self):
+        if self.state != CLOSED:
+            metrics.increment(f"{self.name}.circuit.closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._open_for = self.recovery_seconds
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            # The dependency is still down: back off further, with jitter so workers don't probe in step
+            self._open(min(self.max_recovery_seconds, self._open_for * 2) * random.uniform(0.8, 1.2))
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open(self.recovery_seconds)
+
+    def release_probe(self):
+        """The call ended without an outcome (cancelled, shed locally): let another probe through"""
+        self._probe_started = None
+
+    def _open(self, duration):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._open_for = duration
+        self._probe_started = None
+        metrics.increment(f"{self.name}.circuit.opened")
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures}
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of calls: every call deposits
+    ratio tokens, every retry spends one, and min_per_second tokens are added over time
+    """
+
+    def __init__(self, name, ratio=None, min_per_second=None, max_tokens=10):
+        self.name = name
+        self.ratio = ratio if ratio is not None else _setting("RETRY_BUDGET_RATIO", name, RETRY_BUDGET_RATIO)
+        self.min_per_second = (min_per_second if min_per_second is not None
+                               else _setting("RETRY_BUDGET_MIN_PER_SECOND", name, RETRY_BUDGET_MIN_PER_SECOND))
+        self.max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+        self._updated = time.monotonic()
+
+    def _refill(self, amount=0.0):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second + amount)
+        self._updated = now
+
+    def record_call(self):
+        self._refill(self.ratio)
+
+    def try_spend(self):
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        metrics.increment(f"{self.name}.retry_budget.exhausted")
+        return False
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY_SECONDS, cap=RETRY_MAX_DELAY_SECONDS):
+    """Full jitter: a random delay up to the exponential backoff for this attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def call_with_retries(fn, *args, breaker, budget=None, is_failure=lambda e: True,
+                            should_retry=lambda e: False, attempts=RETRY_MAX_ATTEMPTS, **kwargs):
+    """
+    Await fn(*args, **kwargs) through a circuit breaker, retrying within the budget
+
+    Args:
+        breaker (CircuitBreaker): Checked before every attempt and told its outcome
+        budget (RetryBudget): Limits retries; None disables them
+        is_failure: Whether an exception means the dependency is unhealthy
+        should_retry: Whether an exception is safe to retry (e.g. the request was never sent)
+    Returns:
+        The result of fn
+    Raises:
+        CircuitOpenError: If the circuit is open; otherwise the last exception raised by fn
+    """
+    if budget:
+        budget.record_call()
+    for attempt in range(attempts):
+        breaker.check()
+        try:
+            result = await fn(*args, **kwargs)
+        except DependencyOverloaded:
+            # Shed before reaching the dependency, says nothing about its health
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            if not is_failure(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if (attempt + 1 >= attempts or breaker.state != CLOSED or not should_retry(e)
+                    or not budget or not budget.try_spend()):
+                raise
+            metrics.increment(f"{breaker.name}.retries")
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        except BaseException:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+
+def is_aws_outage(error):
+    """Connection failures, timeouts and 5xx answers (not throttling, which the limiter handles)"""
+    if isinstance(error, (BotoConnectionError, HTTPClientError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+    return False
+
+
+def is_aws_unsent(error):
+    """Errors raised before the request reached AWS, so retrying can't repeat its effect"""
+    return isinstance(error, BotoConnectionError)
@@ -1,21 +1,183 @@
+import asyncio
 import boto3
 import base64
 import json
+import logging
+import os
+import threading
+from botocore.config import Config
+
+from utils.audio_cache import audio_cache, audio_cache_key
+from utils.concurrency import AdaptiveLimiter
+from utils.resilience import CircuitBreaker, RetryBudget, call_with_retries, is_aws_outage
+
+logger = logging.getLogger(__name__)
+
+# Connection settings for the shared Polly clients
+POLLY_REGION = os.getenv("POLLY_REGION")
+POLLY_TIMEOUT_SECONDS = float(os.getenv("POLLY_TIMEOUT_SECONDS", "10"))
+POLLY_MAX_POOL_CONNECTIONS = int(os.getenv("POLLY_MAX_POOL_CONNECTIONS", "50"))
+
+# Streaming: size of each chunk relayed to the client, and the largest clip that is
+# still collected for the audio cache while streaming (bounds memory per request)
+AUDIO_STREAM_CHUNK_BYTES = int(os.getenv("AUDIO_STREAM_CHUNK_BYTES", "8192"))
+AUDIO_STREAM_CACHE_MAX_BYTES = int(os.getenv("AUDIO_STREAM_CACHE_MAX_BYTES", str(1024 * 1024)))
+
+# Polly audio read ahead of a slow client, so a stream's Polly slot is released as soon as
+# Polly is done rather than when the client is
+AUDIO_STREAM_BUFFER_MAX_BYTES = int(os.getenv("AUDIO_STREAM_BUFFER_MAX_BYTES", str(1024 * 1024)))
+
+# Concurrent syntheses per worker (a stream holds its slot while Polly's audio is read). Adapts
+# to throttling like the Lex limit; syntheses that would queue longer are shed.
+POLLY_CONCURRENCY_LIMIT = int(os.getenv("POLLY_CONCURRENCY_LIMIT", "20"))
+POLLY_QUEUE_TIMEOUT_SECONDS = float(os.getenv("POLLY_QUEUE_TIMEOUT_SECONDS", "2"))
+
+polly_limiter = AdaptiveLimiter("polly", POLLY_CONCURRENCY_LIMIT, POLLY_MAX_POOL_CONNECTIONS, POLLY_QUEUE_TIMEOUT_SECONDS)
+# Synthesis is idempotent, so any outage error is retried (within the budget)
+polly_breaker = CircuitBreaker("polly")
+polly_retry_budget = RetryBudget("polly")
+
+# Strong references to the Polly readers of stream_audio
+_stream_readers = set()
+# Queue marker of a finished read
+_END = object()
+
+
+def create_polly_client(region_name=None):
+    """Create a Polly client with a keep-alive connection pool sized for concurrent requests"""
+    config = Config(
+        connect_timeout=POLLY_TIMEOUT_SECONDS,
+        read_timeout=POLLY_TIMEOUT_SECONDS,
+        max_pool_connections=POLLY_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        # Retries go through the Polly retry budget instead (see SpeechService.get_audio)
+        retries={"max_attempts": 1, "mode": "standard"}
+    )
+    return boto3.client('polly', region_name=region_name, config=config)
+
 
 class SpeechService:
-    def __init__(self):
-        self.client = boto3.client('polly')
+    def __init__(self, voice_id='Joanna', output_format='mp3', client=None):
+        self.client = client or boto3.client('polly')
+        self.voice_id = voice_id
+        self.output_format = output_format
+
+    def open_stream(self, text, language_code="en-US", engine="standard"):
+        """Call Polly and return the unread AudioStream"""
+        response = self.client.synthesize_speech(
+            Text=text,
+            OutputFormat=self.output_format,
+            VoiceId=self.voice_id,
+            LanguageCode=language_code,
+            Engine=engine
+        )
+        return response['AudioStream']
+
+    def synthesize(self, text, language_code="en-US", engine="standard"):
+        """Call Polly and return the raw audio bytes"""
+        return self.open_stream(text, language_code, engine).read()
+
+    def cache_key(self, text, language_code="en-US", engine="standard"):
+        return audio_cache_key(text, self.voice_id, engine, language_code, self.output_format)
+
+    async def _call_polly(self, method, *args):
+        async def attempt():
+            async with polly_limiter.slot():
+                # boto3 is blocking, keep it off the event loop
+                return await asyncio.to_thread(method, *args)
+
+        return await call_with_retries(attempt, breaker=polly_breaker, budget=polly_retry_budget,
+                                       is_failure=is_aws_outage, should_retry=is_aws_outage)
+
+    async def get_audio(self, text, language_code="en-US", engine="standard"):
+        """
+        Return the audio for text from the audio cache, calling Polly only on a miss
+        Returns:
+            bytes: The synthesized audio
+        Raises:
+            DependencyOverloaded: If Polly's queue is full or its circuit is open
+        """
+        key = self.cache_key(text, language_code, engine)
+        audio = await audio_cache.get(key)
+        if audio is None:
+            audio = await self._call_polly(self.synthesize, text, language_code, engine)
+            await audio_cache.set(key, audio)
+        return audio
+
+    async def stream_audio(self, text, language_code="en-US", engine="standard", chunk_size=AUDIO_STREAM_CHUNK_BYTES):
+        """
+        Yield the audio for text as Polly produces it, without buffering the whole clip.
+
+        Cached audio is yielded at once. Otherwise a reader task pulls Polly's stream into
+        a buffer of up to AUDIO_STREAM_BUFFER_MAX_BYTES, holding the polly_limiter slot only
+        while it reads, and chunks are relayed from the buffer at the client's pace. The
+        clip is added to the audio cache afterwards, unless it is larger than
+        AUDIO_STREAM_CACHE_MAX_BYTES, even if the client goes away.
+        """
+        key = self.cache_key(text, language_code, engine)
+        audio = await audio_cache.get(key)
+        if audio is not None:
+            yield audio
+            return
+
+        buffer = asyncio.Queue(maxsize=max(1, AUDIO_STREAM_BUFFER_MAX_BYTES // chunk_size))
+        abandoned = asyncio.Event()
+        reader = asyncio.create_task(self._read_stream(key, text, language_code, engine, chunk_size, buffer, abandoned))
+        _stream_readers.add(reader)
+        reader.add_done_callback(_stream_readers.discard)
+        try:
+            while True:
+                chunk = await buffer.get()
+                if chunk is _END:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            # The client is gone (or done): let the reader finish for the cache without blocking on us
+            abandoned.set()
+            while not buffer.empty():
+                buffer.get_nowait()
+
+    async def _read_stream(self, key, text, language_code, engine, chunk_size, buffer, abandoned):
+        collected = []
+        collected_bytes = 0
+        cacheable = True
+        try:
+            async with polly_limiter.slot():
+                stream = await call_with_retries(asyncio.to_thread, self.open_stream, text, language_code, engine,
+                                                 breaker=polly_breaker, budget=polly_retry_budget,
+                                                 is_failure=is_aws_outage, should_retry=is_aws_outage)
+                try:
+                    while True:
+                        chunk = await asyncio.to_thread(stream.read, chunk_size)
+                        if not chunk:
+                            break
+                        if cacheable:
+                            collected_bytes += len(chunk)
+                            if collected_bytes > AUDIO_STREAM_CACHE_MAX_BYTES:
+                                cacheable = False
+                                collected = []
+                            else:
+                                collected.append(chunk)
+                        elif abandoned.is_set():
+                            break
+                        if not abandoned.is_set():
+                            await buffer.put(chunk)
+                finally:
+                    stream.close()
+        except Exception as e:
+            if not abandoned.is_set():
+                await buffer.put(e)
+            return
+        if cacheable:
+            await audio_cache.set(key, b"".join(collected))
+        if not abandoned.is_set():
+            await buffer.put(_END)
 
     def generate_speech(self, text, language_code="en-US", engine="standard"): 
         try:
-            response = self.client.synthesize_speech(
-                Text=text,
-                OutputFormat='mp3',
-                VoiceId='Joanna',
-                LanguageCode=language_code,
-                Engine=engine
-            )
-            audio_stream = response['AudioStream'].read()
+            audio_stream = self.synthesize(text, language_code, engine)
             
             # Encode the audio stream to base64
             audio_base64 = base64.b64encode(audio_stream).decode('utf-8')
@@ -25,4 +187,69 @@ class SpeechService:
         
         except Exception as e:
             print(f"Error generating speech: {e}")
-            return json.dumps({'error': str(e)}) #Return Json with error.
\ No newline at end of file
+            return json.dumps({'error': str(e)}) #Return Json with error.
+
+
+class SpeechServiceRegistry:
+    """
+    Process-wide registry of speech services.
+
+    One Polly client (and connection pool) is kept per region and shared by every
+    voice in that region, so requests reuse resolved credentials, endpoints and
+    open HTTP connections. Managed by app.lifespan.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def get(self, voice_id='Joanna', region_name=None, output_format='mp3'):
+        """
+        Return the shared speech service for a voice/region, creating it on first use
+        Args:
+            voice_id (str): Polly voice
+            region_name (str): AWS region, defaults to POLLY_REGION or the boto3 default
+            output_format (str): Polly output format
+        Returns:
+            SpeechService: A service backed by the pooled client for the region
+        """
+        region_name = region_name or POLLY_REGION
+        key = (voice_id, region_name, output_format)
+        service = self._services.get(key)
+        if service:
+            return service
+
+        with self._lock:
+            service = self._services.get(key)
+            if service:
+                return service
+
+            client = self._clients.get(region_name)
+            if client is None:
+                client = create_polly_client(region_name)
+                self._clients[region_name] = client
+                logger.info(f"Created Polly client for region {client.meta.region_name}")
+
+            service = SpeechService(voice_id=voice_id, output_format=output_format, client=client)
+            self._services[key] = service
+            return service
+
+    def close(self):
+        """Close every pooled client"""
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close Polly client: {str(e)}")
+            self._clients.clear()
+            self._services.clear()
+
+
+speech_services = SpeechServiceRegistry()
+
+
+def get_speech_service(voice_id='Joanna', region_name=None):
+    """Return the shared speech service for a voice"""
+    return speech_services.get(voice_id=voice_id, region_name=region_name)
\ No newline at end of file
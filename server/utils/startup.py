@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default time each dependency gets to initialize, override per dependency with
+# STARTUP_TIMEOUT_<NAME> (e.g. STARTUP_TIMEOUT_POSTGRES=30)
+STARTUP_TIMEOUT_SECONDS = float(os.getenv("STARTUP_TIMEOUT_SECONDS", "15"))
+
+
+class StartupStep:
+    """
+    One dependency initialized during application startup.
+
+    Args:
+        name (str): Dependency name used in the report and timeout override
+        init: Coroutine function (or plain function, run in a worker thread)
+        critical (bool): Whether startup fails when this dependency fails
+    """
+
+    def __init__(self, name, init, critical=True, timeout=None):
+        self.name = name
+        self.init = init
+        self.critical = critical
+        self.timeout = timeout or float(os.getenv(f"STARTUP_TIMEOUT_{name.upper()}", STARTUP_TIMEOUT_SECONDS))
+
+    async def run(self):
+        if asyncio.iscoroutinefunction(self.init):
+            result = await asyncio.wait_for(self.init(), timeout=self.timeout)
+        else:
+            result = await asyncio.wait_for(asyncio.to_thread(self.init), timeout=self.timeout)
+        # Init functions that report failure with False (e.g. init_async_lex_client) count as failed
+        if result is False:
+            raise RuntimeError(f"{self.name} initialization returned False")
+
+
+async def _timed(step):
+    started = time.perf_counter()
+    entry = {"name": step.name, "critical": step.critical, "status": "ok", "error": None}
+    try:
+        await step.run()
+    except asyncio.TimeoutError:
+        entry["status"] = "timeout"
+        entry["error"] = f"Timed out after {step.timeout}s"
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = str(e)
+    entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return entry
+
+
+async def run_startup(*phases):
+    """
+    Initialize dependencies phase by phase. Steps within a phase run concurrently,
+    each bounded by its own timeout; later phases are skipped once a critical
+    dependency has failed.
+
+    Args:
+        *phases (list): Lists of StartupStep instances
+    Returns:
+        dict: Startup report with the total time and one entry per dependency
+    Raises:
+        RuntimeError: If a critical dependency failed or timed out
+    """
+    started = time.perf_counter()
+    entries = []
+    failed = []
+    for index, steps in enumerate(phases):
+        phase_entries = await asyncio.gather(*[_timed(step) for step in steps])
+        for entry in phase_entries:
+            entry["phase"] = index
+        entries.extend(phase_entries)
+        failed = [entry["name"] for entry in phase_entries if entry["critical"] and entry["status"] != "ok"]
+        if failed:
+            # Later phases depend on this one, don't start them against a broken dependency
+            break
+
+    report = {
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "dependencies": entries,
+    }
+
+    if failed:
+        logger.error(f"Startup stopped after {report['total_ms']} ms")
+    else:
+        logger.info(f"Startup finished in {report['total_ms']} ms")
+    for entry in entries:
+        message = f"  {entry['name']:<10} {entry['status']:<8} {entry['duration_ms']:>8} ms"
+        if entry["error"]:
+            message += f"  ({entry['error']})"
+        if entry["status"] == "ok":
+            logger.info(message)
+        else:
+            logger.warning(message)
+
+    if failed:
+        raise RuntimeError(f"Critical dependencies failed to initialize: {', '.join(failed)}")
+    return report